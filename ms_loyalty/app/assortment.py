@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from .cache import TTLCache
+
+if TYPE_CHECKING:
+    from .moysklad import MoySkladClient
+    from .moysklad_async import AsyncMoySkladClient
+
+
+# ids per list request — keeps the URL well under server limits and the
+# page within the 100-row cap that applies when ``expand`` is used
+BATCH_SIZE = 100
+
+# list endpoint per assortment type; everything else goes through /assortment
+_ENDPOINTS = {
+    "product": "/entity/product",
+    "variant": "/entity/variant",
+}
+
+
+def entity_id(href: str) -> str:
+    return href.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+
+def catalog_key(href: str) -> str:
+    return href.split("?", 1)[0].rstrip("/")
+
+
+def _meta_href(entity: dict[str, Any] | None) -> str | None:
+    return ((entity or {}).get("meta") or {}).get("href")
+
+
+# ------------------------------------------------------------------
+# process-wide cache of what promo detection needs per catalog item
+# ------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class AssortmentInfo:
+    path_name: str
+    folder_href: str | None
+    parent_href: str | None = None   # variants: the product they belong to
+
+
+def assortment_info(full: dict[str, Any]) -> AssortmentInfo:
+    parent = full.get("product") or {}
+    folder = full.get("productFolder") or parent.get("productFolder")
+    return AssortmentInfo(
+        path_name=full.get("pathName") or "",
+        folder_href=_meta_href(folder),
+        parent_href=catalog_key(_meta_href(parent)) if _meta_href(parent) else None,
+    )
+
+
+def split_cached(cache: TTLCache[AssortmentInfo], missing: dict[str, dict[str, Any]],
+                 ) -> tuple[dict[str, AssortmentInfo], dict[str, dict[str, Any]]]:
+    """Split *missing* into cache hits and what still has to be fetched."""
+    found: dict[str, AssortmentInfo] = {}
+    to_fetch: dict[str, dict[str, Any]] = {}
+    for href, meta in missing.items():
+        info = cache.get(catalog_key(href))
+        if info is None:
+            to_fetch[href] = meta
+        else:
+            found[href] = info
+    return found, to_fetch
+
+
+def remember(cache: TTLCache[AssortmentInfo],
+             resolved: dict[str, dict[str, Any]]) -> dict[str, AssortmentInfo]:
+    infos = {href: assortment_info(full) for href, full in resolved.items()}
+    for href, info in infos.items():
+        cache.set(catalog_key(href), info)
+    return infos
+
+
+def invalidate(cache: TTLCache[AssortmentInfo], href: str) -> int:
+    """Forget a product or variant — and, for a product, all of its variants."""
+    key = catalog_key(href)
+    return cache.invalidate_where(lambda k, info: k == key or info.parent_href == key)
+
+
+def assortment_batches(missing: dict[str, dict[str, Any]]) -> list[tuple[str, dict[str, Any], dict[str, str]]]:
+    """Plan list requests for *missing* (``href -> meta``).
+
+    Returns ``(path, params, {id: href})`` per request: hrefs grouped by
+    type and chunked into ``id=a;id=b;...`` filters (an OR over one field).
+    Variants are fetched with ``expand=product`` so the parent's
+    ``pathName`` comes back in the same response.
+    """
+    by_endpoint: dict[str, dict[str, str]] = {}
+    for href, meta in missing.items():
+        kind = (meta.get("type") or "").lower()
+        path = _ENDPOINTS.get(kind, "/entity/assortment")
+        by_endpoint.setdefault(path, {})[entity_id(href)] = href
+
+    batches: list[tuple[str, dict[str, Any], dict[str, str]]] = []
+    for path, ids in by_endpoint.items():
+        items = list(ids.items())
+        for start in range(0, len(items), BATCH_SIZE):
+            chunk = dict(items[start:start + BATCH_SIZE])
+            params: dict[str, Any] = {
+                "filter": ";".join(f"id={item_id}" for item_id in chunk),
+                "limit": len(chunk),
+            }
+            if path == "/entity/variant":
+                params["expand"] = "product"
+            batches.append((path, params, chunk))
+    return batches
+
+
+def _merge_rows(rows: list[dict[str, Any]], wanted: dict[str, str],
+                resolved: dict[str, dict[str, Any]]) -> None:
+    for row in rows or []:
+        href = wanted.get(str(row.get("id") or ""))
+        if href is None:
+            continue
+        if row.get("pathName") is None:
+            parent = row.get("product") or {}
+            if parent.get("pathName") is not None:
+                row["pathName"] = parent["pathName"]
+        resolved[href] = row
+
+
+def _parents_to_fetch(resolved: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Variants still without ``pathName`` whose parent was not expanded."""
+    parents: dict[str, dict[str, Any]] = {}
+    for full in resolved.values():
+        if full.get("pathName") is not None:
+            continue
+        product_href = ((full.get("product") or {}).get("meta") or {}).get("href")
+        if product_href:
+            parents[product_href] = {"href": product_href, "type": "product"}
+    return parents
+
+
+def _apply_parents(resolved: dict[str, dict[str, Any]], parents: dict[str, dict[str, Any]]) -> None:
+    for full in resolved.values():
+        if full.get("pathName") is not None:
+            continue
+        product_href = ((full.get("product") or {}).get("meta") or {}).get("href")
+        if product_href in parents:
+            full["pathName"] = parents[product_href].get("pathName", "")
+
+
+def resolve_assortments(client: MoySkladClient,
+                        missing: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Fetch full assortment entities for *missing* in as few calls as possible."""
+    resolved: dict[str, dict[str, Any]] = {}
+    for path, params, wanted in assortment_batches(missing):
+        try:
+            data = client.request("GET", path, params=params)
+        except Exception as exc:
+            logging.warning("Failed to fetch %d assortments from %s: %s", len(wanted), path, exc)
+            continue
+        _merge_rows(data.get("rows"), wanted, resolved)
+
+    parent_refs = _parents_to_fetch(resolved)
+    if parent_refs:
+        _apply_parents(resolved, resolve_assortments(client, parent_refs))
+    return resolved
+
+
+async def resolve_assortments_async(client: AsyncMoySkladClient,
+                                    missing: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Async ``resolve_assortments``: the list requests run concurrently."""
+
+    async def fetch(path: str, params: dict[str, Any], wanted: dict[str, str]) -> tuple[dict[str, str], list]:
+        try:
+            data = await client.request("GET", path, params=params)
+        except Exception as exc:
+            logging.warning("Failed to fetch %d assortments from %s: %s", len(wanted), path, exc)
+            return wanted, []
+        return wanted, data.get("rows") or []
+
+    resolved: dict[str, dict[str, Any]] = {}
+    batches = assortment_batches(missing)
+    for wanted, rows in await asyncio.gather(*(fetch(*batch) for batch in batches)):
+        _merge_rows(rows, wanted, resolved)
+
+    parent_refs = _parents_to_fetch(resolved)
+    if parent_refs:
+        _apply_parents(resolved, await resolve_assortments_async(client, parent_refs))
+    return resolved
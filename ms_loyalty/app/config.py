@@ -23,6 +23,17 @@ def _env_list(key: str, default: list[str]) -> list[str]:
     return [item.strip() for item in value.split(",") if item.strip()]
 
 
+def _env_pairs(key: str) -> tuple[tuple[str, str], ...]:
+    """``"a:1,b:2"`` -> ``(("a", "1"), ("b", "2"))``."""
+    pairs = []
+    for item in _env_list(key, []):
+        name, sep, value = item.partition(":")
+        if not sep or not name.strip() or not value.strip():
+            raise ValueError(f"{key}: expected 'key:value' items, got {item!r}")
+        pairs.append((name.strip(), value.strip()))
+    return tuple(pairs)
+
+
 @dataclass(frozen=True)
 class Settings:
     base_url: str
@@ -46,6 +57,41 @@ class Settings:
     webhook_bearer_token: str
     request_timeout: float
 
+    # --- webhook ingestion ---
+    webhook_mode: str = "inline"    # inline | queue
+    worker_count: int = 4
+    batch_concurrency: int = 4      # documents in flight per batch (inline webhook, scripts)
+    queue_max_size: int = 10000
+    debounce_seconds: float = 1.0   # merge events for one document within this window
+    echo_ttl_seconds: float = 30.0  # drop UPDATE echoes of our own PUTs; 0 disables
+    journal_path: str = ""          # SQLite event journal (queue mode); empty disables
+
+    # --- MoySklad API limits ---
+    rate_limit_per_second: float = 12.0  # token refill rate; 0 disables
+    rate_limit_burst: int = 9            # 9 + 3 s * 12/s stays within 45 req / 3 s
+    max_parallel_requests: int = 5
+    max_retries: int = 5                 # for 429 / 5xx / network errors
+    retry_backoff: float = 0.5           # base seconds for jittered backoff
+    positions_page_size: int = 1000      # API max 1000, capped to 100 with expand
+    positions_concurrency: int = 4       # parallel page fetches per document
+    partial_update_min_positions: int = 100  # send only changed positions from this size; 0 = always PUT
+
+    # --- caches ---
+    assortment_cache_size: int = 5000    # catalog items (pathName / folder)
+    assortment_cache_ttl: float = 600.0  # seconds; 0 disables
+    counterparty_cache_size: int = 2000  # loyalty profiles by counterparty id
+    counterparty_cache_ttl: float = 600.0  # seconds; 0 disables
+    promo_folder_refresh: float = 300.0  # seconds between folder-tree reloads; 0 disables
+
+    # --- discount rules (loyalty members only) ---
+    discount_tiers: tuple[tuple[str, str], ...] = ()    # (order sum, rub; percent), e.g. 100000:12
+    folder_discounts: tuple[tuple[str, str], ...] = ()  # (product-folder id; percent), subfolders inherit
+    excluded_folders: tuple[str, ...] = ()              # product-folder ids without loyalty discount
+
+    # --- async client ---
+    http2: bool = False                  # needs the 'h2' package
+    max_connections: int = 10            # keep-alive pool size
+
     @classmethod
     def from_env(cls) -> "Settings":
         return cls(
@@ -63,4 +109,29 @@ class Settings:
             log_level=_env("LOG_LEVEL", "INFO"),
             webhook_bearer_token=_env("WEBHOOK_BEARER_TOKEN", ""),
             request_timeout=float(_env("REQUEST_TIMEOUT", "20")),
+            webhook_mode=_env("WEBHOOK_MODE", "inline").strip().lower(),
+            worker_count=int(_env("WORKER_COUNT", "4")),
+            batch_concurrency=int(_env("BATCH_CONCURRENCY", "4")),
+            queue_max_size=int(_env("QUEUE_MAX_SIZE", "10000")),
+            debounce_seconds=float(_env("DEBOUNCE_SECONDS", "1.0")),
+            echo_ttl_seconds=float(_env("ECHO_TTL_SECONDS", "30")),
+            journal_path=_env("JOURNAL_PATH", ""),
+            rate_limit_per_second=float(_env("RATE_LIMIT_PER_SECOND", "12")),
+            rate_limit_burst=int(_env("RATE_LIMIT_BURST", "9")),
+            max_parallel_requests=int(_env("MAX_PARALLEL_REQUESTS", "5")),
+            max_retries=int(_env("MAX_RETRIES", "5")),
+            retry_backoff=float(_env("RETRY_BACKOFF", "0.5")),
+            positions_page_size=int(_env("POSITIONS_PAGE_SIZE", "1000")),
+            positions_concurrency=int(_env("POSITIONS_CONCURRENCY", "4")),
+            partial_update_min_positions=int(_env("PARTIAL_UPDATE_MIN_POSITIONS", "100")),
+            assortment_cache_size=int(_env("ASSORTMENT_CACHE_SIZE", "5000")),
+            assortment_cache_ttl=float(_env("ASSORTMENT_CACHE_TTL", "600")),
+            counterparty_cache_size=int(_env("COUNTERPARTY_CACHE_SIZE", "2000")),
+            counterparty_cache_ttl=float(_env("COUNTERPARTY_CACHE_TTL", "600")),
+            promo_folder_refresh=float(_env("PROMO_FOLDER_REFRESH", "300")),
+            discount_tiers=_env_pairs("DISCOUNT_TIERS"),
+            folder_discounts=_env_pairs("FOLDER_DISCOUNTS"),
+            excluded_folders=tuple(_env_list("EXCLUDED_FOLDERS", [])),
+            http2=_env_bool("HTTP2", False),
+            max_connections=int(_env("MAX_CONNECTIONS", "10")),
         )
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any
+
+from .assortment import entity_id
+from .cache import TTLCache
+from .config import Settings
+from .logic import get_loyalty_discount_percent, is_loyalty_enabled, is_wholesaler
+
+if TYPE_CHECKING:
+    from .moysklad import MoySkladClient
+    from .moysklad_async import AsyncMoySkladClient
+
+
+@dataclass(frozen=True)
+class LoyaltyProfile:
+    """What the discount calculation needs to know about a counterparty."""
+    enabled: bool              # «Программа лояльности» checkbox
+    wholesaler: bool           # has the «Оптовик» tag
+    discount_percent: Decimal  # 0 unless the counterparty is eligible
+
+
+NO_LOYALTY = LoyaltyProfile(enabled=False, wholesaler=False, discount_percent=Decimal("0"))
+
+
+def loyalty_profile_of(counterparty: dict[str, Any], settings: Settings) -> LoyaltyProfile:
+    return LoyaltyProfile(
+        enabled=is_loyalty_enabled(counterparty, settings),
+        wholesaler=is_wholesaler(counterparty, settings),
+        discount_percent=get_loyalty_discount_percent(counterparty, settings),
+    )
+
+
+def _agent(document: dict[str, Any]) -> tuple[dict[str, Any], str | None]:
+    agent = document.get("agent") or {}
+    href = (agent.get("meta") or {}).get("href")
+    return agent, entity_id(href) if href else None
+
+
+def cached_profile(cache: TTLCache[LoyaltyProfile], settings: Settings,
+                   document: dict[str, Any]) -> tuple[LoyaltyProfile | None, str | None]:
+    """Profile of the document's agent without any request, if we can tell.
+
+    Returns ``(profile, None)`` on a hit — the agent came expanded or is
+    cached — and ``(None, href)`` when the counterparty must be fetched.
+    """
+    agent, agent_id = _agent(document)
+    if agent_id is None:
+        return NO_LOYALTY, None
+    if agent.keys() - {"meta"}:
+        # expanded (a bare reference carries only ``meta``): refresh the cache for free
+        profile = loyalty_profile_of(agent, settings)
+        cache.set(agent_id, profile)
+        return profile, None
+    profile = cache.get(agent_id)
+    if profile is not None:
+        return profile, None
+    return None, agent["meta"]["href"]
+
+
+def loyalty_profile(client: MoySkladClient, settings: Settings,
+                    document: dict[str, Any]) -> LoyaltyProfile:
+    profile, href = cached_profile(client.counterparty_cache, settings, document)
+    if profile is None:
+        profile = loyalty_profile_of(client.get_by_href(href), settings)
+        client.counterparty_cache.set(entity_id(href), profile)
+    return profile
+
+
+async def loyalty_profile_async(client: AsyncMoySkladClient, settings: Settings,
+                                document: dict[str, Any]) -> LoyaltyProfile:
+    profile, href = cached_profile(client.counterparty_cache, settings, document)
+    if profile is None:
+        profile = loyalty_profile_of(await client.get_by_href(href), settings)
+        client.counterparty_cache.set(entity_id(href), profile)
+    return profile
+
+
+def invalidate(cache: TTLCache[LoyaltyProfile], counterparty_id: str) -> bool:
+    return cache.invalidate(counterparty_id)
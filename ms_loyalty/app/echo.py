@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def positions_fingerprint(positions: list[dict[str, Any]]) -> str:
+    """Order-independent hash of (id, quantity, price, discount) per position.
+
+    Numbers go through ``float`` so the payload we PUT (``discount`` is a
+    float, the rest is echoed from the API) and the rows MoySklad returns
+    afterwards hash the same way.
+    """
+    items = sorted(
+        (str(p.get("id") or ""), _num(p.get("quantity")), _num(p.get("price")), _num(p.get("discount")))
+        for p in positions
+    )
+    return hashlib.sha1(repr(items).encode("utf-8")).hexdigest()
+
+
+def agent_href(document: dict[str, Any]) -> str:
+    return ((document.get("agent") or {}).get("meta") or {}).get("href") or ""
+
+
+@dataclass
+class _Write:
+    updated: str
+    agent: str
+    fingerprint: str
+    loyalty_discount_sum: int
+    expires_at: float
+
+
+class EchoGuard:
+    """Remembers what we just PUT so the UPDATE webhook it causes can be dropped.
+
+    Every write we make makes MoySklad send an UPDATE event for the same
+    document.  If the document still carries the ``updated`` timestamp from
+    our PUT response — or, failing that, the same agent and exactly the
+    positions we wrote — nothing has changed since and the event is an echo.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes: dict[tuple[str, str], _Write] = {}
+        self.suppressed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def remember(self, doc_type: str, doc_id: str, response: dict[str, Any],
+                 written_positions: list[dict[str, Any]], loyalty_discount_sum: int) -> None:
+        """Record a successful write; *response* is the PUT response body."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._writes[(doc_type, doc_id)] = _Write(
+                updated=response.get("updated") or "",
+                agent=agent_href(response),
+                fingerprint=positions_fingerprint(written_positions),
+                loyalty_discount_sum=loyalty_discount_sum,
+                expires_at=now + self.ttl,
+            )
+
+    def _lookup(self, doc_type: str, doc_id: str) -> _Write | None:
+        now = time.monotonic()
+        with self._lock:
+            write = self._writes.get((doc_type, doc_id))
+            if write is not None and write.expires_at <= now:
+                del self._writes[(doc_type, doc_id)]
+                return None
+            return write
+
+    def _hit(self, doc_type: str, doc_id: str) -> _Write:
+        with self._lock:
+            self.suppressed += 1
+            return self._writes.pop((doc_type, doc_id))
+
+    def check_document(self, doc_type: str, doc_id: str,
+                       document: dict[str, Any]) -> _Write | None:
+        """Cheap check on the bare document, before any position fetch."""
+        write = self._lookup(doc_type, doc_id)
+        if write is None or not write.updated:
+            return None
+        if document.get("updated") != write.updated:
+            return None
+        return self._hit(doc_type, doc_id)
+
+    def check_positions(self, doc_type: str, doc_id: str, document: dict[str, Any],
+                        positions: list[dict[str, Any]]) -> _Write | None:
+        """Fallback when ``updated`` moved: same agent and same positions as written."""
+        write = self._lookup(doc_type, doc_id)
+        if write is None:
+            return None
+        if write.agent and agent_href(document) != write.agent:
+            return None
+        if positions_fingerprint(positions) != write.fingerprint:
+            return None
+        return self._hit(doc_type, doc_id)
+
+    def _purge(self, now: float) -> None:
+        # caller holds self._lock
+        expired = [key for key, write in self._writes.items() if write.expires_at <= now]
+        for key in expired:
+            del self._writes[key]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl,
+                "tracked": len(self._writes),
+                "suppressed": self.suppressed,
+            }
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any
+
+from .assortment import catalog_key, entity_id
+
+if TYPE_CHECKING:
+    from .moysklad import MoySkladClient
+    from .moysklad_async import AsyncMoySkladClient
+
+# rows per /entity/productfolder page (API maximum without expand)
+FOLDER_PAGE_SIZE = 1000
+
+
+def _meta_href(entity: dict[str, Any] | None) -> str | None:
+    return ((entity or {}).get("meta") or {}).get("href")
+
+
+def _tree(folders: list[dict[str, Any]]) -> tuple[dict[str, str | None], dict[str, str], dict[str, str]]:
+    """``parent``, ``name`` and ``pathName`` per folder key."""
+    parents: dict[str, str | None] = {}
+    names: dict[str, str] = {}
+    paths: dict[str, str] = {}
+    for folder in folders:
+        href = _meta_href(folder)
+        if not href:
+            continue
+        key = catalog_key(href)
+        parent = _meta_href(folder.get("productFolder"))
+        parents[key] = catalog_key(parent) if parent else None
+        names[key] = folder.get("name") or ""
+        paths[key] = folder.get("pathName") or ""
+    return parents, names, paths
+
+
+def inherited_rates(folders: list[dict[str, Any]],
+                    rates: dict[str, Decimal]) -> dict[str, Decimal]:
+    """Per-folder discount rates (keyed by folder id) pushed down to subfolders.
+
+    Every folder gets the rate of its nearest configured ancestor, itself
+    included; the result is keyed by folder href for O(1) lookups.
+    """
+    if not rates:
+        return {}
+    parents, _, _ = _tree(folders)
+    resolved: dict[str, Decimal | None] = {}
+
+    def rate_of(key: str) -> Decimal | None:
+        chain: list[str] = []
+        rate: Decimal | None = None
+        while key is not None and key not in resolved and key not in chain:
+            chain.append(key)
+            rate = rates.get(entity_id(key))
+            if rate is not None:
+                break
+            key = parents.get(key)
+        else:
+            if key is not None and key in resolved:
+                rate = resolved[key]
+        for seen in chain:
+            resolved[seen] = rate
+        return rate
+
+    flat = {key: rate_of(key) for key in parents}
+    return {key: rate for key, rate in flat.items() if rate is not None}
+
+
+def promo_folder_keys(folders: list[dict[str, Any]], promo_group_name: str) -> frozenset[str]:
+    """Hrefs of every folder named *promo_group_name* and of all folders under it.
+
+    Walks the tree through each folder's ``productFolder`` (its parent);
+    a folder whose parent is missing from *folders* falls back to its
+    ``pathName`` — the ``/``-separated names of its ancestors.
+    """
+    parents, names, paths = _tree(folders)
+
+    verdicts: dict[str, bool] = {}
+
+    def is_promo(key: str) -> bool:
+        chain: list[str] = []
+        while True:
+            if key in verdicts:
+                verdict = verdicts[key]
+                break
+            chain.append(key)
+            if names[key] == promo_group_name:
+                verdict = True
+                break
+            parent = parents[key]
+            if parent is None:
+                verdict = False
+                break
+            if parent not in names or parent in chain:
+                segments = [s.strip() for s in paths[key].split("/")]
+                verdict = promo_group_name in segments
+                break
+            key = parent
+        for seen in chain:
+            verdicts[seen] = verdict
+        return verdict
+
+    if not promo_group_name:
+        return frozenset()
+    return frozenset(key for key in names if is_promo(key))
+
+
+class PromoFolderIndex:
+    """Set of product-folder hrefs at or under the promo folder («Акция»),
+    plus the per-folder discount rates resolved for every subfolder.
+
+    Loaded from ``/entity/productfolder`` and swapped in whole on refresh,
+    so lookups never take a lock.  The index goes stale after
+    ``refresh_seconds`` or when a productfolder webhook calls
+    :meth:`invalidate`; the processor then reloads it before the next
+    document.  ``refresh_seconds <= 0`` turns the index off and promo
+    detection falls back to ``pathName``.
+    """
+
+    def __init__(self, promo_group_name: str, refresh_seconds: float,
+                 folder_rates: dict[str, Decimal] | None = None) -> None:
+        self.promo_group_name = promo_group_name
+        self.refresh_seconds = refresh_seconds
+        self.folder_rates = folder_rates or {}
+        self._rates: dict[str, Decimal] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresh_lock_async = asyncio.Lock()
+        self._promo: frozenset[str] = frozenset()
+        self._folders = 0
+        self._loaded_at: float | None = None
+        self._stale = True
+        self.refreshes = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.refresh_seconds > 0 and bool(self.promo_group_name or self.folder_rates)
+
+    @property
+    def ready(self) -> bool:
+        """At least one load succeeded — a stale index still beats ``pathName``."""
+        return self.enabled and self._loaded_at is not None
+
+    @property
+    def stale(self) -> bool:
+        if not self.enabled:
+            return False
+        if self._stale or self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def is_promo(self, folder_href: str) -> bool:
+        return catalog_key(folder_href) in self._promo
+
+    def folder_rate(self, folder_href: str) -> Decimal | None:
+        return self._rates.get(catalog_key(folder_href))
+
+    def load(self, folders: list[dict[str, Any]]) -> None:
+        promo = promo_folder_keys(folders, self.promo_group_name)
+        rates = inherited_rates(folders, self.folder_rates)
+        with self._lock:
+            self._promo = promo
+            self._rates = rates
+            self._folders = len(folders)
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self.refreshes += 1
+        logging.info("Loaded %d product folders, %d promo", len(folders), len(promo))
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def refresh(self, client: MoySkladClient) -> None:
+        """Reload if stale; one thread refreshes while the others keep reading."""
+        if not self.stale:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            if self.ready:
+                return
+            # nothing loaded yet — wait for the thread that is loading
+            self._refresh_lock.acquire()
+        try:
+            if self.stale:
+                self.load(fetch_folders(client))
+        except Exception as exc:
+            self.failures += 1
+            logging.warning("Failed to load product folders: %s", exc)
+        finally:
+            self._refresh_lock.release()
+
+    async def refresh_async(self, client: AsyncMoySkladClient) -> None:
+        """Reload if stale; one task refreshes while the others keep reading."""
+        if not self.stale:
+            return
+        if self._refresh_lock_async.locked() and self.ready:
+            return
+        # nothing loaded yet, the tasks wait for the one that is loading
+        async with self._refresh_lock_async:
+            if not self.stale:
+                return
+            try:
+                self.load(await fetch_folders_async(client))
+            except Exception as exc:
+                self.failures += 1
+                logging.warning("Failed to load product folders: %s", exc)
+
+    def stats(self) -> dict[str, Any]:
+        age = None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)
+        return {
+            "enabled": self.enabled,
+            "folders": self._folders,
+            "promo_folders": len(self._promo),
+            "rated_folders": len(self._rates),
+            "age_seconds": age,
+            "stale": self.stale,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+
+def fetch_folders(client: MoySkladClient) -> list[dict[str, Any]]:
+    rows: list[dict[str, Any]] = []
+    offset = 0
+    while True:
+        data = client.request("GET", "/entity/productfolder",
+                              params={"limit": FOLDER_PAGE_SIZE, "offset": offset})
+        page = data.get("rows") or []
+        rows.extend(page)
+        offset += len(page)
+        if not page or offset >= (data.get("meta") or {}).get("size", 0):
+            return rows
+
+
+async def fetch_folders_async(client: AsyncMoySkladClient) -> list[dict[str, Any]]:
+    rows: list[dict[str, Any]] = []
+    offset = 0
+    while True:
+        data = await client.request("GET", "/entity/productfolder",
+                                    params={"limit": FOLDER_PAGE_SIZE, "offset": offset})
+        page = data.get("rows") or []
+        rows.extend(page)
+        offset += len(page)
+        if not page or offset >= (data.get("meta") or {}).get("size", 0):
+            return rows
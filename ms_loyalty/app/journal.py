@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    idem_key    TEXT    NOT NULL UNIQUE,
+    doc_type    TEXT    NOT NULL,
+    doc_id      TEXT    NOT NULL,
+    action      TEXT    NOT NULL,
+    status      TEXT    NOT NULL DEFAULT 'pending',   -- pending | done | failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    received_at REAL    NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS events_status ON events (status);
+"""
+
+MAX_BATCH = 1000
+
+
+def idempotency_key(audit_context: Any, doc_type: str, doc_id: str, action: str) -> str:
+    """Key that is stable across redeliveries of the same webhook event.
+
+    MoySklad stamps every payload with an ``auditContext`` (audit event
+    href, user, moment) that is repeated verbatim when it redelivers, so
+    it identifies the delivery together with the document ref.  Without
+    one we cannot tell a redelivery from a new event and never dedupe.
+    """
+    if not audit_context:
+        return uuid.uuid4().hex
+    raw = json.dumps([audit_context, doc_type, doc_id, action], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class JournalEvent:
+    id: int
+    doc_type: str
+    doc_id: str
+    action: str
+    status: str
+    attempts: int
+    error: str | None
+    received_at: float
+
+
+@dataclass
+class _Op:
+    kind: str
+    args: Any
+    done: threading.Event | None = None
+    result: Any = None
+    error: BaseException | None = None
+
+
+class EventJournal:
+    """Append-only SQLite (WAL) journal of webhook events.
+
+    All writes go through one writer thread.  It takes whatever has queued
+    up while the previous transaction was committing and writes it in a
+    single transaction, so a burst of events costs one fsync per batch
+    rather than one per event.  ``append`` blocks until its batch is on
+    disk; ``mark_done`` / ``mark_failed`` are fire-and-forget — losing one
+    in a crash only means the event is replayed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._ops: queue.Queue[_Op | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.commits = 0
+        self.appended = 0
+        self.duplicates = 0
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ------------------------------------------------------------------
+    # writer thread
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._ops.put(None)
+            thread.join()
+
+    def _writer(self) -> None:
+        conn = self._connect()
+        try:
+            stop = False
+            while not stop:
+                op = self._ops.get()
+                if op is None:
+                    break
+                batch = [op]
+                # group commit: everything queued meanwhile goes into this transaction
+                while len(batch) < MAX_BATCH:
+                    try:
+                        nxt = self._ops.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        stop = True
+                        break
+                    batch.append(nxt)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list[_Op]) -> None:
+        """Write *batch* in one transaction; never raises, always wakes the waiters."""
+        now = time.time()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op in batch:
+                op.result = self._apply(conn, op, now)
+            conn.execute("COMMIT")
+            self.commits += 1
+        except Exception as exc:
+            logging.exception("Journal commit of %d ops failed", len(batch))
+            # BEGIN itself may have failed (e.g. "database is locked"): nothing to undo
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except Exception:
+                    logging.exception("Journal rollback failed")
+            for op in batch:
+                op.error = exc
+        finally:
+            for op in batch:
+                if op.done is not None:
+                    op.done.set()
+
+    def _apply(self, conn: sqlite3.Connection, op: _Op, now: float) -> Any:
+        if op.kind == "append":
+            ids: list[int | None] = []
+            for key, doc_type, doc_id, action in op.args:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO events (idem_key, doc_type, doc_id, action, received_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, doc_type, doc_id, action, now),
+                )
+                if cur.rowcount:
+                    ids.append(cur.lastrowid)
+                    self.appended += 1
+                    continue
+                self.duplicates += 1
+                # a redelivery of something we never finished (e.g. after a 503) still runs
+                row = conn.execute(
+                    "SELECT id, status FROM events WHERE idem_key = ?", (key,),
+                ).fetchone()
+                ids.append(row["id"] if row is not None and row["status"] == "pending" else None)
+            return ids
+        if op.kind == "finish":
+            status, event_ids, error = op.args
+            conn.executemany(
+                "UPDATE events SET status = ?, attempts = attempts + 1, error = ?, finished_at = ?"
+                " WHERE id = ?",
+                [(status, error, now, event_id) for event_id in event_ids],
+            )
+            return None
+        raise ValueError(f"Unknown journal op: {op.kind}")
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+
+    def append(self, events: list[tuple[str, str, str, str]]) -> list[int | None]:
+        """Durably record ``(idem_key, doc_type, doc_id, action)`` tuples.
+
+        Returns the journal id of each event, or ``None`` for a duplicate
+        delivery of an event that has already been handled.
+        """
+        if not events:
+            return []
+        if self._thread is None:
+            raise RuntimeError("EventJournal.start() has not been called")
+        op = _Op("append", list(events), done=threading.Event())
+        self._ops.put(op)
+        op.done.wait()
+        if op.error is not None:
+            raise op.error
+        return op.result
+
+    def mark_done(self, event_ids: list[int]) -> None:
+        if event_ids:
+            self._ops.put(_Op("finish", ("done", list(event_ids), None)))
+
+    def mark_failed(self, event_ids: list[int], error: str) -> None:
+        if event_ids:
+            self._ops.put(_Op("finish", ("failed", list(event_ids), error[:2000])))
+
+    def flush(self) -> None:
+        """Wait until every queued write has been committed."""
+        op = _Op("append", [], done=threading.Event())
+        self._ops.put(op)
+        op.done.wait()
+
+    # ------------------------------------------------------------------
+    # reads / maintenance (own connection, safe from any process)
+    # ------------------------------------------------------------------
+
+    def _select(self, where: str, params: tuple[Any, ...] = (), limit: int | None = None) -> list[JournalEvent]:
+        sql = ("SELECT id, doc_type, doc_id, action, status, attempts, error, received_at"
+               f" FROM events WHERE {where} ORDER BY id")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = self._connect()
+        try:
+            return [JournalEvent(**dict(row)) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def unfinished(self) -> list[JournalEvent]:
+        return self._select("status = 'pending'")
+
+    def failed(self, limit: int | None = None) -> list[JournalEvent]:
+        return self._select("status = 'failed'", limit=limit)
+
+    def requeue(self, event_ids: list[int] | None = None) -> int:
+        """Put failed events back to ``pending``; all of them if *event_ids* is None."""
+        conn = self._connect()
+        try:
+            if event_ids is None:
+                cur = conn.execute("UPDATE events SET status = 'pending' WHERE status = 'failed'")
+            else:
+                cur = conn.executemany(
+                    "UPDATE events SET status = 'pending' WHERE status = 'failed' AND id = ?",
+                    [(event_id,) for event_id in event_ids],
+                )
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def prune(self, older_than: float) -> int:
+        """Delete ``done`` events finished before the *older_than* timestamp."""
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "DELETE FROM events WHERE status = 'done' AND finished_at < ?", (older_than,),
+            )
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def counts(self) -> dict[str, int]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM events GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {status: count for status, count in rows}
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "appended": self.appended,
+            "duplicates": self.duplicates,
+            "commits": self.commits,
+            "write_queue": self._ops.qsize(),
+            "events": self.counts(),
+        }
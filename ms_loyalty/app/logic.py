@@ -1,10 +1,17 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from decimal import Decimal, ROUND_HALF_UP
-from typing import Any
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, NamedTuple
 
+from .assortment import entity_id
 from .config import Settings
+from .money import discount_amount, line_total, percent_rate
+
+if TYPE_CHECKING:
+    from .folders import PromoFolderIndex
 
 
 # ---------------------------------------------------------------------------
@@ -45,6 +52,175 @@ def _to_decimal(value: Any) -> Decimal | None:
     return None
 
 
+ZERO = Decimal("0")
+HUNDRED = Decimal("100")
+
+# position fields echoed back unchanged in the PUT payload
+_PASSTHROUGH_FIELDS = ("vat", "vatEnabled", "pack", "reserve")
+
+
+def _meta_href(entity: Any) -> str | None:
+    if not isinstance(entity, dict):
+        return None
+    meta = entity.get("meta")
+    return meta.get("href") if isinstance(meta, dict) else None
+
+
+# ---------------------------------------------------------------------------
+# compiled rules — Settings reduced once to what the calculation reads
+# ---------------------------------------------------------------------------
+
+def _percent_setting(name: str, value: str) -> Decimal:
+    percent = _to_decimal(value)
+    if percent is None or not 0 <= percent <= 100:
+        raise ValueError(f"{name}: {value!r} is not a percent between 0 and 100")
+    return percent
+
+
+def _amount_setting(name: str, value: str) -> int:
+    """A non-negative sum in rubles, as kopecks."""
+    amount = _to_decimal(value)
+    if amount is None or not amount.is_finite() or amount < 0:
+        raise ValueError(f"{name}: {value!r} is not a sum of 0 or more")
+    return int(amount * 100)
+
+
+class RuleSettings(NamedTuple):
+    """The ``Settings`` fields the discount rules are built from — hashable."""
+
+    loyalty_enabled_attr: str
+    loyalty_discount_attr: str
+    wholesaler_tag: str
+    promo_group_name: str
+    discount_tiers: tuple[tuple[str, str], ...]
+    folder_discounts: tuple[tuple[str, str], ...]
+    excluded_folders: tuple[str, ...]
+    promo_folder_refresh: float
+
+    @classmethod
+    def of(cls, settings: Settings) -> RuleSettings:
+        return cls(
+            settings.loyalty_enabled_attr,
+            settings.loyalty_discount_attr,
+            settings.wholesaler_tag,
+            settings.promo_group_name,
+            tuple(tuple(pair) for pair in settings.discount_tiers),
+            tuple(tuple(pair) for pair in settings.folder_discounts),
+            tuple(settings.excluded_folders),
+            settings.promo_folder_refresh,
+        )
+
+
+class CompiledRules:
+    """Lowered tag, attribute names, promo folder name and the discount
+    rule table (tiers, per-folder rates), prepared once.
+
+    Use :func:`compile_rules` — it reuses the instance for equal rule settings.
+    """
+
+    __slots__ = ("enabled_attr", "discount_attr", "wholesaler_tag", "promo_group_name",
+                 "tier_thresholds", "tier_rates", "folder_rates")
+
+    def __init__(self, settings: Settings | RuleSettings) -> None:
+        self.enabled_attr = settings.loyalty_enabled_attr
+        self.discount_attr = settings.loyalty_discount_attr
+        self.wholesaler_tag = settings.wholesaler_tag.lower()
+        self.promo_group_name = settings.promo_group_name
+
+        # order-sum tiers: thresholds in kopecks, ascending, for bisection
+        tiers = sorted(
+            (_amount_setting("DISCOUNT_TIERS", threshold), _percent_setting("DISCOUNT_TIERS", rate))
+            for threshold, rate in settings.discount_tiers
+        )
+        self.tier_thresholds = [threshold for threshold, _ in tiers]
+        self.tier_rates = [rate for _, rate in tiers]
+
+        # product-folder id -> rate; an exclusion is a rate of 0
+        self.folder_rates: dict[str, Decimal] = {
+            folder_id: _percent_setting("FOLDER_DISCOUNTS", rate)
+            for folder_id, rate in settings.folder_discounts
+        }
+        for folder_id in settings.excluded_folders:
+            self.folder_rates[folder_id] = ZERO
+        # subfolders inherit a rate only through the folder index
+        if self.folder_rates and settings.promo_folder_refresh <= 0:
+            raise ValueError("FOLDER_DISCOUNTS / EXCLUDED_FOLDERS need the product-folder index: "
+                             "set PROMO_FOLDER_REFRESH above 0")
+
+    # -- counterparty -------------------------------------------------------
+
+    def is_wholesaler(self, counterparty: dict[str, Any]) -> bool:
+        target = self.wholesaler_tag
+        return any(t.lower() == target for t in counterparty.get("tags", []) or [])
+
+    def discount_percent(self, counterparty: dict[str, Any]) -> Decimal:
+        # one pass over the attributes; the first attribute of a name wins
+        values: dict[str, Any] = {}
+        for attr in counterparty.get("attributes", []) or []:
+            values.setdefault(attr.get("name"), attr.get("value"))
+
+        if _to_bool(values.get(self.enabled_attr)) is not True:
+            return ZERO
+        if not self.is_wholesaler(counterparty):
+            return ZERO
+
+        discount = _to_decimal(values.get(self.discount_attr)) or ZERO
+        if discount <= 0:
+            return ZERO
+        if discount > 100:
+            return HUNDRED
+        return discount
+
+    # -- rule table -------------------------------------------------------------
+
+    def document_percent(self, percent: Decimal, order_sum: int) -> Decimal:
+        """The agent's percent raised to the tier reached by *order_sum* (kopecks)."""
+        tier = bisect_right(self.tier_thresholds, order_sum)
+        if tier and self.tier_rates[tier - 1] > percent:
+            return self.tier_rates[tier - 1]
+        return percent
+
+    def folder_rate(self, folder_href: str | None,
+                    promo_folders: PromoFolderIndex | None = None) -> Decimal | None:
+        """Per-folder rate for a product folder (inherited via the index), else None.
+
+        Without an index only the folder itself is looked up.  With one that
+        failed to load this raises: unlike promo detection there is no
+        ``pathName`` to fall back on — the rules name folders by id — and a
+        subfolder silently left at the agent's percent is a wrong discount.
+        """
+        if not folder_href or not self.folder_rates:
+            return None
+        if promo_folders is None:
+            return self.folder_rates.get(entity_id(folder_href))
+        if not promo_folders.ready:
+            raise RuntimeError("Product folders are not loaded, per-folder discounts cannot be applied")
+        return promo_folders.folder_rate(folder_href)
+
+    # -- promo ----------------------------------------------------------------
+
+    def is_promo(self, folder_href: str | None, path_name: str,
+                 promo_folders: PromoFolderIndex | None = None) -> bool:
+        name = self.promo_group_name
+        if not name:
+            return False
+        if folder_href and promo_folders is not None and promo_folders.ready:
+            return promo_folders.is_promo(folder_href)
+        # cheap substring test first; split only paths that may match
+        if not path_name or name not in path_name:
+            return False
+        return any(segment.strip() == name for segment in path_name.split("/"))
+
+
+def compile_rules(settings: Settings) -> CompiledRules:
+    return _compile_rules(RuleSettings.of(settings))
+
+
+@lru_cache(maxsize=64)
+def _compile_rules(rule_settings: RuleSettings) -> CompiledRules:
+    return CompiledRules(rule_settings)
+
+
 # ---------------------------------------------------------------------------
 # counterparty checks
 # ---------------------------------------------------------------------------
@@ -54,9 +230,12 @@ def is_wholesaler(counterparty: dict[str, Any], settings: Settings) -> bool:
 
     MoySklad lowercases tags, so the comparison is case-insensitive.
     """
-    tags = counterparty.get("tags", []) or []
-    target = settings.wholesaler_tag.lower()
-    return any(t.lower() == target for t in tags)
+    return compile_rules(settings).is_wholesaler(counterparty)
+
+
+def is_loyalty_enabled(counterparty: dict[str, Any], settings: Settings) -> bool:
+    """Custom-field checkbox «Программа лояльности» is ticked."""
+    return _to_bool(_attr_value(counterparty, settings.loyalty_enabled_attr)) is True
 
 
 def get_loyalty_discount_percent(counterparty: dict[str, Any], settings: Settings) -> Decimal:
@@ -67,98 +246,133 @@ def get_loyalty_discount_percent(counterparty: dict[str, Any], settings: Setting
       2. Counterparty tag «Оптовик» present
       3. Custom-field «Скидка по ПЛ (%)» > 0
     """
-    enabled = _to_bool(_attr_value(counterparty, settings.loyalty_enabled_attr))
-    if enabled is not True:
-        return Decimal("0")
-
-    if not is_wholesaler(counterparty, settings):
-        return Decimal("0")
-
-    discount = _to_decimal(_attr_value(counterparty, settings.loyalty_discount_attr)) or Decimal("0")
-    if discount <= 0:
-        return Decimal("0")
-    if discount > 100:
-        return Decimal("100")
-    return discount
+    return compile_rules(settings).discount_percent(counterparty)
 
 
 # ---------------------------------------------------------------------------
 # promo detection — by product folder (группа товаров «Акция»)
 # ---------------------------------------------------------------------------
 
-def is_promo_product(assortment: dict[str, Any], settings: Settings) -> bool:
+def is_promo_product(assortment: dict[str, Any], settings: Settings,
+                     promo_folders: PromoFolderIndex | None = None) -> bool:
     """Product is promotional if it sits in the «Акция» product-folder.
 
-    We use the ``pathName`` field that MoySklad returns on every product /
-    variant.  ``pathName`` looks like ``"Основная/Акция"`` — a ``/``-separated
-    list of folder names from root to the product's direct parent folder.
+    With a loaded *promo_folders* index this is a set lookup on the
+    assortment's ``productFolder`` href.  Otherwise we use the ``pathName``
+    field that MoySklad returns on every product / variant.  ``pathName``
+    looks like ``"Основная/Акция"`` — a ``/``-separated list of folder names
+    from root to the product's direct parent folder.
     """
-    if not assortment or not settings.promo_group_name:
+    if not assortment:
         return False
+    return compile_rules(settings).is_promo(
+        _meta_href(assortment.get("productFolder")),
+        assortment.get("pathName") or "",
+        promo_folders,
+    )
 
-    path_name = assortment.get("pathName", "")
-    if not path_name:
-        return False
 
-    segments = [s.strip() for s in path_name.split("/") if s.strip()]
-    return settings.promo_group_name in segments
+# ---------------------------------------------------------------------------
+# position records — what the calculation needs, extracted once per row
+# ---------------------------------------------------------------------------
+
+class PositionRecord:
+    __slots__ = ("id", "meta", "quantity", "price", "discount",
+                 "assortment_meta", "folder_href", "path_name", "extra")
+
+    def __init__(self, row: dict[str, Any]) -> None:
+        get = row.get
+        assortment = get("assortment")
+        if isinstance(assortment, dict):
+            self.assortment_meta = assortment.get("meta")
+            folder = assortment.get("productFolder")
+            self.folder_href = _meta_href(folder) if folder else None
+            self.path_name = assortment.get("pathName") or ""
+        else:
+            self.assortment_meta = self.folder_href = None
+            self.path_name = ""
+        self.id = get("id")
+        self.meta = get("meta")
+        self.quantity = get("quantity")
+        self.price = get("price")
+        self.discount = get("discount")
+        extra = []
+        for name in _PASSTHROUGH_FIELDS:
+            value = get(name)
+            if value is not None:
+                extra.append((name, value))
+        self.extra = extra
+
+    def update_payload(self, discount: float) -> dict[str, Any]:
+        payload: dict[str, Any] = {
+            "id": self.id,
+            "quantity": self.quantity,
+            "price": self.price,
+            "discount": discount,
+        }
+        if self.assortment_meta:
+            payload["assortment"] = {"meta": self.assortment_meta}
+        for name, value in self.extra:
+            payload[name] = value
+        return payload
+
+    def change_payload(self, discount: float) -> dict[str, Any]:
+        if self.meta:
+            return {"discount": discount, "meta": self.meta}
+        return {"discount": discount, "id": self.id}
+
+
+def position_records(rows: list[dict[str, Any]]) -> list[PositionRecord]:
+    return [PositionRecord(row) for row in rows]
 
 
 # ---------------------------------------------------------------------------
 # position payload builder
 # ---------------------------------------------------------------------------
 
-def _calc_discount_amount(price: Any, quantity: Any, discount_percent: Decimal) -> int:
-    """Discount amount in the same units as *price* (kopecks)."""
-    price_d = _to_decimal(price) or Decimal("0")
-    qty_d = _to_decimal(quantity) or Decimal("0")
-    amount = price_d * qty_d * discount_percent / Decimal("100")
-    return int(amount.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
-
-
 def build_position_update(position: dict[str, Any], discount: Decimal) -> dict[str, Any]:
     """Build a minimal position payload suitable for a document PUT.
 
     Includes ``id`` so MoySklad matches it to the existing position,
     and wraps ``assortment`` as ``{"meta": ...}`` as the API requires.
     """
-    assortment = position.get("assortment") or {}
-    assortment_meta = assortment.get("meta") if isinstance(assortment, dict) else None
-
-    payload: dict[str, Any] = {
-        "id": position.get("id"),
-        "quantity": position.get("quantity"),
-        "price": position.get("price"),
-        "discount": float(discount),
-    }
-
-    if assortment_meta:
-        payload["assortment"] = {"meta": assortment_meta}
-
-    for field in ("vat", "vatEnabled", "pack", "reserve"):
-        if position.get(field) is not None:
-            payload[field] = position[field]
-
-    return payload
+    return PositionRecord(position).update_payload(float(discount))
 
 
 # ---------------------------------------------------------------------------
 # main entry-point
 # ---------------------------------------------------------------------------
 
+def _position_percent(rules: CompiledRules, percent: Decimal,
+                      place: tuple[str | None, str],
+                      promo_folders: PromoFolderIndex | None) -> Decimal:
+    """Target discount of a position: promo → 0, then a folder rate, else *percent*."""
+    if rules.is_promo(*place, promo_folders):
+        return ZERO
+    folder_rate = rules.folder_rate(place[0], promo_folders)
+    return percent if folder_rate is None else folder_rate
+
+
 @dataclass
 class DiscountResult:
     all_positions: list[dict[str, Any]]   # payloads for ALL positions (for PUT)
     changed_count: int                     # how many actually changed
     loyalty_discount_sum: int              # total discount in kopecks
+    changed_positions: list[dict[str, Any]] = field(default_factory=list)  # only the changed ones
 
 
-def apply_discounts(document: dict[str, Any], settings: Settings) -> DiscountResult:
+def apply_discounts(document: dict[str, Any], settings: Settings,
+                    promo_folders: PromoFolderIndex | None = None,
+                    discount_percent: Decimal | None = None) -> DiscountResult:
     """Calculate loyalty discounts for every position in *document*.
 
     Returns payloads for **all** positions (not only changed ones) because
     MoySklad replaces the entire positions list on PUT — omitting a position
-    would delete it.
+    would delete it.  ``changed_positions`` holds just the changed discounts
+    for the bulk update of ``/positions``.
+
+    *discount_percent* is the agent's loyalty discount when the caller
+    already knows it; otherwise it is read from the expanded ``agent``.
     """
     # positions may already be a flat list (set by processor) or nested
     raw = document.get("positions")
@@ -169,35 +383,36 @@ def apply_discounts(document: dict[str, Any], settings: Settings) -> DiscountRes
     else:
         positions = []
 
-    counterparty = document.get("agent") or {}
-    discount_percent = get_loyalty_discount_percent(counterparty, settings)
+    rules = compile_rules(settings)
+    if discount_percent is None:
+        discount_percent = rules.discount_percent(document.get("agent") or {})
+    eligible = discount_percent > 0
+    records = position_records(positions)
+    if eligible and rules.tier_thresholds:
+        # tiers look at the order sum before any discount
+        order_sum = sum(line_total(rec.price, rec.quantity) for rec in records)
+        discount_percent = rules.document_percent(discount_percent, order_sum)
 
     all_positions: list[dict[str, Any]] = []
-    changed_count = 0
+    changed_positions: list[dict[str, Any]] = []
     discount_sum = 0
 
-    for pos in positions:
-        assortment = pos.get("assortment") or {}
-        is_promo = is_promo_product(assortment, settings)
-        current_discount = _to_decimal(pos.get("discount")) or Decimal("0")
-
-        if discount_percent <= 0 or is_promo:
-            target_discount = Decimal("0")
-        else:
-            target_discount = discount_percent
-
-        if target_discount > 0:
-            discount_sum += _calc_discount_amount(
-                pos.get("price"), pos.get("quantity"), target_discount,
-            )
-
-        if current_discount != target_discount:
-            changed_count += 1
+    for rec in records:
+        target = ZERO
+        if eligible:
+            target = _position_percent(rules, discount_percent, (rec.folder_href, rec.path_name),
+                                       promo_folders)
+            if target:
+                discount_sum += discount_amount(rec.price, rec.quantity, percent_rate(target))
 
-        all_positions.append(build_position_update(pos, target_discount))
+        written = float(target)
+        if (_to_decimal(rec.discount) or ZERO) != target:
+            changed_positions.append(rec.change_payload(written))
+        all_positions.append(rec.update_payload(written))
 
     return DiscountResult(
         all_positions=all_positions,
-        changed_count=changed_count,
+        changed_count=len(changed_positions),
         loyalty_discount_sum=discount_sum,
+        changed_positions=changed_positions,
     )
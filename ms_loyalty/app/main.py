@@ -1,15 +1,22 @@
 from __future__ import annotations
 
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 
+from . import assortment, counterparty, processor
 from .config import Settings
+from .journal import EventJournal, JournalEvent, idempotency_key
 from .moysklad import MoySkladClient
-from .processor import process_document
+from .moysklad_async import AsyncMoySkladClient
+from .processor import process_document, process_documents_async
+from .worker import Job, WorkerPool
 
 load_dotenv(Path(__file__).resolve().parents[1] / ".env")
 
@@ -19,8 +26,81 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
 )
 
+# workers (queue mode) and scripts block on the sync client; the inline
+# webhook path awaits the async one so it never stalls the event loop
 client = MoySkladClient(settings)
-app = FastAPI(title="MoySklad Loyalty Discounts")
+async_client = AsyncMoySkladClient(settings)
+# one catalog cache and folder index per process, whichever client fills them
+async_client.assortment_cache = client.assortment_cache
+async_client.promo_folders = client.promo_folders
+async_client.counterparty_cache = client.counterparty_cache
+
+# catalog entities whose webhooks invalidate cached data instead of being processed
+CATALOG_TYPES = {"product", "variant"}
+
+journal: EventJournal | None = None
+pool: WorkerPool | None = None
+# unfinished journal events the last start-up replay found no queue room for
+replay_deferred = 0
+
+
+def _settle(job: Job, error: Exception | None) -> None:
+    """Record the outcome of a worker run in the journal."""
+    if journal is None:
+        return
+    if error is None:
+        journal.mark_done(job.journal_ids)
+    else:
+        journal.mark_failed(job.journal_ids, str(error))
+
+
+if settings.webhook_mode == "queue":
+    if settings.journal_path:
+        journal = EventJournal(settings.journal_path)
+    pool = WorkerPool(
+        lambda doc_type, doc_id: process_document(client, settings, doc_type, doc_id),
+        workers=settings.worker_count,
+        max_queue=settings.queue_max_size,
+        debounce=settings.debounce_seconds,
+        on_finish=_settle,
+    )
+
+
+def _replay(events: list[JournalEvent]) -> int:
+    """Queue *events* in order until the queue is full; returns how many did not fit.
+
+    The rest stay ``pending`` in the journal: a redelivery of one still runs,
+    and the next start replays them again.
+    """
+    for n, event in enumerate(events):
+        if not pool.submit(event.doc_type, event.doc_id, event.action, journal_id=event.id):
+            logging.warning("Queue full after replaying %d of %d unfinished journal events, "
+                            "%d left pending", n, len(events), len(events) - n)
+            return len(events) - n
+    return 0
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global replay_deferred
+    if journal is not None:
+        journal.start()
+        # replay whatever was accepted but not finished before the last shutdown
+        unfinished = journal.unfinished()
+        if unfinished:
+            replay_deferred = _replay(unfinished)
+            logging.info("Replaying %d unfinished journal events", len(unfinished) - replay_deferred)
+    if pool is not None:
+        pool.start()
+    yield
+    if pool is not None:
+        pool.stop()
+    if journal is not None:
+        journal.close()
+    await async_client.aclose()
+
+
+app = FastAPI(title="MoySklad Loyalty Discounts", lifespan=lifespan)
 
 
 # ------------------------------------------------------------------
@@ -42,6 +122,54 @@ def _extract_doc_ref(event: dict[str, Any]) -> tuple[str | None, str | None]:
     return doc_type, doc_id
 
 
+def _invalidate_catalog(event: dict[str, Any], entity_type: str, entity_id: str) -> None:
+    """A product / variant changed or was deleted — forget what we cached about it."""
+    action = event.get("action", "UNKNOWN")
+    if action not in {"UPDATE", "DELETE"}:
+        return
+    href = (event.get("meta") or {}).get("href") or f"{settings.base_url}/entity/{entity_type}/{entity_id}"
+    dropped = assortment.invalidate(client.assortment_cache, href)
+    logging.info("Webhook event: %s %s %s (dropped %d cached items)", action, entity_type, entity_id, dropped)
+
+
+def _iter_doc_events(payload: Any) -> Iterator[tuple[str, str, str]]:
+    """Yield (doc_type, doc_id, action) for every event we should process."""
+    # MoySklad sends {"events": [...]}
+    events = payload.get("events") if isinstance(payload, dict) else None
+    if not events:
+        events = [payload]
+
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+
+        doc_type, doc_id = _extract_doc_ref(event)
+        if not doc_type or not doc_id:
+            logging.warning("Skipping event without document ref: %s", event)
+            continue
+        if doc_type in CATALOG_TYPES:
+            _invalidate_catalog(event, doc_type, doc_id)
+            continue
+        if doc_type == "counterparty":
+            action = event.get("action", "UNKNOWN")
+            if action in {"UPDATE", "DELETE"}:
+                counterparty.invalidate(client.counterparty_cache, doc_id)
+            logging.info("Webhook event: %s counterparty %s", action, doc_id)
+            continue
+        if doc_type == "productfolder":
+            # any change to the tree may move folders in or out of «Акция»
+            logging.info("Webhook event: %s productfolder %s", event.get("action", "UNKNOWN"), doc_id)
+            client.promo_folders.invalidate()
+            continue
+        if doc_type not in settings.document_types:
+            logging.info("Skipping document type %s (not in %s)", doc_type, settings.document_types)
+            continue
+
+        action = event.get("action", "UNKNOWN")
+        logging.info("Webhook event: %s %s %s", action, doc_type, doc_id)
+        yield doc_type, doc_id, action
+
+
 # ------------------------------------------------------------------
 # endpoints
 # ------------------------------------------------------------------
@@ -51,7 +179,7 @@ async def root() -> dict[str, str]:
     return {
         "service": "moysklad_loyalty_service",
         "status": "ok",
-        "endpoints": "/health, /webhook",
+        "endpoints": "/health, /webhook, /stats",
     }
 
 
@@ -60,8 +188,24 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/stats")
+async def stats() -> dict[str, Any]:
+    active = client if pool is not None else async_client
+    return {
+        "webhook_mode": settings.webhook_mode,
+        "queue": pool.stats() if pool is not None else None,
+        "pipeline": processor.stages.snapshot(),
+        "echo": active.echo_guard.stats(),
+        "rate_limit": dict(active.limiter.stats(), retries=active.retries),
+        "assortment_cache": client.assortment_cache.stats(),
+        "promo_folders": client.promo_folders.stats(),
+        "counterparty_cache": client.counterparty_cache.stats(),
+        "journal": dict(journal.stats(), replay_deferred=replay_deferred) if journal is not None else None,
+    }
+
+
 @app.post("/webhook")
-async def webhook(request: Request) -> dict[str, Any]:
+async def webhook(request: Request) -> Any:
     # optional bearer-token check
     if settings.webhook_bearer_token:
         auth = request.headers.get("Authorization", "")
@@ -70,48 +214,37 @@ async def webhook(request: Request) -> dict[str, Any]:
 
     payload = await request.json()
 
-    # MoySklad sends {"events": [...]}
-    events = payload.get("events") if isinstance(payload, dict) else None
-    if not events:
-        events = [payload]
-
-    results: list[dict[str, Any]] = []
-
-    for event in events:
-        if not isinstance(event, dict):
-            continue
-
-        doc_type, doc_id = _extract_doc_ref(event)
-        if not doc_type or not doc_id:
-            logging.warning("Skipping event without document ref: %s", event)
-            continue
-        if doc_type not in settings.document_types:
-            logging.info("Skipping document type %s (not in %s)", doc_type, settings.document_types)
-            continue
-
-        action = event.get("action", "UNKNOWN")
-        logging.info("Webhook event: %s %s %s", action, doc_type, doc_id)
-
-        try:
-            result = process_document(client, settings, doc_type, doc_id)
-            results.append({
-                "doc_type": doc_type,
-                "doc_id": doc_id,
-                "action": action,
-                "updated": result.updated,
-                "reason": result.reason,
-                "positions": result.updated_positions,
-                "loyalty_discount_sum": result.loyalty_discount_sum,
-            })
-        except Exception as exc:
-            logging.exception("Failed to process %s %s", doc_type, doc_id)
-            results.append({
-                "doc_type": doc_type,
-                "doc_id": doc_id,
-                "action": action,
-                "updated": False,
-                "reason": "error",
-                "error": str(exc),
-            })
-
+    if pool is not None:
+        refs = list(_iter_doc_events(payload))
+        journal_ids: list[int | None] = [None] * len(refs)
+        if journal is not None:
+            audit = payload.get("auditContext") if isinstance(payload, dict) else None
+            journal_ids = await run_in_threadpool(
+                journal.append, [(idempotency_key(audit, *ref), *ref) for ref in refs],
+            )
+
+        jobs: list[tuple[str, str, str, int | None]] = []
+        for (doc_type, doc_id, action), journal_id in zip(refs, journal_ids):
+            if journal is not None and journal_id is None:
+                logging.info("Duplicate delivery of %s %s %s, skipping", action, doc_type, doc_id)
+                continue
+            jobs.append((doc_type, doc_id, action, journal_id))
+        if not pool.submit_all(jobs):
+            # nothing was queued: MoySklad redelivers the whole payload on 5xx
+            raise HTTPException(status_code=503, detail="Queue is full")
+        accepted = [{"doc_type": doc_type, "doc_id": doc_id, "action": action}
+                    for doc_type, doc_id, action, _ in jobs]
+        return JSONResponse(status_code=202, content={"accepted": accepted})
+
+    # several events of one payload are processed together, once per document
+    events = list(_iter_doc_events(payload))
+    batch = await process_documents_async(
+        async_client, settings, [(doc_type, doc_id) for doc_type, doc_id, _ in events],
+        concurrency=settings.batch_concurrency,
+    )
+    by_ref = {(item.doc_type, item.doc_id): item for item in batch.items}
+    results = [
+        dict(by_ref[doc_type, doc_id].as_dict(), action=action)
+        for doc_type, doc_id, action in events
+    ]
     return {"results": results}
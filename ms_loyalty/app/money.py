@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+
+class Rate(NamedTuple):
+    """A percentage as an exact fraction of one: ``units / denominator``.
+
+    Percentages with up to two decimals become basis points over 10 000
+    (7.5 % → ``Rate(750, 10000)``); finer ones get a larger denominator.
+    """
+    units: int
+    denominator: int
+
+
+ZERO_RATE = Rate(0, 1)
+
+
+def round_half_up(numerator: int, denominator: int) -> int:
+    """``numerator / denominator`` rounded to an integer, halves away from zero.
+
+    The same rule as ``Decimal.quantize(Decimal("1"), ROUND_HALF_UP)``;
+    *denominator* must be positive.
+    """
+    if numerator >= 0:
+        return (2 * numerator + denominator) // (2 * denominator)
+    return -((-2 * numerator + denominator) // (2 * denominator))
+
+
+def _decimal_units(value: Decimal) -> tuple[int, int]:
+    if not value.is_finite():
+        return 0, 1
+    sign, digits, exponent = value.as_tuple()
+    units = 0
+    for digit in digits:
+        units = units * 10 + digit
+    if sign:
+        units = -units
+    if exponent >= 0:
+        return units * 10 ** exponent, 1
+    return units, 10 ** -exponent
+
+
+@lru_cache(maxsize=4096)
+def _float_units(value: float) -> tuple[int, int]:
+    # str() is what the Decimal code used: the shortest repr, not the binary value
+    return _decimal_units(Decimal(str(value)))
+
+
+def units(value: Any) -> tuple[int, int]:
+    """*value* as an exact scaled integer ``(units, scale)``, ``value = units / scale``.
+
+    Accepts what MoySklad returns for prices, quantities and discounts
+    (int, float, numeric string); anything else counts as zero.
+    """
+    if type(value) is int:
+        return value, 1
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value), 1
+        return _float_units(value)
+    if isinstance(value, Decimal):
+        return _decimal_units(value)
+    if isinstance(value, str):
+        try:
+            return _decimal_units(Decimal(value.strip()))
+        except InvalidOperation:
+            return 0, 1
+    return 0, 1
+
+
+@lru_cache(maxsize=256)
+def percent_rate(percent: Any) -> Rate:
+    value, scale = units(percent)
+    if value == 0:
+        return ZERO_RATE
+    if scale <= 100:
+        # basis points
+        return Rate(value * (100 // scale), 10_000)
+    return Rate(value, scale * 100)
+
+
+def discount_amount(price: Any, quantity: Any, rate: Rate) -> int:
+    """``price × quantity × rate`` in the units of *price* (kopecks), half-up."""
+    if rate.units == 0:
+        return 0
+    price_units, price_scale = units(price)
+    qty_units, qty_scale = units(quantity)
+    return round_half_up(
+        price_units * qty_units * rate.units,
+        price_scale * qty_scale * rate.denominator,
+    )
+
+
+def line_total(price: Any, quantity: Any) -> int:
+    """``price × quantity`` in the units of *price*, half-up."""
+    price_units, price_scale = units(price)
+    qty_units, qty_scale = units(quantity)
+    return round_half_up(price_units * qty_units, price_scale * qty_scale)
@@ -2,12 +2,118 @@ from __future__ import annotations
 
 import base64
 import logging
-from typing import Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterator
 from urllib.parse import urljoin
 
 import requests
 
+from .cache import TTLCache
 from .config import Settings
+from .echo import EchoGuard
+from .folders import PromoFolderIndex
+from .logic import compile_rules
+from .ratelimit import RateLimiter, is_retryable, retry_delay
+
+
+# ------------------------------------------------------------------
+# helpers shared with the async client
+# ------------------------------------------------------------------
+
+def auth_header(settings: Settings) -> dict[str, str]:
+    mode = settings.auth_mode
+    if mode == "bearer":
+        if not settings.token:
+            raise ValueError("MS_TOKEN is required for bearer auth")
+        return {"Authorization": f"Bearer {settings.token}"}
+    if mode == "basic":
+        if not settings.login:
+            raise ValueError("MS_LOGIN is required for basic auth")
+        raw = f"{settings.login}:{settings.password}".encode("utf-8")
+        token = base64.b64encode(raw).decode("ascii")
+        return {"Authorization": f"Basic {token}"}
+    raise ValueError(f"Unsupported MS_AUTH_MODE: {mode}")
+
+
+def resolve_url(base_url: str, path_or_url: str) -> str:
+    if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
+        return path_or_url
+    return urljoin(base_url, path_or_url.lstrip("/"))
+
+
+MAX_PAGE_SIZE = 1000          # API limit for collection pages
+MAX_EXPANDED_PAGE_SIZE = 100  # ... and when ``expand`` is used
+POSITIONS_BATCH = 1000        # array items per bulk positions request
+BULK_BATCH = 1000             # entities per mass create/update request
+
+
+def page_size(settings: Settings, expand: str | None) -> int:
+    cap = MAX_EXPANDED_PAGE_SIZE if expand else MAX_PAGE_SIZE
+    return max(1, min(settings.positions_page_size, cap))
+
+
+def inline_positions(document: dict[str, Any]) -> dict[str, Any] | None:
+    """The ``positions`` page embedded by ``expand=positions...``, if any."""
+    positions = document.get("positions")
+    if isinstance(positions, dict) and "rows" in positions:
+        return positions
+    return None
+
+
+def remaining_offsets(total: int, fetched: int, limit: int) -> list[int]:
+    """Offsets still to fetch once the first page told us ``meta.size``."""
+    return list(range(fetched, total, limit)) if fetched else []
+
+
+def moment_filter(dt_from: datetime | None, dt_to: datetime | None) -> str:
+    """``filter`` for documents whose ``moment`` falls in the range (either end open)."""
+    parts = []
+    if dt_from is not None:
+        parts.append(f"moment>={dt_from:%Y-%m-%d %H:%M:%S}")
+    if dt_to is not None:
+        parts.append(f"moment<={dt_to:%Y-%m-%d %H:%M:%S}")
+    return ";".join(parts)
+
+
+@dataclass
+class BulkResult:
+    """Outcome of a mass update, by document id."""
+    updated: dict[str, dict[str, Any]] = field(default_factory=dict)  # id -> entity as written
+    failed: dict[str, str] = field(default_factory=dict)              # id -> error message
+
+
+def bulk_outcome(ids: list[str], rows: Any) -> dict[str, dict[str, Any] | str]:
+    """Match a mass-update response to the ids sent, in order.
+
+    The API answers with one element per entity sent; a rejected entity
+    comes back as ``{"errors": [...]}`` and the rest of the chunk is still
+    applied.  An error message is returned for every id that was not written.
+    """
+    if not isinstance(rows, list):
+        rows = []
+    outcome: dict[str, dict[str, Any] | str] = {}
+    for n, doc_id in enumerate(ids):
+        row = rows[n] if n < len(rows) else None
+        if not isinstance(row, dict):
+            outcome[doc_id] = "no result in the response"
+        elif row.get("errors"):
+            outcome[doc_id] = "; ".join(
+                str(error.get("error") or error) if isinstance(error, dict) else str(error)
+                for error in row["errors"]
+            )
+        else:
+            outcome[doc_id] = row
+    return outcome
+
+
+def attributes_by_name(attrs: list[Any]) -> dict[str, dict[str, Any]]:
+    return {
+        item.get("name"): item for item in attrs
+        if isinstance(item, dict) and item.get("name")
+    }
 
 
 class MoySkladClient:
@@ -17,24 +123,35 @@ class MoySkladClient:
         self.session = requests.Session()
         self.timeout = settings.request_timeout
         self._metadata_cache: dict[str, dict[str, dict[str, Any]]] = {}
+        # one limiter for every thread that shares this client
+        self.limiter = RateLimiter(
+            settings.rate_limit_per_second,
+            settings.rate_limit_burst,
+            settings.max_parallel_requests,
+        )
+        self.retries = 0
+        # fingerprints of our own writes, used to drop their webhook echoes
+        self.echo_guard = EchoGuard(settings.echo_ttl_seconds)
+        # pathName / folder per catalog item, shared by every document
+        self.assortment_cache: TTLCache = TTLCache(
+            settings.assortment_cache_size, settings.assortment_cache_ttl,
+        )
+        # loyalty eligibility / percent per counterparty id
+        self.counterparty_cache: TTLCache = TTLCache(
+            settings.counterparty_cache_size, settings.counterparty_cache_ttl,
+        )
+        # product-folder hrefs at or under the promo folder
+        self.promo_folders = PromoFolderIndex(
+            settings.promo_group_name, settings.promo_folder_refresh,
+            compile_rules(settings).folder_rates,
+        )
 
     # ------------------------------------------------------------------
     # auth
     # ------------------------------------------------------------------
 
     def _auth_header(self) -> dict[str, str]:
-        mode = self.settings.auth_mode
-        if mode == "bearer":
-            if not self.settings.token:
-                raise ValueError("MS_TOKEN is required for bearer auth")
-            return {"Authorization": f"Bearer {self.settings.token}"}
-        if mode == "basic":
-            if not self.settings.login:
-                raise ValueError("MS_LOGIN is required for basic auth")
-            raw = f"{self.settings.login}:{self.settings.password}".encode("utf-8")
-            token = base64.b64encode(raw).decode("ascii")
-            return {"Authorization": f"Basic {token}"}
-        raise ValueError(f"Unsupported MS_AUTH_MODE: {mode}")
+        return auth_header(self.settings)
 
     # ------------------------------------------------------------------
     # generic request
@@ -43,10 +160,7 @@ class MoySkladClient:
     def request(self, method: str, path_or_url: str, *,
                 params: dict[str, Any] | None = None,
                 json: dict[str, Any] | list | None = None) -> dict[str, Any]:
-        if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
-            url = path_or_url
-        else:
-            url = urljoin(self.base_url, path_or_url.lstrip("/"))
+        url = resolve_url(self.base_url, path_or_url)
 
         headers = {
             "Accept": "application/json;charset=utf-8",
@@ -54,11 +168,32 @@ class MoySkladClient:
         }
         headers.update(self._auth_header())
 
-        logging.debug("MS %s %s", method, url)
-        response = self.session.request(
-            method, url, headers=headers, params=params,
-            json=json, timeout=self.timeout,
-        )
+        attempt = 0
+        while True:
+            logging.debug("MS %s %s", method, url)
+            try:
+                with self.limiter.slot():
+                    response = self.session.request(
+                        method, url, headers=headers, params=params,
+                        json=json, timeout=self.timeout,
+                    )
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt >= self.settings.max_retries:
+                    raise
+                delay = retry_delay(0, {}, attempt, self.settings.retry_backoff)
+                logging.warning("MS %s %s failed (%s), retry in %.2fs", method, url, exc, delay)
+            else:
+                self.limiter.note_headers(response.headers)
+                if not is_retryable(response.status_code) or attempt >= self.settings.max_retries:
+                    break
+                delay = retry_delay(response.status_code, response.headers,
+                                    attempt, self.settings.retry_backoff)
+                logging.warning("MS %s %s -> %s, retry in %.2fs",
+                                method, url, response.status_code, delay)
+            attempt += 1
+            self.retries += 1
+            time.sleep(delay)
+
         if response.status_code >= 400:
             logging.error("MS error %s %s: %s", response.status_code, url, response.text)
             response.raise_for_status()
@@ -91,10 +226,7 @@ class MoySkladClient:
         else:
             attrs = []
 
-        by_name: dict[str, dict[str, Any]] = {
-            item.get("name"): item for item in attrs
-            if isinstance(item, dict) and item.get("name")
-        }
+        by_name = attributes_by_name(attrs)
         self._metadata_cache[entity] = by_name
         return by_name
 
@@ -126,29 +258,143 @@ class MoySkladClient:
                         payload: dict[str, Any]) -> dict[str, Any]:
         return self.request("PUT", f"/entity/{doc_type}/{doc_id}", json=payload)
 
+    def update_positions(self, doc_type: str, doc_id: str,
+                         changes: list[dict[str, Any]]) -> None:
+        """Bulk-update existing positions (array POST, ``POSITIONS_BATCH`` per request)."""
+        for start in range(0, len(changes), POSITIONS_BATCH):
+            self.request("POST", f"/entity/{doc_type}/{doc_id}/positions",
+                         json=changes[start:start + POSITIONS_BATCH])
+
+    def bulk_update_documents(self, doc_type: str, payloads: dict[str, dict[str, Any]],
+                              attempts: int = 2) -> BulkResult:
+        """Update many documents with array POSTs to ``/entity/{doc_type}``.
+
+        *payloads* maps a document id to what a PUT would send.  Chunks of
+        ``BULK_BATCH`` go out in parallel through the shared limiter; the
+        documents rejected inside a chunk — or every document of a chunk
+        that failed as a whole — are sent again, up to *attempts* rounds.
+        """
+        result = BulkResult()
+        pending = list(payloads)
+        for _ in range(max(1, attempts)):
+            if not pending:
+                break
+            chunks = [pending[start:start + BULK_BATCH] for start in range(0, len(pending), BULK_BATCH)]
+            workers = max(1, min(self.limiter.max_parallel, len(chunks)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                outcomes = list(executor.map(
+                    lambda ids: self._bulk_chunk(doc_type, ids, payloads), chunks,
+                ))
+            pending = []
+            for outcome in outcomes:
+                for doc_id, row in outcome.items():
+                    if isinstance(row, str):
+                        result.failed[doc_id] = row
+                        pending.append(doc_id)
+                    else:
+                        result.updated[doc_id] = row
+                        result.failed.pop(doc_id, None)
+            if pending:
+                logging.warning("Bulk update of %s: %d of %d documents failed",
+                                doc_type, len(pending), len(payloads))
+        return result
+
+    def _bulk_chunk(self, doc_type: str, ids: list[str],
+                    payloads: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any] | str]:
+        body = [
+            dict(payloads[doc_id], meta={
+                "href": resolve_url(self.base_url, f"entity/{doc_type}/{doc_id}"),
+                "type": doc_type,
+                "mediaType": "application/json",
+            })
+            for doc_id in ids
+        ]
+        try:
+            rows = self.request("POST", f"/entity/{doc_type}", json=body)
+        except requests.HTTPError as exc:
+            # per-entity errors may come with an error status for the whole array
+            try:
+                rows = exc.response.json()
+            except ValueError:
+                rows = None
+            if not isinstance(rows, list):
+                return {doc_id: str(exc) for doc_id in ids}
+        except requests.RequestException as exc:
+            return {doc_id: str(exc) for doc_id in ids}
+        return bulk_outcome(ids, rows)
+
+    # ------------------------------------------------------------------
+    # document lists
+    # ------------------------------------------------------------------
+
+    def iter_documents(self, doc_type: str, filter: str = "",
+                       expand: str | None = None) -> Iterator[list[dict[str, Any]]]:
+        """Pages of ``/entity/{doc_type}`` matching *filter*, oldest first.
+
+        Pages are fetched one at a time as the caller consumes them, so a
+        long range never sits in memory as a whole.
+        """
+        limit = MAX_EXPANDED_PAGE_SIZE if expand else MAX_PAGE_SIZE
+        offset = 0
+        while True:
+            params: dict[str, Any] = {"limit": limit, "offset": offset, "order": "moment,asc"}
+            if filter:
+                params["filter"] = filter
+            if expand:
+                params["expand"] = expand
+            data = self.request("GET", f"/entity/{doc_type}", params=params)
+            rows = data.get("rows") or []
+            if rows:
+                yield rows
+            offset += len(rows)
+            if not rows or offset >= (data.get("meta") or {}).get("size", 0):
+                return
+
     # ------------------------------------------------------------------
     # positions with pagination
     # ------------------------------------------------------------------
 
     def get_all_positions(self, doc_type: str, doc_id: str,
-                          expand: str | None = "assortment") -> list[dict[str, Any]]:
-        """Fetch every position of a document, paginating if > 100 rows."""
+                          expand: str | None = "assortment",
+                          first_page: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+        """Fetch every position of a document.
+
+        The first page tells us ``meta.size``; the remaining pages are then
+        fetched in parallel (``POSITIONS_CONCURRENCY``) and put back in order.
+        *first_page* is the ``positions`` object that came inline with the
+        document (``expand=positions...``); only what it lacks is fetched.
+        """
+        return [row for page in self.iter_positions(doc_type, doc_id, expand, first_page) for row in page]
+
+    def iter_positions(self, doc_type: str, doc_id: str,
+                       expand: str | None = "assortment",
+                       first_page: dict[str, Any] | None = None) -> Iterator[list[dict[str, Any]]]:
+        """The rows of :meth:`get_all_positions`, page by page, in order.
+
+        Pages are still fetched ahead in parallel; leaving the loop early
+        cancels the ones not started yet.
+        """
         base = f"/entity/{doc_type}/{doc_id}/positions"
-        limit = 100
-        offset = 0
-        all_rows: list[dict[str, Any]] = []
+        limit = page_size(self.settings, expand)
 
-        while True:
+        def fetch(offset: int) -> dict[str, Any]:
             params: dict[str, Any] = {"limit": limit, "offset": offset}
             if expand:
                 params["expand"] = expand
-            data = self.request("GET", base, params=params)
-            rows = data.get("rows", [])
-            all_rows.extend(rows)
+            return self.request("GET", base, params=params)
 
-            total = (data.get("meta") or {}).get("size", 0)
-            if len(all_rows) >= total or not rows:
-                break
-            offset += limit
+        first = first_page if first_page is not None else fetch(0)
+        rows: list[dict[str, Any]] = list(first.get("rows") or [])
+        yield rows
+        total = (first.get("meta") or {}).get("size", 0)
+        offsets = remaining_offsets(total, len(rows), limit)
+        if not offsets:
+            return
 
-        return all_rows
+        workers = max(1, min(self.settings.positions_concurrency, len(offsets)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for data in executor.map(fetch, offsets):
+                yield data.get("rows", [])
+        finally:
+            executor.shutdown(cancel_futures=True)
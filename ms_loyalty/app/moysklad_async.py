@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+from typing import Any, AsyncIterator
+
+import httpx
+
+from .cache import TTLCache
+from .config import Settings
+from .echo import EchoGuard
+from .folders import PromoFolderIndex
+from .logic import compile_rules
+from .moysklad import (
+    POSITIONS_BATCH,
+    attributes_by_name,
+    auth_header,
+    page_size,
+    remaining_offsets,
+    resolve_url,
+)
+from .ratelimit import RateLimiter, is_retryable, retry_delay
+
+
+class AsyncMoySkladClient:
+    """``MoySkladClient`` on top of ``httpx.AsyncClient``.
+
+    Same surface as the sync client, but every call is a coroutine, so the
+    FastAPI app can overlap I/O for different documents.  Connections are
+    pooled and kept alive; HTTP/2 is used when ``HTTP2=true`` and the ``h2``
+    package is installed.  Use one instance per event loop.
+    """
+
+    def __init__(self, settings: Settings, *,
+                 transport: httpx.AsyncBaseTransport | None = None) -> None:
+        self.settings = settings
+        self.base_url = settings.base_url.rstrip("/") + "/"
+        self.timeout = settings.request_timeout
+        self._metadata_cache: dict[str, dict[str, dict[str, Any]]] = {}
+        self.limiter = RateLimiter(
+            settings.rate_limit_per_second,
+            settings.rate_limit_burst,
+            settings.max_parallel_requests,
+        )
+        self._slots = asyncio.Semaphore(self.limiter.max_parallel)
+        self.retries = 0
+        self.echo_guard = EchoGuard(settings.echo_ttl_seconds)
+        # pathName / folder per catalog item, shared by every document
+        self.assortment_cache: TTLCache = TTLCache(
+            settings.assortment_cache_size, settings.assortment_cache_ttl,
+        )
+        # loyalty eligibility / percent per counterparty id
+        self.counterparty_cache: TTLCache = TTLCache(
+            settings.counterparty_cache_size, settings.counterparty_cache_ttl,
+        )
+        # product-folder hrefs at or under the promo folder
+        self.promo_folders = PromoFolderIndex(
+            settings.promo_group_name, settings.promo_folder_refresh,
+            compile_rules(settings).folder_rates,
+        )
+
+        http2 = settings.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logging.warning("HTTP2=true but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+
+        self._http = httpx.AsyncClient(
+            http2=http2,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_connections,
+            ),
+            headers={
+                "Accept": "application/json;charset=utf-8",
+                "Accept-Encoding": "gzip",
+            },
+            transport=transport,
+        )
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def __aenter__(self) -> "AsyncMoySkladClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    # ------------------------------------------------------------------
+    # generic request
+    # ------------------------------------------------------------------
+
+    async def request(self, method: str, path_or_url: str, *,
+                      params: dict[str, Any] | None = None,
+                      json: dict[str, Any] | list | None = None) -> dict[str, Any]:
+        url = resolve_url(self.base_url, path_or_url)
+
+        headers = {"Content-Type": "application/json;charset=utf-8"}
+        headers.update(auth_header(self.settings))
+
+        attempt = 0
+        while True:
+            logging.debug("MS %s %s", method, url)
+            try:
+                wait = self.limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                async with self._slots:
+                    response = await self._http.request(
+                        method, url, headers=headers, params=params, json=json,
+                    )
+            except httpx.TransportError as exc:
+                if attempt >= self.settings.max_retries:
+                    raise
+                delay = retry_delay(0, {}, attempt, self.settings.retry_backoff)
+                logging.warning("MS %s %s failed (%s), retry in %.2fs", method, url, exc, delay)
+            else:
+                self.limiter.note_headers(response.headers)
+                if not is_retryable(response.status_code) or attempt >= self.settings.max_retries:
+                    break
+                delay = retry_delay(response.status_code, response.headers,
+                                    attempt, self.settings.retry_backoff)
+                logging.warning("MS %s %s -> %s, retry in %.2fs",
+                                method, url, response.status_code, delay)
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        if response.status_code >= 400:
+            logging.error("MS error %s %s: %s", response.status_code, url, response.text)
+            response.raise_for_status()
+        if response.content:
+            return response.json()
+        return {}
+
+    # ------------------------------------------------------------------
+    # metadata helpers
+    # ------------------------------------------------------------------
+
+    async def get_metadata(self, entity: str) -> dict[str, dict[str, Any]]:
+        if entity in self._metadata_cache:
+            return self._metadata_cache[entity]
+
+        data = await self.request("GET", f"/entity/{entity}/metadata")
+        raw = data.get("attributes")
+
+        if isinstance(raw, list):
+            attrs = raw
+        elif isinstance(raw, dict):
+            attrs = raw.get("rows", [])
+            if not attrs and (raw.get("meta") or {}).get("size", 0) > 0:
+                href = raw["meta"].get("href", "")
+                if href:
+                    fetched = await self.request("GET", href)
+                    attrs = fetched.get("rows", [])
+        else:
+            attrs = []
+
+        by_name = attributes_by_name(attrs)
+        self._metadata_cache[entity] = by_name
+        return by_name
+
+    # ------------------------------------------------------------------
+    # entity / document CRUD
+    # ------------------------------------------------------------------
+
+    async def get_document(self, doc_type: str, doc_id: str,
+                           expand: str | None = None) -> dict[str, Any]:
+        params = {"expand": expand} if expand else None
+        return await self.request("GET", f"/entity/{doc_type}/{doc_id}", params=params)
+
+    async def get_by_href(self, href: str, expand: str | None = None) -> dict[str, Any]:
+        params = {"expand": expand} if expand else None
+        return await self.request("GET", href, params=params)
+
+    async def update_document(self, doc_type: str, doc_id: str,
+                              payload: dict[str, Any]) -> dict[str, Any]:
+        return await self.request("PUT", f"/entity/{doc_type}/{doc_id}", json=payload)
+
+    async def update_positions(self, doc_type: str, doc_id: str,
+                               changes: list[dict[str, Any]]) -> None:
+        """Bulk-update existing positions (array POST, ``POSITIONS_BATCH`` per request)."""
+        for start in range(0, len(changes), POSITIONS_BATCH):
+            await self.request("POST", f"/entity/{doc_type}/{doc_id}/positions",
+                               json=changes[start:start + POSITIONS_BATCH])
+
+    # ------------------------------------------------------------------
+    # positions with pagination
+    # ------------------------------------------------------------------
+
+    async def get_all_positions(self, doc_type: str, doc_id: str,
+                                expand: str | None = "assortment",
+                                first_page: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+        """Fetch every position of a document; pages after the first in parallel."""
+        return [row async for page in self.iter_positions(doc_type, doc_id, expand, first_page)
+                for row in page]
+
+    async def iter_positions(self, doc_type: str, doc_id: str,
+                             expand: str | None = "assortment",
+                             first_page: dict[str, Any] | None = None) -> AsyncIterator[list[dict[str, Any]]]:
+        """The rows of :meth:`get_all_positions`, page by page, in order."""
+        base = f"/entity/{doc_type}/{doc_id}/positions"
+        limit = page_size(self.settings, expand)
+        pages = asyncio.Semaphore(max(1, self.settings.positions_concurrency))
+
+        async def fetch(offset: int) -> dict[str, Any]:
+            params: dict[str, Any] = {"limit": limit, "offset": offset}
+            if expand:
+                params["expand"] = expand
+            async with pages:
+                return await self.request("GET", base, params=params)
+
+        first = first_page if first_page is not None else await fetch(0)
+        rows: list[dict[str, Any]] = list(first.get("rows") or [])
+        yield rows
+        total = (first.get("meta") or {}).get("size", 0)
+        offsets = remaining_offsets(total, len(rows), limit)
+
+        tasks = [asyncio.ensure_future(fetch(offset)) for offset in offsets]
+        try:
+            for task in tasks:
+                yield (await task).get("rows", [])
+        finally:
+            # leaving the loop early (or a failed page) drops the pages still in flight
+            for task in tasks:
+                task.cancel()
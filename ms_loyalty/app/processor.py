@@ -1,12 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, AsyncIterator, Iterable, Iterator
 
+from .assortment import (
+    AssortmentInfo,
+    remember,
+    resolve_assortments,
+    resolve_assortments_async,
+    split_cached,
+)
 from .config import Settings
-from .logic import apply_discounts
-from .moysklad import MoySkladClient
+from .counterparty import loyalty_profile, loyalty_profile_async
+from .logic import DiscountResult, apply_discounts
+from .moysklad import MoySkladClient, inline_positions
+from .moysklad_async import AsyncMoySkladClient
 
 
 @dataclass
@@ -17,81 +31,129 @@ class ProcessResult:
     loyalty_discount_sum: int
 
 
+class StageCounters:
+    """How often each pipeline stage is reached or short-circuits."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Counter[str] = Counter()
+
+    def add(self, stage: str) -> None:
+        with self._lock:
+            self._counts[stage] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+# documents → echo | not_eligible(_clean) | enriched → no_changes | dry_run | updated
+# (writes: partial_update, partial_update_fallback, bulk_update)
+stages = StageCounters()
+
+
 # ------------------------------------------------------------------
-# enrichment — resolve pathName for promo-folder detection
+# enrichment — resolve pathName / folder for promo-folder detection
 # ------------------------------------------------------------------
 
-def _enrich_assortments(client: MoySkladClient, positions: list[dict[str, Any]]) -> None:
-    """Ensure every position's assortment has ``pathName``.
+def _assortments_to_enrich(positions: list[dict[str, Any]],
+                           by_folder: bool = False) -> dict[str, dict[str, Any]]:
+    """Distinct ``href -> meta`` of assortments that lack ``pathName``.
 
-    If the expanded assortment already contains ``pathName`` we skip it.
-    For variants whose response lacks ``pathName`` we resolve it via the
-    parent product.
+    With *by_folder* (the promo-folder index is loaded) an assortment that
+    already carries its ``productFolder`` needs nothing either.
     """
-    cache: dict[str, dict[str, Any]] = {}
-
+    missing: dict[str, dict[str, Any]] = {}
     for pos in positions:
         assortment = pos.get("assortment") or {}
         if not isinstance(assortment, dict):
             continue
         if assortment.get("pathName") is not None:
             continue
+        if by_folder and ((assortment.get("productFolder") or {}).get("meta") or {}).get("href"):
+            continue
 
         meta = assortment.get("meta")
         href = meta.get("href") if isinstance(meta, dict) else None
-        if not href:
-            continue
-
-        if href in cache:
-            pos["assortment"] = cache[href]
-            continue
+        if href and href not in missing:
+            missing[href] = meta
+    return missing
 
-        try:
-            full = client.get_by_href(href)
-
-            # variants don't carry pathName — resolve through parent product
-            assortment_type = (meta.get("type") or "").lower()
-            if assortment_type == "variant" and not full.get("pathName"):
-                product_href = ((full.get("product") or {}).get("meta") or {}).get("href")
-                if product_href:
-                    product_data = client.get_by_href(product_href)
-                    full["pathName"] = product_data.get("pathName", "")
-
-            cache[href] = full
-            pos["assortment"] = full
-        except Exception as exc:
-            logging.warning("Failed to enrich assortment %s: %s", href, exc)
 
+def _fill_assortments(positions: list[dict[str, Any]], infos: dict[str, AssortmentInfo]) -> None:
+    for pos in positions:
+        assortment = pos.get("assortment")
+        if not isinstance(assortment, dict) or assortment.get("pathName") is not None:
+            continue
+        info = infos.get((assortment.get("meta") or {}).get("href"))
+        if info is None:
+            continue
+        filled = dict(assortment, pathName=info.path_name)
+        if info.folder_href:
+            filled["productFolder"] = {"meta": {"href": info.folder_href}}
+        pos["assortment"] = filled
 
-# ------------------------------------------------------------------
-# main processor
-# ------------------------------------------------------------------
 
-def process_document(
-    client: MoySkladClient,
-    settings: Settings,
-    doc_type: str,
-    doc_id: str,
-) -> ProcessResult:
-    logging.info("Processing %s %s", doc_type, doc_id)
+def _enrich_assortments(client: MoySkladClient, positions: list[dict[str, Any]]) -> None:
+    """Ensure every position's assortment has ``pathName``.
 
-    # 1. fetch document (with counterparty expanded)
-    document = client.get_document(doc_type, doc_id, expand="agent")
+    If the expanded assortment already contains ``pathName`` we skip it.
+    The rest comes from the client's assortment cache or is fetched in
+    batches through the list endpoints; variants get ``pathName`` from
+    their parent product.
+    """
+    missing = _assortments_to_enrich(positions, client.promo_folders.ready)
+    if not missing:
+        return
+    infos, to_fetch = split_cached(client.assortment_cache, missing)
+    if to_fetch:
+        infos.update(remember(client.assortment_cache, resolve_assortments(client, to_fetch)))
+    _fill_assortments(positions, infos)
 
-    # 2. fetch ALL positions with assortment expanded (handles pagination)
-    positions = client.get_all_positions(doc_type, doc_id, expand="assortment")
 
-    # 3. enrich positions that lack pathName (needed for promo detection)
+def enrich_positions(client: MoySkladClient, positions: list[dict[str, Any]]) -> None:
+    """Get positions ready for promo detection: folder index fresh, folders filled in."""
+    client.promo_folders.refresh(client)
     if positions:
         _enrich_assortments(client, positions)
 
-    # inject flat list into document so apply_discounts can read it
-    document["positions"] = positions
 
-    # 4. calculate discounts
-    result = apply_discounts(document, settings)
+async def _enrich_assortments_async(client: AsyncMoySkladClient,
+                                    positions: list[dict[str, Any]]) -> None:
+    missing = _assortments_to_enrich(positions, client.promo_folders.ready)
+    if not missing:
+        return
+    infos, to_fetch = split_cached(client.assortment_cache, missing)
+    if to_fetch:
+        resolved = await resolve_assortments_async(client, to_fetch)
+        infos.update(remember(client.assortment_cache, resolved))
+    _fill_assortments(positions, infos)
+
+
+# ------------------------------------------------------------------
+# steps shared by the sync and async processors
+# ------------------------------------------------------------------
 
+def _echo_result(doc_type: str, doc_id: str, loyalty_discount_sum: int) -> ProcessResult:
+    stages.add("echo")
+    logging.info("Skipping echo of our own update for %s %s", doc_type, doc_id)
+    return ProcessResult(
+        updated=False,
+        reason="echo",
+        updated_positions=0,
+        loyalty_discount_sum=loyalty_discount_sum,
+    )
+
+
+def _result_without_update(settings: Settings, doc_type: str, doc_id: str,
+                           result: DiscountResult) -> ProcessResult | None:
+    """Final result when nothing has to be written, else None."""
     if result.changed_count == 0:
+        stages.add("no_changes")
         logging.info("No discount changes needed for %s %s", doc_type, doc_id)
         return ProcessResult(
             updated=False,
@@ -101,6 +163,7 @@ def process_document(
         )
 
     if settings.dry_run:
+        stages.add("dry_run")
         logging.info(
             "Dry run: would update %d positions in %s %s (discount sum: %d)",
             result.changed_count, doc_type, doc_id, result.loyalty_discount_sum,
@@ -111,11 +174,104 @@ def process_document(
             updated_positions=result.changed_count,
             loyalty_discount_sum=result.loyalty_discount_sum,
         )
+    return None
+
 
-    # 5. PUT document with ALL positions to avoid deleting unchanged ones
-    payload: dict[str, Any] = {"positions": result.all_positions}
-    client.update_document(doc_type, doc_id, payload)
+# the document comes with its first positions page (and their assortment)
+# inline: one round trip for typical orders; more pages only when
+# ``positions.meta.size`` exceeds what came back
+DOCUMENT_EXPAND = "positions.assortment"
 
+
+def _positions_expand(eligible: bool) -> str | None:
+    # promo status only matters when there is a discount to give
+    return "assortment" if eligible else None
+
+
+def _has_discount(page: list[dict[str, Any]]) -> bool:
+    return any(pos.get("discount") for pos in page)
+
+
+def _not_eligible_result(doc_type: str, doc_id: str) -> ProcessResult:
+    """An agent without loyalty discount, and no position discount to clear."""
+    stages.add("not_eligible_clean")
+    logging.info("Agent of %s %s has no loyalty discount, nothing to clear", doc_type, doc_id)
+    return ProcessResult(
+        updated=False,
+        reason="not_eligible",
+        updated_positions=0,
+        loyalty_discount_sum=0,
+    )
+
+
+def _positions_to_clear(pages: Iterator[list[dict[str, Any]]]) -> list[dict[str, Any]] | None:
+    """Stream the positions of a document whose agent gets no loyalty discount.
+
+    Every target discount is 0: once a page carries a discount the rest is
+    only collected — clearing writes all positions — and without one there
+    is nothing to calculate or write (None).
+    """
+    stages.add("not_eligible")
+    positions: list[dict[str, Any]] = []
+    for page in pages:
+        positions.extend(page)
+        if _has_discount(page):
+            for rest in pages:
+                positions.extend(rest)
+            return positions
+    return None
+
+
+async def _positions_to_clear_async(
+    pages: AsyncIterator[list[dict[str, Any]]],
+) -> list[dict[str, Any]] | None:
+    stages.add("not_eligible")
+    positions: list[dict[str, Any]] = []
+    async for page in pages:
+        positions.extend(page)
+        if _has_discount(page):
+            async for rest in pages:
+                positions.extend(rest)
+            return positions
+    return None
+
+
+def _update_payload(result: DiscountResult) -> dict[str, Any]:
+    # PUT document with ALL positions to avoid deleting unchanged ones
+    return {"positions": result.all_positions}
+
+
+def _partial_update(settings: Settings, result: DiscountResult) -> bool:
+    """Send only the changed discounts? Small documents are cheaper as one PUT."""
+    threshold = settings.partial_update_min_positions
+    return threshold > 0 and len(result.all_positions) >= threshold
+
+
+def _partial_update_failed(doc_type: str, doc_id: str, exc: Exception) -> None:
+    stages.add("partial_update_fallback")
+    logging.warning("Bulk positions update of %s %s failed, falling back to PUT: %s",
+                    doc_type, doc_id, exc)
+
+
+@dataclass
+class _Calculation:
+    """Discounts to write, and the document they were calculated from."""
+    result: DiscountResult
+    document: dict[str, Any]
+
+
+def _partial_echo(calc: _Calculation) -> dict[str, Any]:
+    # the positions POST answers with positions, not the document: the
+    # agent we calculated for stands in, so a later agent change is no echo
+    return {"agent": calc.document.get("agent")}
+
+
+def _updated_result(client: MoySkladClient | AsyncMoySkladClient, doc_type: str, doc_id: str,
+                    response: dict[str, Any], result: DiscountResult) -> ProcessResult:
+    client.echo_guard.remember(
+        doc_type, doc_id, response, result.all_positions, result.loyalty_discount_sum,
+    )
+    stages.add("updated")
     logging.info(
         "Updated %d positions in %s %s (discount sum: %d)",
         result.changed_count, doc_type, doc_id, result.loyalty_discount_sum,
@@ -126,3 +282,381 @@ def process_document(
         updated_positions=result.changed_count,
         loyalty_discount_sum=result.loyalty_discount_sum,
     )
+
+
+# ------------------------------------------------------------------
+# main processor
+# ------------------------------------------------------------------
+
+def _calculate(
+    client: MoySkladClient,
+    settings: Settings,
+    doc_type: str,
+    doc_id: str,
+) -> ProcessResult | _Calculation:
+    """Steps up to the write: a final result, or the discounts to write."""
+    logging.info("Processing %s %s", doc_type, doc_id)
+    stages.add("documents")
+
+    # 1. fetch document with its first positions page; the counterparty's
+    #    loyalty profile is cached
+    document = client.get_document(doc_type, doc_id, expand=DOCUMENT_EXPAND)
+
+    # echo of our own PUT? — nothing changed since we wrote it
+    echo = client.echo_guard.check_document(doc_type, doc_id, document)
+    if echo is not None:
+        return _echo_result(doc_type, doc_id, echo.loyalty_discount_sum)
+
+    profile = loyalty_profile(client, settings, document)
+    eligible = profile.discount_percent > 0
+
+    # 2. fetch the rest of the positions (handles pagination); assortment
+    #    only matters when there is a discount to give; without one the
+    #    pages are checked as they arrive for a discount left to clear
+    if eligible:
+        positions = client.get_all_positions(doc_type, doc_id, expand=_positions_expand(eligible),
+                                             first_page=inline_positions(document))
+    else:
+        positions = _positions_to_clear(client.iter_positions(
+            doc_type, doc_id, expand=_positions_expand(eligible), first_page=inline_positions(document),
+        ))
+        if positions is None:
+            return _not_eligible_result(doc_type, doc_id)
+
+    echo = client.echo_guard.check_positions(doc_type, doc_id, document, positions)
+    if echo is not None:
+        return _echo_result(doc_type, doc_id, echo.loyalty_discount_sum)
+
+    if eligible:
+        # 3. enrich positions whose folder is unknown (needed for promo detection)
+        stages.add("enriched")
+        enrich_positions(client, positions)
+
+    # inject flat list into document so apply_discounts can read it
+    document["positions"] = positions
+
+    # 4. calculate discounts
+    result = apply_discounts(document, settings, client.promo_folders, profile.discount_percent)
+    done = _result_without_update(settings, doc_type, doc_id, result)
+    if done is not None:
+        return done
+    return _Calculation(result, document)
+
+
+def _write(client: MoySkladClient, settings: Settings, doc_type: str, doc_id: str,
+           calc: _Calculation) -> ProcessResult:
+    # 5. write back — only the changed positions on big documents
+    result = calc.result
+    if _partial_update(settings, result):
+        try:
+            client.update_positions(doc_type, doc_id, result.changed_positions)
+        except Exception as exc:
+            _partial_update_failed(doc_type, doc_id, exc)
+        else:
+            stages.add("partial_update")
+            return _updated_result(client, doc_type, doc_id, _partial_echo(calc), result)
+
+    response = client.update_document(doc_type, doc_id, _update_payload(result))
+    return _updated_result(client, doc_type, doc_id, response, result)
+
+
+def process_document(
+    client: MoySkladClient,
+    settings: Settings,
+    doc_type: str,
+    doc_id: str,
+) -> ProcessResult:
+    outcome = _calculate(client, settings, doc_type, doc_id)
+    if isinstance(outcome, ProcessResult):
+        return outcome
+    return _write(client, settings, doc_type, doc_id, outcome)
+
+
+async def _calculate_async(
+    client: AsyncMoySkladClient,
+    settings: Settings,
+    doc_type: str,
+    doc_id: str,
+) -> ProcessResult | _Calculation:
+    logging.info("Processing %s %s", doc_type, doc_id)
+    stages.add("documents")
+
+    document = await client.get_document(doc_type, doc_id, expand=DOCUMENT_EXPAND)
+
+    echo = client.echo_guard.check_document(doc_type, doc_id, document)
+    if echo is not None:
+        return _echo_result(doc_type, doc_id, echo.loyalty_discount_sum)
+
+    profile = await loyalty_profile_async(client, settings, document)
+    eligible = profile.discount_percent > 0
+
+    if eligible:
+        positions = await client.get_all_positions(doc_type, doc_id, expand=_positions_expand(eligible),
+                                                   first_page=inline_positions(document))
+    else:
+        positions = await _positions_to_clear_async(client.iter_positions(
+            doc_type, doc_id, expand=_positions_expand(eligible), first_page=inline_positions(document),
+        ))
+        if positions is None:
+            return _not_eligible_result(doc_type, doc_id)
+
+    echo = client.echo_guard.check_positions(doc_type, doc_id, document, positions)
+    if echo is not None:
+        return _echo_result(doc_type, doc_id, echo.loyalty_discount_sum)
+
+    if eligible:
+        stages.add("enriched")
+        await client.promo_folders.refresh_async(client)
+        if positions:
+            await _enrich_assortments_async(client, positions)
+
+    document["positions"] = positions
+
+    result = apply_discounts(document, settings, client.promo_folders, profile.discount_percent)
+    done = _result_without_update(settings, doc_type, doc_id, result)
+    if done is not None:
+        return done
+    return _Calculation(result, document)
+
+
+async def _write_async(client: AsyncMoySkladClient, settings: Settings, doc_type: str,
+                       doc_id: str, calc: _Calculation) -> ProcessResult:
+    result = calc.result
+    if _partial_update(settings, result):
+        try:
+            await client.update_positions(doc_type, doc_id, result.changed_positions)
+        except Exception as exc:
+            _partial_update_failed(doc_type, doc_id, exc)
+        else:
+            stages.add("partial_update")
+            return _updated_result(client, doc_type, doc_id, _partial_echo(calc), result)
+
+    response = await client.update_document(doc_type, doc_id, _update_payload(result))
+    return _updated_result(client, doc_type, doc_id, response, result)
+
+
+async def process_document_async(
+    client: AsyncMoySkladClient,
+    settings: Settings,
+    doc_type: str,
+    doc_id: str,
+) -> ProcessResult:
+    """``process_document`` for the async client — same steps, awaited I/O."""
+    outcome = await _calculate_async(client, settings, doc_type, doc_id)
+    if isinstance(outcome, ProcessResult):
+        return outcome
+    return await _write_async(client, settings, doc_type, doc_id, outcome)
+
+
+# ------------------------------------------------------------------
+# batches — many documents through one client and its caches
+# ------------------------------------------------------------------
+
+@dataclass
+class BatchItem:
+    doc_type: str
+    doc_id: str
+    result: ProcessResult | None  # None when processing raised
+    error: str | None
+    seconds: float
+
+    def as_dict(self) -> dict[str, Any]:
+        if self.result is None:
+            return {"doc_type": self.doc_type, "doc_id": self.doc_id,
+                    "updated": False, "reason": "error", "error": self.error}
+        return {
+            "doc_type": self.doc_type,
+            "doc_id": self.doc_id,
+            "updated": self.result.updated,
+            "reason": self.result.reason,
+            "positions": self.result.updated_positions,
+            "loyalty_discount_sum": self.result.loyalty_discount_sum,
+        }
+
+
+@dataclass
+class BatchResult:
+    items: list[BatchItem]  # one per distinct document, in input order
+    seconds: float          # wall clock of the whole batch
+
+    def summary(self) -> dict[str, Any]:
+        reasons = Counter(item.result.reason if item.result else "error" for item in self.items)
+        busy = sum(item.seconds for item in self.items)
+        return {
+            "documents": len(self.items),
+            "reasons": dict(reasons),
+            "seconds": round(self.seconds, 3),
+            "documents_per_second": round(len(self.items) / self.seconds, 1) if self.seconds else None,
+            # > 1 means documents really overlapped
+            "parallelism": round(busy / self.seconds, 2) if self.seconds else None,
+        }
+
+
+def unique_refs(refs: Iterable[tuple[str, str]]) -> list[tuple[str, str]]:
+    """``(doc_type, doc_id)`` pairs without repeats, first occurrence wins.
+
+    Processing reads the current state of a document, so a second run in
+    the same batch could only find nothing to do.
+    """
+    return list(dict.fromkeys((doc_type, doc_id) for doc_type, doc_id in refs))
+
+
+def _batch_item(doc_type: str, doc_id: str, started: float,
+                result: ProcessResult | None = None, exc: Exception | None = None) -> BatchItem:
+    if exc is not None:
+        logging.exception("Failed to process %s %s", doc_type, doc_id)
+    return BatchItem(doc_type, doc_id, result, None if exc is None else str(exc),
+                     time.perf_counter() - started)
+
+
+@dataclass
+class _PendingWrite:
+    doc_type: str
+    doc_id: str
+    result: DiscountResult
+    started: float
+
+
+def _bulk_write(client: MoySkladClient, pending: list[_PendingWrite]) -> dict[tuple[str, str], BatchItem]:
+    """Write the calculated documents with one mass update per type and chunk."""
+    items: dict[tuple[str, str], BatchItem] = {}
+    by_type: dict[str, list[_PendingWrite]] = {}
+    for write in pending:
+        by_type.setdefault(write.doc_type, []).append(write)
+    for doc_type, writes in by_type.items():
+        outcome = client.bulk_update_documents(
+            doc_type, {write.doc_id: _update_payload(write.result) for write in writes},
+        )
+        for write in writes:
+            ref = (doc_type, write.doc_id)
+            response = outcome.updated.get(write.doc_id)
+            if response is None:
+                error = outcome.failed.get(write.doc_id, "not written")
+                logging.error("Bulk update of %s %s failed: %s", doc_type, write.doc_id, error)
+                items[ref] = BatchItem(doc_type, write.doc_id, None, error,
+                                       time.perf_counter() - write.started)
+                continue
+            stages.add("bulk_update")
+            result = _updated_result(client, doc_type, write.doc_id, response, write.result)
+            items[ref] = _batch_item(doc_type, write.doc_id, write.started, result)
+    return items
+
+
+# a pending write goes out with the next few calculated documents, or
+# after a couple of seconds, not at the end of the batch: the longer a
+# document waits between its read and its write, the likelier someone
+# edits it in between and the mass update overwrites that edit
+BULK_FLUSH_DOCUMENTS = 8
+BULK_FLUSH_SECONDS = 2.0
+
+
+class _BulkBuffer:
+    """Pending writes shared by the batch workers, flushed by size or age."""
+
+    def __init__(self, client: MoySkladClient, size: int, max_age: float) -> None:
+        self.client = client
+        self.size = max(1, size)
+        self.max_age = max_age
+        self.written: dict[tuple[str, str], BatchItem] = {}
+        self._pending: list[_PendingWrite] = []
+        self._lock = threading.Lock()
+
+    def add(self, write: _PendingWrite) -> None:
+        with self._lock:
+            self._pending.append(write)
+            oldest = time.perf_counter() - self._pending[0].started
+            if len(self._pending) < self.size and oldest < self.max_age:
+                return
+            chunk, self._pending = self._pending, []
+        self._flush(chunk)
+
+    def close(self) -> None:
+        with self._lock:
+            chunk, self._pending = self._pending, []
+        if chunk:
+            self._flush(chunk)
+
+    def _flush(self, chunk: list[_PendingWrite]) -> None:
+        # in the calling worker, outside the lock: the others keep calculating
+        try:
+            items = _bulk_write(self.client, chunk)
+        except Exception as exc:
+            items = {(w.doc_type, w.doc_id): _batch_item(w.doc_type, w.doc_id, w.started, exc=exc)
+                     for w in chunk}
+        with self._lock:
+            self.written.update(items)
+
+
+def process_documents(
+    client: MoySkladClient,
+    settings: Settings,
+    refs: Iterable[tuple[str, str]],
+    concurrency: int = 4,
+    bulk_write: bool = False,
+    flush_documents: int = BULK_FLUSH_DOCUMENTS,
+    flush_seconds: float = BULK_FLUSH_SECONDS,
+) -> BatchResult:
+    """Process many documents, up to *concurrency* at a time.
+
+    All of them share the client's caches (counterparties, catalog, folder
+    index) and its rate limiter, which keeps the request rate within the
+    API limits however many documents are in flight.  A failure is
+    recorded on its item and does not stop the batch.
+
+    With *bulk_write* the documents that need a full PUT are written
+    together through ``bulk_update_documents``, every *flush_documents*
+    documents or once the oldest waited *flush_seconds* (checked as each
+    document is calculated), and the rest at the end; big documents still
+    send only their changed positions, one by one.
+    """
+    refs = unique_refs(refs)
+    started = time.perf_counter()
+    buffer = _BulkBuffer(client, flush_documents, flush_seconds) if bulk_write else None
+
+    def run(ref: tuple[str, str]) -> BatchItem | None:
+        doc_started = time.perf_counter()
+        try:
+            outcome = _calculate(client, settings, *ref)
+            if isinstance(outcome, _Calculation):
+                if buffer is not None and not _partial_update(settings, outcome.result):
+                    buffer.add(_PendingWrite(*ref, outcome.result, doc_started))
+                    return None
+                outcome = _write(client, settings, *ref, outcome)
+        except Exception as exc:
+            return _batch_item(*ref, doc_started, exc=exc)
+        return _batch_item(*ref, doc_started, outcome)
+
+    if concurrency <= 1 or len(refs) <= 1:
+        done = [run(ref) for ref in refs]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(refs))) as executor:
+            done = list(executor.map(run, refs))
+
+    if buffer is not None:
+        buffer.close()
+        done = [buffer.written[ref] if item is None else item for ref, item in zip(refs, done)]
+    return BatchResult(done, time.perf_counter() - started)
+
+
+async def process_documents_async(
+    client: AsyncMoySkladClient,
+    settings: Settings,
+    refs: Iterable[tuple[str, str]],
+    concurrency: int = 4,
+) -> BatchResult:
+    """``process_documents`` for the async client."""
+    refs = unique_refs(refs)
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(ref: tuple[str, str]) -> BatchItem:
+        async with slots:
+            doc_started = time.perf_counter()
+            try:
+                result = await process_document_async(client, settings, *ref)
+            except Exception as exc:
+                return _batch_item(*ref, doc_started, exc=exc)
+            return _batch_item(*ref, doc_started, result)
+
+    items = list(await asyncio.gather(*(run(ref) for ref in refs)))
+    return BatchResult(items, time.perf_counter() - started)
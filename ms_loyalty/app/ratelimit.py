@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping
+
+
+MAX_BACKOFF = 30.0
+
+
+def _header_ms(headers: Mapping[str, Any], name: str) -> float | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value)) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def retry_delay(status_code: int, headers: Mapping[str, Any], attempt: int, base: float) -> float:
+    """Seconds to wait before retry number *attempt* (0-based).
+
+    A 429 carries ``X-Lognex-Retry-After`` (milliseconds) — we wait that long
+    plus a little jitter so parallel callers don't all come back at once.
+    Everything else gets exponential backoff with full jitter.
+    """
+    if status_code == 429:
+        retry_after = _header_ms(headers, "X-Lognex-Retry-After")
+        if retry_after is not None:
+            return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(MAX_BACKOFF, base * (2 ** attempt)))
+
+
+class RateLimiter:
+    """Token bucket plus a cap on requests in flight, shared by one client.
+
+    MoySklad limits both the request rate per account and the number of
+    parallel requests per user.  Every thread that uses a client goes
+    through the same limiter, and a 429 or an exhausted
+    ``X-RateLimit-Remaining`` pauses all of them, not just the caller.
+
+    ``reserve()`` only does the bookkeeping and returns how long to wait,
+    so the async client can share the logic and sleep with asyncio.
+    """
+
+    def __init__(self, rate: float, burst: int, max_parallel: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_parallel = max(1, max_parallel)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._slots = threading.BoundedSemaphore(self.max_parallel)
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def reserve(self) -> float:
+        """Take a token; return the number of seconds to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if self.rate > 0:
+                self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+            self.requests += 1
+            if wait > 0:
+                self.throttled += 1
+                self.waited += wait
+            return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for *seconds* from now."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def note_headers(self, headers: Mapping[str, Any]) -> None:
+        """Follow the server's view of our budget."""
+        retry_after = _header_ms(headers, "X-Lognex-Retry-After")
+        if retry_after:
+            self.pause(retry_after)
+            return
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None and str(remaining).strip() in {"0", "1"}:
+            reset = _header_ms(headers, "X-Lognex-Reset")
+            if reset:
+                self.pause(reset)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Wait for a token and a free parallel slot (blocking)."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        with self._slots:
+            yield
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "max_parallel": self.max_parallel,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited, 3),
+            }
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_type             TEXT    NOT NULL,
+    doc_id               TEXT    NOT NULL,
+    updated              TEXT    NOT NULL,
+    moment               TEXT,
+    counterparty         TEXT,
+    sum                  REAL,
+    loyalty_discount_sum INTEGER NOT NULL,
+    PRIMARY KEY (doc_type, doc_id)
+);
+CREATE INDEX IF NOT EXISTS documents_moment ON documents (doc_type, moment);
+CREATE TABLE IF NOT EXISTS splits (  -- positions of a document per promo flag
+    doc_type     TEXT    NOT NULL,
+    doc_id       TEXT    NOT NULL,
+    promo        INTEGER NOT NULL,
+    positions    INTEGER NOT NULL,
+    line_sum     INTEGER NOT NULL,
+    discount_sum INTEGER NOT NULL,
+    PRIMARY KEY (doc_type, doc_id, promo)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    doc_type     TEXT PRIMARY KEY,
+    moment_from  TEXT NOT NULL,    -- every document of this range is in the store ...
+    moment_to    TEXT NOT NULL,
+    last_updated TEXT NOT NULL     -- ... as of this time: a sync start, in ``updated`` terms
+);
+"""
+
+# report columns -> table columns
+_COLUMNS = {
+    "documentType": "doc_type",
+    "documentId": "doc_id",
+    "moment": "moment",
+    "counterparty": "counterparty",
+    "sum": "sum",
+    "loyaltyDiscountSum": "loyalty_discount_sum",
+}
+
+CHUNK = 1000
+
+
+@dataclass
+class Coverage:
+    moment_from: str
+    moment_to: str
+    last_updated: str
+
+
+def sync_stamp(updated: str) -> str:
+    """``updated`` cut to what the API filter accepts (whole seconds)."""
+    return updated[:19]
+
+
+def missing_ranges(coverage: Coverage | None, moment_from: str, moment_to: str) -> list[tuple[str, str]]:
+    """Parts of ``[moment_from, moment_to]`` the store has never fully loaded.
+
+    The covered range only grows, so a gap between it and the request is
+    loaded too; ends overlap by design — loading is an upsert.
+    """
+    if coverage is None:
+        return [(moment_from, moment_to)]
+    ranges = []
+    if moment_from < coverage.moment_from:
+        ranges.append((moment_from, coverage.moment_from))
+    if moment_to > coverage.moment_to:
+        ranges.append((coverage.moment_to, moment_to))
+    return ranges
+
+
+class ReportStore:
+    """Local SQLite copy of report rows, keyed by document and ``updated``.
+
+    Incremental runs re-read only the documents MoySklad changed since
+    ``last_updated`` and export from here.  A document deleted in
+    MoySklad stays until the range is rebuilt (``reset``).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def coverage(self, doc_type: str) -> Coverage | None:
+        row = self.conn.execute(
+            "SELECT moment_from, moment_to, last_updated FROM coverage WHERE doc_type = ?", (doc_type,),
+        ).fetchone()
+        return Coverage(**dict(row)) if row is not None else None
+
+    def set_coverage(self, doc_type: str, coverage: Coverage) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO coverage (doc_type, moment_from, moment_to, last_updated)"
+                " VALUES (?, ?, ?, ?)",
+                (doc_type, coverage.moment_from, coverage.moment_to, coverage.last_updated),
+            )
+
+    def reset(self, doc_type: str) -> None:
+        """Forget everything stored for *doc_type*; the next run loads it in full."""
+        with self.conn:
+            self.conn.execute("DELETE FROM documents WHERE doc_type = ?", (doc_type,))
+            self.conn.execute("DELETE FROM splits WHERE doc_type = ?", (doc_type,))
+            self.conn.execute("DELETE FROM coverage WHERE doc_type = ?", (doc_type,))
+
+    def upsert(self, rows: list[tuple[dict[str, Any], str]],
+               splits: list[tuple[str, str, bool, int, int, int]] = ()) -> None:
+        """Store ``(report row, updated)`` pairs in one transaction.
+
+        The splits of those documents — ``(type, id, promo, positions,
+        line sum, discount sum)`` — replace the stored ones.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM splits WHERE doc_type = ? AND doc_id = ?",
+                [(row["documentType"], row["documentId"]) for row, _ in rows],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO splits"
+                " (doc_type, doc_id, promo, positions, line_sum, discount_sum) VALUES (?, ?, ?, ?, ?, ?)",
+                [(doc_type, doc_id, bool(promo), int(positions), int(line_sum), int(discount_sum))
+                 for doc_type, doc_id, promo, positions, line_sum, discount_sum in splits],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO documents"
+                " (doc_type, doc_id, updated, moment, counterparty, sum, loyalty_discount_sum)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (row["documentType"], row["documentId"], updated, row["moment"],
+                     row["counterparty"], row["sum"], row["loyaltyDiscountSum"])
+                    for row, updated in rows
+                ],
+            )
+
+    def iter_rows(self, doc_types: list[str], moment_from: str,
+                  moment_to: str) -> Iterator[list[dict[str, Any]]]:
+        """Report rows of the range, per type and by moment, in chunks of ``CHUNK``."""
+        select = ", ".join(f"{column} AS {name}" for name, column in _COLUMNS.items())
+        for doc_type in doc_types:
+            cursor = self.conn.execute(
+                # ``moment`` carries milliseconds, the range ends do not
+                f"SELECT {select} FROM documents"
+                " WHERE doc_type = ? AND moment >= ? AND substr(moment, 1, 19) <= ?"
+                " ORDER BY moment, doc_id",
+                (doc_type, moment_from, moment_to),
+            )
+            while True:
+                chunk = cursor.fetchmany(CHUNK)
+                if not chunk:
+                    break
+                yield [dict(row) for row in chunk]
+
+    def iter_splits(self, doc_types: list[str], moment_from: str,
+                    moment_to: str) -> Iterator[list[dict[str, Any]]]:
+        """Splits of the range's documents with their ``moment`` and ``counterparty``."""
+        for doc_type in doc_types:
+            cursor = self.conn.execute(
+                "SELECT s.doc_type AS documentType, s.doc_id AS documentId, d.moment AS moment,"
+                " d.counterparty AS counterparty, s.promo AS promo, s.positions AS positions,"
+                " s.line_sum AS lineSum, s.discount_sum AS discountSum"
+                " FROM splits s JOIN documents d ON d.doc_type = s.doc_type AND d.doc_id = s.doc_id"
+                " WHERE d.doc_type = ? AND d.moment >= ? AND substr(d.moment, 1, 19) <= ?",
+                (doc_type, moment_from, moment_to),
+            )
+            while True:
+                chunk = cursor.fetchmany(CHUNK)
+                if not chunk:
+                    break
+                yield [dict(row, promo=bool(row["promo"])) for row in chunk]
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+@dataclass
+class Job:
+    doc_type: str
+    doc_id: str
+    action: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    due: float = 0.0
+    events: int = 1
+    journal_ids: list[int] = field(default_factory=list)
+
+
+# ------------------------------------------------------------------
+# latency tracking
+# ------------------------------------------------------------------
+
+class LatencyStats:
+    """Running latency figures plus a window of recent samples for percentiles."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._recent: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total, max_ = self.count, self.total, self.max
+
+        def pct(p: float) -> float:
+            if not recent:
+                return 0.0
+            idx = min(len(recent) - 1, int(round(p * (len(recent) - 1))))
+            return round(recent[idx] * 1000, 2)
+
+        return {
+            "count": count,
+            "avg_ms": round(total / count * 1000, 2) if count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(max_ * 1000, 2),
+        }
+
+
+# ------------------------------------------------------------------
+# worker pool
+# ------------------------------------------------------------------
+
+class WorkerPool:
+    """Background threads that drain webhook jobs and run *handler* on each.
+
+    *handler* is called as ``handler(doc_type, doc_id)``; it is expected to
+    be the blocking ``process_document`` bound to a client and settings.
+    *on_finish*, if given, is called as ``on_finish(job, error)`` after every
+    run (``error`` is None on success) — used to settle journal entries.
+
+    Jobs are debounced per document: a job becomes due *debounce* seconds
+    after the first event for that ``(doc_type, doc_id)``, and further events
+    arriving meanwhile are merged into it.  An event for a document that is
+    being processed right now schedules a single follow-up run instead of a
+    parallel one.
+    """
+
+    def __init__(self, handler: Callable[[str, str], Any], workers: int,
+                 max_queue: int = 0, debounce: float = 0.0,
+                 on_finish: Callable[[Job, Exception | None], None] | None = None) -> None:
+        self.handler = handler
+        self.on_finish = on_finish
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.debounce = max(0.0, debounce)
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, tuple[str, str]]] = []
+        self._seq = 0
+        self._pending: dict[tuple[str, str], Job] = {}
+        self._running: set[tuple[str, str]] = set()
+        self._followups: dict[tuple[str, str], Job] = {}
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.followups = 0
+        self.wait_latency = LatencyStats()
+        self.run_latency = LatencyStats()
+
+    # ------------------------------------------------------------------
+    # lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping = False
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"webhook-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info("Started %d webhook workers (debounce %.2fs)", self.workers, self.debounce)
+
+    def stop(self, timeout: float | None = 10.0) -> None:
+        """Run whatever is still scheduled without waiting for debounce, then join."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # ------------------------------------------------------------------
+    # producer side
+    # ------------------------------------------------------------------
+
+    def submit(self, doc_type: str, doc_id: str, action: str,
+               journal_id: int | None = None) -> bool:
+        """Schedule a job; returns False if the queue is full."""
+        return self.submit_all([(doc_type, doc_id, action, journal_id)])
+
+    def submit_all(self, events: list[tuple[str, str, str, int | None]]) -> bool:
+        """Schedule ``(doc_type, doc_id, action, journal_id)`` events all or none.
+
+        Returns False, queueing nothing, if the jobs they need do not all
+        fit — a delivery answered with 503 is redelivered as a whole.
+        """
+        with self._cond:
+            if self.max_queue:
+                new = {(doc_type, doc_id) for doc_type, doc_id, _, _ in events
+                       if self._mergeable((doc_type, doc_id)) is None}
+                if len(self._pending) + len(self._followups) + len(new) > self.max_queue:
+                    self.rejected += len(events)
+                    logging.warning("Webhook queue full, rejecting %d events", len(events))
+                    return False
+            for doc_type, doc_id, action, journal_id in events:
+                self._add(doc_type, doc_id, action, journal_id)
+        return True
+
+    def _mergeable(self, key: tuple[str, str]) -> Job | None:
+        # caller holds self._cond; the queued job a new event would merge into
+        merged = self._pending.get(key)
+        if merged is None and key in self._running:
+            merged = self._followups.get(key)
+        return merged
+
+    def _add(self, doc_type: str, doc_id: str, action: str, journal_id: int | None) -> None:
+        # caller holds self._cond and has checked the queue has room
+        key = (doc_type, doc_id)
+        merged = self._mergeable(key)
+        if merged is not None:
+            merged.events += 1
+            if journal_id is not None:
+                merged.journal_ids.append(journal_id)
+            self.coalesced += 1
+            return
+
+        job = Job(doc_type, doc_id, action)
+        if journal_id is not None:
+            job.journal_ids.append(journal_id)
+        if key in self._running:
+            self._followups[key] = job
+            self.followups += 1
+        else:
+            self._schedule(key, job)
+
+    def _schedule(self, key: tuple[str, str], job: Job) -> None:
+        # caller holds self._cond
+        job.due = time.monotonic() + self.debounce
+        self._pending[key] = job
+        self._seq += 1
+        heapq.heappush(self._heap, (job.due, self._seq, key))
+        self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # consumer side
+    # ------------------------------------------------------------------
+
+    def _next_job(self) -> Job | None:
+        with self._cond:
+            while True:
+                if self._heap:
+                    due, _, key = self._heap[0]
+                    delay = due - time.monotonic()
+                    if delay <= 0 or self._stopping:
+                        heapq.heappop(self._heap)
+                        job = self._pending.pop(key)
+                        self._running.add(key)
+                        return job
+                    self._cond.wait(delay)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _finish(self, job: Job, ok: bool) -> None:
+        key = (job.doc_type, job.doc_id)
+        with self._cond:
+            self._running.discard(key)
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+            followup = self._followups.pop(key, None)
+            if followup is not None:
+                self._schedule(key, followup)
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            started = time.monotonic()
+            self.wait_latency.add(started - job.enqueued_at)
+            error: Exception | None = None
+            try:
+                self.handler(job.doc_type, job.doc_id)
+            except Exception as exc:
+                error = exc
+                logging.exception("Failed to process %s %s", job.doc_type, job.doc_id)
+            finally:
+                self.run_latency.add(time.monotonic() - started)
+                if self.on_finish is not None:
+                    try:
+                        self.on_finish(job, error)
+                    except Exception:
+                        logging.exception("on_finish failed for %s %s", job.doc_type, job.doc_id)
+                self._finish(job, error is None)
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Block until nothing is scheduled or running (used by tests)."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not (self._pending or self._running or self._followups),
+                timeout,
+            )
+
+    # ------------------------------------------------------------------
+    # stats
+    # ------------------------------------------------------------------
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": len(self._threads),
+                "busy": len(self._running),
+                "queue_depth": len(self._pending) + len(self._followups),
+                "debounce_seconds": self.debounce,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "coalesced": self.coalesced,
+                "followups": self.followups,
+                "wait": self.wait_latency.snapshot(),
+                "run": self.run_latency.snapshot(),
+            }
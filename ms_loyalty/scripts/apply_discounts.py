@@ -1,38 +1,209 @@
-﻿from __future__ import annotations
+﻿"""Recalculate loyalty discounts for one document or a list of them.
+
+Usage:
+    python -m ms_loyalty.scripts.apply_discounts --type customerorder --id <uuid>
+    python -m ms_loyalty.scripts.apply_discounts --type customerorder --ids-file ids.txt
+    cat refs.txt | python -m ms_loyalty.scripts.apply_discounts --ids-file -
+
+    # backfill: every document of the range, resumable
+    python -m ms_loyalty.scripts.apply_discounts --from 2025-01-01 --to 2025-03-31 \
+        --filter "applicable=true" --checkpoint backfill.txt --dry-run
+
+A list has one document per line: ``<id>`` (with ``--type``) or
+``<type> <id>``; blank lines and ``#`` comments are skipped.  The
+checkpoint file has the same format and lists the documents a backfill
+has written; a rerun with it skips them.  A dry run only reads it — it
+writes nothing, so nothing is recorded as done.
+"""
+from __future__ import annotations
 
 import argparse
+import json
 import logging
+import sys
+import time
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime
+from datetime import time as day_time
 from pathlib import Path
+from typing import Any, Iterable, Iterator, TextIO
 
 from dotenv import load_dotenv
 
 from ms_loyalty.app.config import Settings
-from ms_loyalty.app.moysklad import MoySkladClient
-from ms_loyalty.app.processor import process_document
+from ms_loyalty.app.moysklad import MoySkladClient, moment_filter
+from ms_loyalty.app.processor import BatchResult, process_documents
+
+
+def parse_refs(lines: Iterable[str], default_type: str | None) -> Iterator[tuple[str, str]]:
+    for number, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.replace(",", " ").split()
+        if len(parts) == 1 and default_type:
+            yield default_type, parts[0]
+        elif len(parts) == 2:
+            yield parts[0], parts[1]
+        else:
+            raise ValueError(f"line {number}: expected '<id>' with --type or '<type> <id>', got {line!r}")
+
+
+# ------------------------------------------------------------------
+# backfill
+# ------------------------------------------------------------------
+
+class Checkpoint:
+    """Documents an earlier run already finished; appended as we go."""
+
+    def __init__(self, path: str | None) -> None:
+        self.path = path
+        self.done: set[tuple[str, str]] = set()
+        if path and Path(path).exists():
+            with open(path, encoding="utf-8") as fh:
+                self.done = set(parse_refs(fh, None))
+
+    def __contains__(self, ref: tuple[str, str]) -> bool:
+        return ref in self.done
+
+    def add(self, refs: list[tuple[str, str]]) -> None:
+        self.done.update(refs)
+        if not self.path or not refs:
+            return
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.writelines(f"{doc_type} {doc_id}\n" for doc_type, doc_id in refs)
+
+
+class Progress:
+    """Running totals of a backfill."""
+
+    def __init__(self, dry_run: bool) -> None:
+        self.dry_run = dry_run
+        self.started = time.perf_counter()
+        self.reasons: Counter[str] = Counter()
+        self.documents = 0
+        self.skipped = 0
+        self.positions = 0
+        self.discount_sum = 0
+        self.latencies: list[float] = []  # seconds per document
+
+    def add(self, batch: BatchResult) -> None:
+        for item in batch.items:
+            self.documents += 1
+            self.latencies.append(item.seconds)
+            if item.result is None:
+                self.reasons["error"] += 1
+                continue
+            self.reasons[item.result.reason] += 1
+            self.discount_sum += item.result.loyalty_discount_sum
+            if item.result.reason in {"updated", "dry_run"}:
+                self.positions += item.result.updated_positions
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        rate = self.documents / elapsed if elapsed else 0.0
+        verb = "to change" if self.dry_run else "changed"
+        return (f"{self.documents} documents ({self.skipped} skipped), {rate:.1f} doc/s, "
+                f"{self.changed_documents()} {verb}, {self.reasons['error']} errors")
+
+    def changed_documents(self) -> int:
+        return self.reasons["updated"] + self.reasons["dry_run"]
+
+    def summary(self) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "dry_run": self.dry_run,
+            "documents": self.documents,
+            "skipped": self.skipped,
+            "reasons": dict(self.reasons),
+            "changed_documents": self.changed_documents(),
+            "changed_positions": self.positions,
+            "loyalty_discount_sum": self.discount_sum,
+            "seconds": round(elapsed, 1),
+            "documents_per_second": round(self.documents / elapsed, 1) if elapsed else None,
+        }
+
+
+def backfill(client: MoySkladClient, settings: Settings, doc_types: list[str], filter_expr: str,
+             checkpoint: Checkpoint, concurrency: int, out: TextIO = sys.stderr) -> Progress:
+    """Process every document of *doc_types* matching *filter_expr*, page by page."""
+    progress = Progress(settings.dry_run)
+    for doc_type in doc_types:
+        for page in client.iter_documents(doc_type, filter_expr):
+            refs = [(doc_type, row["id"]) for row in page if row.get("id")]
+            todo = [ref for ref in refs if ref not in checkpoint]
+            progress.skipped += len(refs) - len(todo)
+            if not todo:
+                continue
+            batch = process_documents(client, settings, todo, concurrency=concurrency,
+                                      bulk_write=True)
+            progress.add(batch)
+            if not settings.dry_run:
+                checkpoint.add([(i.doc_type, i.doc_id) for i in batch.items if i.result is not None])
+            print(f"{doc_type}: {progress.line()}", file=out, flush=True)
+    return progress
+
+
+def _day(value: str, at: day_time) -> datetime:
+    return datetime.combine(datetime.strptime(value, "%Y-%m-%d").date(), at)
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--type", required=True, dest="doc_type")
-    parser.add_argument("--id", required=True, dest="doc_id")
+    parser.add_argument("--type", dest="doc_type")
+    parser.add_argument("--id", dest="doc_id")
+    parser.add_argument("--ids-file", help="file with one document per line, '-' for stdin")
+    parser.add_argument("--from", dest="date_from", help="backfill: start date YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="backfill: end date YYYY-MM-DD")
+    parser.add_argument("--filter", default="", help="backfill: extra MoySklad filter, e.g. applicable=true")
+    parser.add_argument("--checkpoint", help="backfill: file of finished documents, resumes a run")
+    parser.add_argument("--dry-run", action="store_true", help="calculate only, overrides DRY_RUN")
+    parser.add_argument("--concurrency", type=int, help="documents in flight (default BATCH_CONCURRENCY)")
     args = parser.parse_args()
+    is_backfill = bool(args.date_from or args.date_to or args.filter)
+    if args.doc_id and not args.doc_type:
+        parser.error("--id needs --type")
+    if is_backfill and (args.doc_id or args.ids_file):
+        parser.error("--from/--to/--filter cannot be combined with --id / --ids-file")
+    if not (is_backfill or args.doc_id or args.ids_file):
+        parser.error("give --id, --ids-file or a backfill range")
 
     load_dotenv(Path(__file__).resolve().parents[1] / ".env")
     settings = Settings.from_env()
+    if args.dry_run:
+        settings = replace(settings, dry_run=True)
     logging.basicConfig(level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
-
     client = MoySkladClient(settings)
-    result = process_document(client, settings, args.doc_type, args.doc_id)
-    print({
-        "doc_type": args.doc_type,
-        "doc_id": args.doc_id,
-        "updated": result.updated,
-        "reason": result.reason,
-        "positions": result.updated_positions,
-        "loyalty_discount_sum": result.loyalty_discount_sum,
-    })
-    return 0
+    concurrency = args.concurrency or settings.batch_concurrency
+
+    if is_backfill:
+        dt_from = _day(args.date_from, day_time.min) if args.date_from else None
+        dt_to = _day(args.date_to, day_time.max) if args.date_to else None
+        filter_expr = ";".join(part for part in (moment_filter(dt_from, dt_to), args.filter) if part)
+        doc_types = [args.doc_type] if args.doc_type else settings.document_types
+        progress = backfill(client, settings, doc_types, filter_expr,
+                            Checkpoint(args.checkpoint), concurrency)
+        print(json.dumps(progress.summary(), ensure_ascii=False))
+        return 1 if progress.reasons["error"] else 0
+
+    refs: list[tuple[str, str]] = []
+    if args.doc_id:
+        refs.append((args.doc_type, args.doc_id))
+    if args.ids_file == "-":
+        refs.extend(parse_refs(sys.stdin, args.doc_type))
+    elif args.ids_file:
+        with open(args.ids_file, encoding="utf-8") as fh:
+            refs.extend(parse_refs(fh, args.doc_type))
+
+    batch = process_documents(client, settings, refs, concurrency=concurrency,
+                              bulk_write=len(refs) > 1)
+    for item in batch.items:
+        print(item.as_dict())
+    if len(batch.items) > 1:
+        print(json.dumps(batch.summary(), ensure_ascii=False), file=sys.stderr)
+    return 1 if any(item.result is None for item in batch.items) else 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(main())
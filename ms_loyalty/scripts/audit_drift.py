@@ -0,0 +1,211 @@
+"""Find documents whose position discounts differ from what the service would set.
+
+Usage:
+    python -m ms_loyalty.scripts.audit_drift --from 2025-01-01 --to 2025-03-31 --out drift.csv
+    python -m ms_loyalty.scripts.audit_drift --from 2025-01-01 --to 2025-03-31 --fix
+
+    # or pipe the drifted documents into reprocessing
+    python -m ms_loyalty.scripts.audit_drift --from 2025-01-01 --to 2025-01-31 \\
+        | python -m ms_loyalty.scripts.apply_discounts --ids-file -
+
+Documents are listed page by page and their positions fetched by a
+bounded pool through the shared caches, as in ``export_report``.  Each
+page becomes a columnar frame; expected discounts are derived from a
+small table of distinct product folders and compared in one vectorized
+pass instead of running ``apply_discounts`` per document.
+
+Drifted documents go to stdout as ``<type> <id>`` lines, per-position
+deltas to ``--out`` (CSV), the summary to stderr.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time as clock
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from ms_loyalty.app.config import Settings
+from ms_loyalty.app.counterparty import loyalty_profile
+from ms_loyalty.app.folders import PromoFolderIndex
+from ms_loyalty.app.logic import CompiledRules, compile_rules, position_records
+from ms_loyalty.app.money import line_total
+from ms_loyalty.app.moysklad import MoySkladClient, moment_filter
+from ms_loyalty.app.processor import enrich_positions, process_documents
+
+DRIFT_COLUMNS = ["documentType", "documentId", "positionId", "actual", "expected", "delta"]
+# discounts are sent as floats; anything closer than this is the same discount
+TOLERANCE = 1e-6
+
+
+# ------------------------------------------------------------------
+# columnar frame
+# ------------------------------------------------------------------
+
+def position_frame(doc_type: str, documents: list[tuple[str, float, int, list[dict[str, Any]]]]) -> pd.DataFrame:
+    """One row per position of ``(doc_id, agent percent, order sum, positions)`` tuples."""
+    doc_ids: list[str] = []
+    percents: list[float] = []
+    order_sums: list[int] = []
+    position_ids: list[Any] = []
+    folders: list[str] = []
+    paths: list[str] = []
+    discounts: list[Any] = []
+    for doc_id, percent, order_sum, positions in documents:
+        records = position_records(positions)
+        doc_ids.extend([doc_id] * len(records))
+        percents.extend([percent] * len(records))
+        order_sums.extend([order_sum] * len(records))
+        for rec in records:
+            position_ids.append(rec.id)
+            folders.append(rec.folder_href or "")
+            paths.append(rec.path_name)
+            discounts.append(rec.discount)
+    return pd.DataFrame({
+        "documentType": doc_type,
+        "documentId": doc_ids,
+        "positionId": position_ids,
+        "percent": np.asarray(percents, dtype=float),
+        "orderSum": np.asarray(order_sums, dtype=np.int64),
+        "folder": folders,
+        "path": paths,
+        "actual": pd.to_numeric(pd.Series(discounts, dtype=object), errors="coerce").fillna(0.0).to_numpy(float),
+    })
+
+
+def _place_rates(places: pd.DataFrame, rules: CompiledRules,
+                 promo_folders: PromoFolderIndex | None) -> pd.Series:
+    """Rate fixed by the product folder (0 for promo), NaN where the document's percent applies."""
+    rates = []
+    for folder, path in places.itertuples(index=False):
+        if rules.is_promo(folder or None, path, promo_folders):
+            rates.append(0.0)
+            continue
+        rate = rules.folder_rate(folder or None, promo_folders)
+        rates.append(np.nan if rate is None else float(rate))
+    return pd.Series(rates, index=places.index, dtype=float)
+
+
+def expected_discounts(frame: pd.DataFrame, rules: CompiledRules,
+                       promo_folders: PromoFolderIndex | None = None) -> np.ndarray:
+    """What ``apply_discounts`` would set for every row of *frame*, vectorized.
+
+    Folder-level decisions are made once per distinct (folder, pathName)
+    pair; tiers and precedence are array operations.
+    """
+    if frame.empty:
+        return np.zeros(0)
+    places = frame[["folder", "path"]].drop_duplicates()
+    places = places.assign(rate=_place_rates(places, rules, promo_folders))
+    place_rate = frame[["folder", "path"]].merge(places, on=["folder", "path"], how="left")["rate"].to_numpy()
+
+    percent = frame["percent"].to_numpy()
+    if rules.tier_thresholds:
+        thresholds = np.asarray(rules.tier_thresholds, dtype=np.int64)
+        tier_rates = np.asarray([0.0, *map(float, rules.tier_rates)])
+        reached = np.searchsorted(thresholds, frame["orderSum"].to_numpy(), side="right")
+        percent = np.maximum(percent, tier_rates[reached])
+
+    expected = np.where(np.isnan(place_rate), percent, place_rate)
+    # tiers and folder rates are for loyalty members only
+    return np.where(frame["percent"].to_numpy() > 0, expected, 0.0)
+
+
+def drifted_rows(frame: pd.DataFrame, expected: np.ndarray) -> pd.DataFrame:
+    delta = expected - frame["actual"].to_numpy()
+    mask = np.abs(delta) > TOLERANCE
+    return frame.loc[mask, ["documentType", "documentId", "positionId", "actual"]].assign(
+        expected=expected[mask], delta=delta[mask],
+    )
+
+
+# ------------------------------------------------------------------
+# fetching
+# ------------------------------------------------------------------
+
+def _load_document(client: MoySkladClient, settings: Settings, rules: CompiledRules,
+                   doc_type: str, doc: dict[str, Any]) -> tuple[str, float, int, list[dict[str, Any]]]:
+    profile = loyalty_profile(client, settings, doc)
+    eligible = profile.discount_percent > 0
+    # the folder only matters for loyalty members, as in the webhook path
+    positions = client.get_all_positions(doc_type, doc["id"], expand="assortment" if eligible else None)
+    order_sum = 0
+    if eligible:
+        enrich_positions(client, positions)
+        if rules.tier_thresholds:
+            order_sum = sum(line_total(pos.get("price"), pos.get("quantity")) for pos in positions)
+    return doc["id"], float(profile.discount_percent), order_sum, positions
+
+
+def audit_page(client: MoySkladClient, settings: Settings, executor: ThreadPoolExecutor,
+               doc_type: str, page: list[dict[str, Any]]) -> tuple[int, pd.DataFrame]:
+    """(positions checked, drifted positions) of one page of documents."""
+    rules = compile_rules(settings)
+    documents = list(executor.map(
+        lambda doc: _load_document(client, settings, rules, doc_type, doc), page,
+    ))
+    frame = position_frame(doc_type, documents)
+    return len(frame), drifted_rows(frame, expected_discounts(frame, rules, client.promo_folders))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Audit loyalty discounts for drift")
+    parser.add_argument("--from", dest="date_from", required=True, help="Start date YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", required=True, help="End date YYYY-MM-DD")
+    parser.add_argument("--type", dest="doc_type", help="one document type (default DOCUMENT_TYPES)")
+    parser.add_argument("--out", help="CSV file for the drifted positions")
+    parser.add_argument("--fix", action="store_true", help="reprocess the drifted documents")
+    parser.add_argument("--workers", type=int, help="documents in flight (default BATCH_CONCURRENCY)")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+    settings = Settings.from_env()
+    logging.basicConfig(level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s",
+                        stream=sys.stderr)
+
+    dt_from = datetime.combine(datetime.strptime(args.date_from, "%Y-%m-%d").date(), time.min)
+    dt_to = datetime.combine(datetime.strptime(args.date_to, "%Y-%m-%d").date(), time.max)
+    doc_types = [args.doc_type] if args.doc_type else settings.document_types
+    workers = args.workers or settings.batch_concurrency
+
+    client = MoySkladClient(settings)
+    started = clock.perf_counter()
+    documents = positions = 0
+    drifted: list[tuple[str, str]] = []
+    if args.out:
+        pd.DataFrame(columns=DRIFT_COLUMNS).to_csv(args.out, index=False)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for doc_type in doc_types:
+            for page in client.iter_documents(doc_type, moment_filter(dt_from, dt_to), expand="agent"):
+                checked, rows = audit_page(client, settings, executor, doc_type, page)
+                documents += len(page)
+                positions += checked
+                refs = list(dict.fromkeys(zip(rows["documentType"], rows["documentId"])))
+                drifted.extend(refs)
+                for ref in refs:
+                    print(*ref, flush=True)
+                if args.out and not rows.empty:
+                    rows[DRIFT_COLUMNS].to_csv(args.out, mode="a", header=False, index=False)
+                logging.info("%d documents, %d positions checked, %d drifted",
+                             documents, positions, len(drifted))
+
+    elapsed = clock.perf_counter() - started
+    print(f"Checked {documents} documents / {positions} positions in {elapsed:.1f}s: "
+          f"{len(drifted)} documents drifted", file=sys.stderr)
+
+    if args.fix and drifted:
+        batch = process_documents(client, settings, drifted, concurrency=workers, bulk_write=True)
+        print(f"Reprocessed: {batch.summary()}", file=sys.stderr)
+        return 1 if any(item.result is None for item in batch.items) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,70 @@
+"""Compare the sync and async MoySklad clients on the local fake MoySklad.
+
+Starts ``fake_moysklad`` with a fixed per-request latency and documents of
+loyalty members only, then processes the same documents with
+``process_document`` (one after another, as the webhook used to) and with
+``process_document_async`` (all documents awaited concurrently).
+
+Usage:
+    python -m ms_loyalty.scripts.bench_clients --docs 20 --positions 250 --latency 30
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from dataclasses import replace
+
+from ms_loyalty.app.config import Settings
+from ms_loyalty.app.moysklad import MoySkladClient
+from ms_loyalty.app.moysklad_async import AsyncMoySkladClient
+from ms_loyalty.app.processor import process_document, process_document_async
+from ms_loyalty.scripts.fake_moysklad import FakeConfig, FakeMoySklad
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async MoySklad clients")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--positions", type=int, default=250)
+    parser.add_argument("--latency", type=float, default=30, help="Fake latency per request, ms")
+    args = parser.parse_args()
+
+    fake = FakeMoySklad(FakeConfig(
+        doc_types=("customerorder",), documents=args.docs, positions=(args.positions, args.positions),
+        member_share=1.0, latency_ms=args.latency,
+    )).start()
+
+    settings = replace(
+        Settings.from_env(),
+        base_url=fake.base_url, auth_mode="bearer", token="bench", dry_run=True,
+        rate_limit_per_second=0, echo_ttl_seconds=0,
+    )
+    doc_ids = fake.document_ids("customerorder")
+
+    started = time.perf_counter()
+    client = MoySkladClient(settings)
+    for doc_id in doc_ids:
+        process_document(client, settings, "customerorder", doc_id)
+    sync_elapsed = time.perf_counter() - started
+
+    async def run_async() -> float:
+        async with AsyncMoySkladClient(settings) as aclient:
+            t0 = time.perf_counter()
+            await asyncio.gather(*(
+                process_document_async(aclient, settings, "customerorder", doc_id)
+                for doc_id in doc_ids
+            ))
+            return time.perf_counter() - t0
+
+    async_elapsed = asyncio.run(run_async())
+    fake.stop()
+
+    print(f"{args.docs} documents x {args.positions} positions, {args.latency:.0f} ms per request")
+    for name, elapsed in (("sync", sync_elapsed), ("async", async_elapsed)):
+        print(f"  {name:<6} {elapsed:8.2f} s  {args.docs / elapsed:8.1f} docs/s")
+    print(f"  speedup {sync_elapsed / async_elapsed:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+"""Micro-benchmark of ``apply_discounts`` on large synthetic documents.
+
+Times the current implementation against ``reference_apply_discounts`` — the
+straightforward dict/Decimal version it replaced, kept with the tests in
+``tests/reference.py`` — and checks that both return the same ``DiscountResult``.
+
+Usage:
+    python -m ms_loyalty.scripts.bench_logic --positions 10000 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import replace
+from decimal import Decimal
+
+from ms_loyalty.app.logic import apply_discounts
+from ms_loyalty.app.money import discount_amount, percent_rate
+from ms_loyalty.tests.helpers import make_settings
+from ms_loyalty.tests.reference import make_document, reference_amount, reference_apply_discounts
+
+
+def _best(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the discount calculation")
+    parser.add_argument("--positions", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    settings = make_settings()
+    document = make_document(args.positions)
+
+    if apply_discounts(document, settings) != reference_apply_discounts(document, settings):
+        print("MISMATCH: results differ from the reference implementation")
+        return 1
+    ineligible = make_document(args.positions, percent=0)
+    if apply_discounts(ineligible, settings) != reference_apply_discounts(ineligible, settings):
+        print("MISMATCH: results differ for an ineligible agent")
+        return 1
+
+    reference = _best(lambda: reference_apply_discounts(document, settings), args.repeat)
+    current = _best(lambda: apply_discounts(document, settings), args.repeat)
+    # without pathName the promo check is not the bottleneck
+    bare = replace(settings, promo_group_name="")
+    reference_bare = _best(lambda: reference_apply_discounts(document, bare), args.repeat)
+    current_bare = _best(lambda: apply_discounts(document, bare), args.repeat)
+
+    # the money core alone: one amount per position, as export_report does in bulk
+    pairs = [(row["price"], row["quantity"]) for row in document["positions"]]
+    percent = Decimal("7.5")
+    rate = percent_rate(percent)
+    if [reference_amount(p, q, percent) for p, q in pairs] != [discount_amount(p, q, rate) for p, q in pairs]:
+        print("MISMATCH: integer amounts differ from Decimal")
+        return 1
+    reference_money = _best(lambda: [reference_amount(p, q, percent) for p, q in pairs], args.repeat)
+    current_money = _best(lambda: [discount_amount(p, q, rate) for p, q in pairs], args.repeat)
+
+    print(f"{args.positions} positions, best of {args.repeat}; results identical")
+    for name, ref, cur in (("promo by pathName", reference, current),
+                           ("no promo folder", reference_bare, current_bare),
+                           ("amounts only", reference_money, current_money)):
+        print(f"  {name:<18} reference {ref * 1000:8.1f} ms   current {cur * 1000:8.1f} ms"
+              f"   {ref / cur:4.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,279 @@
+"""End-to-end throughput benchmarks against the local fake MoySklad.
+
+Starts ``fake_moysklad`` with seeded documents and runs, each on fresh
+data and cold caches:
+
+* ``webhook``  — the service under uvicorn; one webhook per document,
+  ``--concurrency`` deliveries at a time; latency per request.
+* ``backfill`` — ``apply_discounts`` over every seeded document (bulk
+  writes); latency per document.
+* ``export``   — ``export_report`` pages into a temporary .xlsx with the
+  aggregate sheets; latency per page.
+
+Each reports documents per second, p50 / p99 latency and API calls per
+document, and the whole run is saved as JSON; ``--baseline`` prints the
+change against an earlier file, e.g. one made on another commit.
+
+Usage:
+    python -m ms_loyalty.scripts.bench_suite --docs 200 --latency 30 --out bench.json
+    python -m ms_loyalty.scripts.bench_suite --docs 200 --latency 30 --baseline bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import requests
+
+from ms_loyalty.app.config import Settings
+from ms_loyalty.app.moysklad import MoySkladClient
+from ms_loyalty.scripts.apply_discounts import Checkpoint, backfill
+from ms_loyalty.scripts.export_report import Aggregates, iter_report_pages, open_report
+from ms_loyalty.scripts.fake_moysklad import FakeConfig, FakeMoySklad
+
+SCENARIOS = ("webhook", "backfill", "export")
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile; ``None`` for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class Run:
+    name: str
+    documents: int
+    seconds: float
+    latencies: list[float]          # seconds, one per ``unit``
+    unit: str                       # document | request | page
+    api: dict[str, Any]             # FakeMoySklad.stats() of the run
+    reasons: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict[str, Any]:
+        def ms(value: float | None) -> float | None:
+            return None if value is None else round(value * 1000, 1)
+
+        # 429 answers are counted apart: they measure pressure, not work
+        calls = self.api["requests"] - self.api["throttled"]
+        return {
+            "documents": self.documents,
+            "seconds": round(self.seconds, 3),
+            "documents_per_second": round(self.documents / self.seconds, 2) if self.seconds else None,
+            "latency_unit": self.unit,
+            "p50_ms": ms(percentile(self.latencies, 50)),
+            "p99_ms": ms(percentile(self.latencies, 99)),
+            "api_calls": calls,
+            "api_calls_per_document": round(calls / self.documents, 2) if self.documents else None,
+            "throttled": self.api["throttled"],
+            "reasons": self.reasons,
+            "by_route": self.api["by_route"],
+        }
+
+
+# ------------------------------------------------------------------
+# scenarios
+# ------------------------------------------------------------------
+
+def _refs(fake: FakeMoySklad) -> list[tuple[str, str]]:
+    return [(doc_type, doc_id) for doc_type in fake.config.doc_types for doc_id in fake.document_ids(doc_type)]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_webhook(fake: FakeMoySklad, settings: Settings, concurrency: int) -> Run:
+    """POST one webhook per document to the service running under uvicorn."""
+    import uvicorn
+
+    # imported here: the service reads its settings from the environment on import
+    from ms_loyalty.app.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    url = f"http://127.0.0.1:{port}/webhook"
+    local = threading.local()
+
+    def deliver(ref: tuple[str, str]) -> tuple[float, str]:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        doc_type, doc_id = ref
+        event = {"meta": {"href": f"{fake.base_url}/entity/{doc_type}/{doc_id}", "type": doc_type},
+                 "action": "UPDATE"}
+        started = time.perf_counter()
+        response = local.session.post(url, json={"events": [event]}, timeout=120)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            return elapsed, f"http_{response.status_code}"
+        return elapsed, response.json()["results"][0]["reason"]
+
+    refs = _refs(fake)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            outcomes = list(executor.map(deliver, refs))
+        seconds = time.perf_counter() - started
+    finally:
+        server.should_exit = True
+        thread.join()
+    return Run("webhook", len(refs), seconds, [elapsed for elapsed, _ in outcomes], "request",
+               fake.stats(), dict(Counter(reason for _, reason in outcomes)))
+
+
+def bench_backfill(fake: FakeMoySklad, settings: Settings, concurrency: int) -> Run:
+    client = MoySkladClient(settings)
+    started = time.perf_counter()
+    progress = backfill(client, settings, list(fake.config.doc_types), "", Checkpoint(None),
+                        concurrency, out=io.StringIO())
+    return Run("backfill", progress.documents, time.perf_counter() - started, progress.latencies,
+               "document", fake.stats(), dict(progress.reasons))
+
+
+def bench_export(fake: FakeMoySklad, settings: Settings, concurrency: int) -> Run:
+    client = MoySkladClient(settings)
+    latencies: list[float] = []
+    documents = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        report = open_report(str(Path(tmp) / "report.xlsx"))
+        aggregates = Aggregates()
+        started = mark = time.perf_counter()
+        for page in iter_report_pages(client, settings, list(fake.config.doc_types), "", concurrency):
+            report.write(page.rows)
+            aggregates.add_page(page)
+            documents += len(page.rows)
+            now = time.perf_counter()
+            latencies.append(now - mark)
+            mark = now
+        for name, frame in aggregates.sheets().items():
+            report.add_sheet(name, frame)
+        report.close()
+        seconds = time.perf_counter() - started
+    return Run("export", documents, seconds, latencies, "page", fake.stats())
+
+
+_BENCHES = {"webhook": bench_webhook, "backfill": bench_backfill, "export": bench_export}
+
+
+# ------------------------------------------------------------------
+# results
+# ------------------------------------------------------------------
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> list[str]:
+    """One line per scenario and metric present in both results."""
+    lines = []
+    for name, now in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        for metric in ("documents_per_second", "p50_ms", "p99_ms", "api_calls_per_document"):
+            old, new = before.get(metric), now.get(metric)
+            if not old or new is None:
+                continue
+            lines.append(f"  {name:<9} {metric:<23} {old:>10} -> {new:>10}  {(new - old) / old:+7.1%}")
+    return lines
+
+
+def _service_env(fake: FakeMoySklad, settings_env: dict[str, str]) -> None:
+    # the fake decides everything that matters; never fall back to a real account
+    os.environ.update({
+        "MS_BASE_URL": fake.base_url,
+        "MS_AUTH_MODE": "bearer",
+        "MS_TOKEN": "bench",
+        "DRY_RUN": "false",
+        "WEBHOOK_MODE": "inline",
+        "WEBHOOK_BEARER_TOKEN": "",
+        "DOCUMENT_TYPES": ",".join(fake.config.doc_types),
+        "LOG_LEVEL": "ERROR",   # retries on 429 are counted, not logged
+        **settings_env,
+    })
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks on a fake MoySklad")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated of {SCENARIOS}")
+    parser.add_argument("--docs", type=int, default=100, help="documents per type")
+    parser.add_argument("--positions", type=int, nargs=2, default=(5, 150), metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=20, help="fake latency per request, ms")
+    parser.add_argument("--jitter", type=float, default=5, help="± ms per request")
+    parser.add_argument("--rate-limit", type=float, default=15, help="fake requests per second; 0 = off")
+    parser.add_argument("--max-parallel", type=int, default=5, help="fake requests in flight; 0 = off")
+    parser.add_argument("--concurrency", type=int, default=4, help="webhook deliveries / batch size in flight")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="service setting for every scenario, e.g. --env RATE_LIMIT_PER_SECOND=15")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--baseline", help="earlier --out file to compare with")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    config = FakeConfig(seed=args.seed, documents=args.docs, positions=tuple(args.positions),
+                        latency_ms=args.latency, jitter_ms=args.jitter,
+                        rate_limit=args.rate_limit, max_parallel=args.max_parallel)
+    results: dict[str, Any] = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "config": dict(asdict(config), concurrency=args.concurrency, env=args.env),
+        "scenarios": {},
+    }
+    with FakeMoySklad(config) as fake:
+        _service_env(fake, dict(item.split("=", 1) for item in args.env))
+        settings = Settings.from_env()
+        logging.basicConfig(level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+        for name in names:
+            fake.reseed()
+            fake.reset_stats()
+            summary = _BENCHES[name](fake, settings, args.concurrency).summary()
+            results["scenarios"][name] = summary
+            print(f"{name:<9} {summary['documents']:>5} docs  {summary['documents_per_second']:>8} docs/s"
+                  f"  p50 {summary['p50_ms']} ms  p99 {summary['p99_ms']} ms per {summary['latency_unit']}"
+                  f"  {summary['api_calls_per_document']} calls/doc  {summary['throttled']} x 429")
+
+    # read first: --baseline may be the file --out overwrites
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Saved {args.out}")
+    if baseline is not None:
+        print(f"Against {args.baseline} ({baseline.get('commit')}):")
+        print("\n".join(compare(baseline, results)) or "  nothing to compare")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,612 @@
+"""Local stand-in for the MoySklad JSON API, for benchmarks and offline runs.
+
+Serves the endpoints ``MoySkladClient`` and ``AsyncMoySkladClient`` use —
+documents (GET/PUT, lists with ``filter`` / ``order`` / ``expand``),
+positions paging and bulk updates, mass updates of documents, metadata,
+counterparties, product folders with ``pathName`` and products / variants
+(variants link to their product and carry no ``pathName``, like the real
+API) — over a catalog and documents generated from a seed.
+
+Latency per request, the request-rate budget and the parallel-request cap
+are configurable; over budget the server answers 429 with
+``X-Lognex-Retry-After`` as MoySklad does.  Every request is counted by
+route, so a benchmark can report API calls per document.
+
+Usage:
+    python -m ms_loyalty.scripts.fake_moysklad --port 8090 --docs 500 --latency 30 --rate-limit 15
+    # then MS_BASE_URL=http://127.0.0.1:8090/api/remap/1.2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/api/remap/1.2"
+PROMO_FOLDER = "Акция"
+LOYALTY_ENABLED_ATTR = "Программа лояльности"
+LOYALTY_DISCOUNT_ATTR = "Скидка по ПЛ (%)"
+INLINE_POSITIONS = 100  # positions that come with ``expand=positions...``
+MAX_PAGE = 1000
+MAX_EXPANDED_PAGE = 100
+SEED_START = datetime(2025, 1, 1, 9, 0)
+
+
+@dataclass
+class FakeConfig:
+    seed: int = 1
+    doc_types: tuple[str, ...] = ("customerorder", "demand")
+    documents: int = 100                      # per document type
+    positions: tuple[int, int] = (5, 150)     # min, max per document
+    products: int = 500
+    variant_share: float = 0.2                # positions that reference a variant
+    folders: int = 30
+    counterparties: int = 40
+    member_share: float = 0.6                 # counterparties in the loyalty programme
+    discounted_share: float = 0.1             # positions that already carry a discount
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_limit: float = 0.0                   # requests per second; 0 = unlimited
+    burst: int = 45                           # MoySklad: 45 requests per 3 seconds
+    max_parallel: int = 0                     # requests in flight; 0 = unlimited
+
+
+@dataclass
+class _Document:
+    id: str
+    moment: str
+    updated: str
+    agent: str
+    positions: list[dict[str, Any]] = field(default_factory=list)
+
+
+def _stamp(dt: datetime) -> str:
+    return f"{dt:%Y-%m-%d %H:%M:%S}.{dt.microsecond // 1000:03d}"
+
+
+def _filters(expr: str) -> tuple[set[str], list[tuple[str, str, str]]]:
+    """``id=a;id=b;moment>=x`` -> ids (an OR) and the other conditions (an AND)."""
+    ids: set[str] = set()
+    conditions: list[tuple[str, str, str]] = []
+    for part in filter(None, expr.split(";")):
+        for op in (">=", "<=", "="):
+            name, sep, value = part.partition(op)
+            if sep:
+                break
+        if name == "id" and op == "=":
+            ids.add(value)
+        else:
+            conditions.append((name, op, value))
+    return ids, conditions
+
+
+def _matches(values: dict[str, Any], conditions: list[tuple[str, str, str]]) -> bool:
+    for name, op, value in conditions:
+        actual = str(values.get(name) or "")
+        if name in {"moment", "updated"}:
+            actual = actual[:19]
+        if op == ">=" and not actual >= value:
+            return False
+        if op == "<=" and not actual <= value:
+            return False
+        if op == "=" and actual != value:
+            return False
+    return True
+
+
+class FakeMoySklad:
+    """Seeded MoySklad data plus the HTTP server answering for it."""
+
+    def __init__(self, config: FakeConfig | None = None, port: int = 0) -> None:
+        self.config = config or FakeConfig()
+        self.port = port
+        self.base_url = ""
+        self._server: ThreadingHTTPServer | None = None
+        self._lock = threading.Lock()
+        self._tokens = float(self.config.burst)
+        self._refilled = time.monotonic()
+        self._in_flight = 0
+        self.calls: Counter[str] = Counter()
+        self.throttled = 0
+        self.reseed()
+
+    # ------------------------------------------------------------------
+    # data
+    # ------------------------------------------------------------------
+
+    def reseed(self) -> None:
+        """Regenerate catalog and documents from the seed, dropping every write."""
+        cfg = self.config
+        rnd = random.Random(cfg.seed)
+
+        # folder tree: two roots, the promo one among them
+        self.folders: dict[str, dict[str, Any]] = {
+            "f0": {"name": "Основная", "parent": None, "path": ""},
+            "f1": {"name": PROMO_FOLDER, "parent": None, "path": ""},
+        }
+        for n in range(2, max(2, cfg.folders)):
+            parent = f"f{rnd.randrange(n)}"
+            up = self.folders[parent]
+            self.folders[f"f{n}"] = {
+                "name": f"Группа {n}",
+                "parent": parent,
+                "path": f"{up['path']}/{up['name']}".lstrip("/"),
+            }
+        folder_ids = list(self.folders)
+        self.products = {
+            f"p{n}": {"name": f"Товар {n}", "folder": rnd.choice(folder_ids)}
+            for n in range(cfg.products)
+        }
+        product_ids = list(self.products)
+        self.variants = {
+            f"v{n}": {"name": f"Модификация {n}", "product": rnd.choice(product_ids)}
+            for n in range(max(1, cfg.products // 5))
+        }
+        variant_ids = list(self.variants)
+
+        self.counterparties = {}
+        for n in range(cfg.counterparties):
+            member = rnd.random() < cfg.member_share
+            self.counterparties[f"c{n}"] = {
+                "name": f"ООО Клиент {n}",
+                "tags": ["оптовик"] if member else [],
+                "member": member,
+                "percent": rnd.choice([3, 5, 7.5, 10]) if member else 0,
+            }
+        agents = list(self.counterparties)
+
+        self.documents: dict[str, dict[str, _Document]] = {}
+        for doc_type in cfg.doc_types:
+            docs: dict[str, _Document] = {}
+            for n in range(cfg.documents):
+                moment = _stamp(SEED_START + timedelta(minutes=17 * n))
+                doc = _Document(id=f"{doc_type}-{n:05d}", moment=moment, updated=moment,
+                                agent=rnd.choice(agents))
+                for k in range(rnd.randint(*cfg.positions)):
+                    variant = rnd.random() < cfg.variant_share
+                    doc.positions.append({
+                        "id": f"{doc.id}-{k}",
+                        "quantity": rnd.choice([1, 1, 2, 3, 5, 0.5, 12]),
+                        "price": rnd.randrange(100, 500_000),
+                        "discount": rnd.choice([5, 10]) if rnd.random() < cfg.discounted_share else 0,
+                        "vat": 20,
+                        "vatEnabled": True,
+                        "kind": "variant" if variant else "product",
+                        "item": rnd.choice(variant_ids if variant else product_ids),
+                    })
+                docs[doc.id] = doc
+            self.documents[doc_type] = docs
+        self._clock = datetime.now()
+
+    def document_ids(self, doc_type: str) -> list[str]:
+        return list(self.documents[doc_type])
+
+    def _touch(self, doc: _Document) -> None:
+        # strictly increasing, so ``updated`` always tells writes apart
+        self._clock = max(datetime.now(), self._clock + timedelta(milliseconds=1))
+        doc.updated = _stamp(self._clock)
+
+    # ------------------------------------------------------------------
+    # JSON views
+    # ------------------------------------------------------------------
+
+    def _meta(self, path: str, kind: str, **extra: Any) -> dict[str, Any]:
+        return {"href": f"{self.base_url}/{path}", "type": kind, "mediaType": "application/json", **extra}
+
+    def _folder(self, folder_id: str) -> dict[str, Any]:
+        folder = self.folders[folder_id]
+        view = {
+            "id": folder_id,
+            "meta": self._meta(f"entity/productfolder/{folder_id}", "productfolder"),
+            "name": folder["name"],
+            "pathName": folder["path"],
+        }
+        if folder["parent"]:
+            view["productFolder"] = {"meta": self._meta(f"entity/productfolder/{folder['parent']}",
+                                                        "productfolder")}
+        return view
+
+    def _product(self, product_id: str) -> dict[str, Any]:
+        product = self.products[product_id]
+        folder = self.folders[product["folder"]]
+        return {
+            "id": product_id,
+            "meta": self._meta(f"entity/product/{product_id}", "product"),
+            "name": product["name"],
+            "pathName": f"{folder['path']}/{folder['name']}".lstrip("/"),
+            "productFolder": {"meta": self._meta(f"entity/productfolder/{product['folder']}",
+                                                 "productfolder")},
+        }
+
+    def _variant(self, variant_id: str, expand_product: bool = False) -> dict[str, Any]:
+        variant = self.variants[variant_id]
+        product = (self._product(variant["product"]) if expand_product
+                   else {"meta": self._meta(f"entity/product/{variant['product']}", "product")})
+        return {
+            "id": variant_id,
+            "meta": self._meta(f"entity/variant/{variant_id}", "variant"),
+            "name": variant["name"],
+            "product": product,
+        }
+
+    def _item(self, kind: str, item_id: str, expand: set[str]) -> dict[str, Any]:
+        if kind == "variant":
+            return self._variant(item_id, "product" in expand)
+        return self._product(item_id)
+
+    def _counterparty(self, agent_id: str) -> dict[str, Any]:
+        agent = self.counterparties[agent_id]
+        attributes = [
+            {"meta": self._meta("entity/counterparty/metadata/attributes/loyalty", "attributemetadata"),
+             "id": "loyalty", "name": LOYALTY_ENABLED_ATTR, "type": "boolean", "value": agent["member"]},
+        ]
+        if agent["percent"]:
+            attributes.append(
+                {"meta": self._meta("entity/counterparty/metadata/attributes/percent", "attributemetadata"),
+                 "id": "percent", "name": LOYALTY_DISCOUNT_ATTR, "type": "double", "value": agent["percent"]},
+            )
+        return {
+            "id": agent_id,
+            "meta": self._meta(f"entity/counterparty/{agent_id}", "counterparty"),
+            "name": agent["name"],
+            "tags": agent["tags"],
+            "attributes": attributes,
+        }
+
+    def _position(self, doc_type: str, doc_id: str, pos: dict[str, Any], expand: bool) -> dict[str, Any]:
+        kind, item_id = pos["kind"], pos["item"]
+        assortment = (self._item(kind, item_id, set()) if expand
+                      else {"meta": self._meta(f"entity/{kind}/{item_id}", kind)})
+        return {
+            "id": pos["id"],
+            "meta": self._meta(f"entity/{doc_type}/{doc_id}/positions/{pos['id']}", f"{doc_type}position"),
+            "quantity": pos["quantity"],
+            "price": pos["price"],
+            "discount": pos["discount"],
+            "vat": pos["vat"],
+            "vatEnabled": pos["vatEnabled"],
+            "assortment": assortment,
+        }
+
+    def _document(self, doc_type: str, doc: _Document, expand: set[str]) -> dict[str, Any]:
+        positions: dict[str, Any] = {
+            "meta": self._meta(f"entity/{doc_type}/{doc.id}/positions", f"{doc_type}position",
+                               size=len(doc.positions), limit=INLINE_POSITIONS, offset=0),
+        }
+        if expand & {"positions", "positions.assortment"}:
+            positions["rows"] = [
+                self._position(doc_type, doc.id, pos, "positions.assortment" in expand)
+                for pos in doc.positions[:INLINE_POSITIONS]
+            ]
+        agent = (self._counterparty(doc.agent) if "agent" in expand
+                 else {"meta": self._meta(f"entity/counterparty/{doc.agent}", "counterparty")})
+        return {
+            "id": doc.id,
+            "meta": self._meta(f"entity/{doc_type}/{doc.id}", doc_type),
+            "name": doc.id.rsplit("-", 1)[-1],
+            "moment": doc.moment,
+            "updated": doc.updated,
+            "sum": sum(round(pos["price"] * pos["quantity"] * (100 - pos["discount"]) / 100)
+                       for pos in doc.positions),
+            "agent": agent,
+            "positions": positions,
+        }
+
+    def _metadata(self, entity: str) -> dict[str, Any]:
+        rows = []
+        if entity == "counterparty":
+            rows = [
+                {"meta": self._meta(f"entity/counterparty/metadata/attributes/{attr_id}", "attributemetadata"),
+                 "id": attr_id, "name": name, "type": kind}
+                for attr_id, name, kind in (("loyalty", LOYALTY_ENABLED_ATTR, "boolean"),
+                                            ("percent", LOYALTY_DISCOUNT_ATTR, "double"))
+            ]
+        return {
+            "meta": self._meta(f"entity/{entity}/metadata", "embeddedentitymetadata"),
+            "attributes": {
+                "meta": self._meta(f"entity/{entity}/metadata/attributes", "attributemetadata",
+                                   size=len(rows)),
+                "rows": rows,
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # writes
+    # ------------------------------------------------------------------
+
+    def _update_positions(self, doc: _Document, changes: list[dict[str, Any]], replace: bool) -> None:
+        """Apply position payloads; a full list (PUT) drops positions it omits."""
+        by_id = {pos["id"]: pos for pos in doc.positions}
+        kept = []
+        for change in changes:
+            pos_id = change.get("id") or (change.get("meta") or {}).get("href", "").rsplit("/", 1)[-1]
+            pos = by_id.get(pos_id)
+            if pos is None:
+                continue
+            for name in ("quantity", "price", "discount", "vat", "vatEnabled"):
+                if name in change:
+                    pos[name] = change[name]
+            kept.append(pos)
+        if replace:
+            doc.positions = kept
+        self._touch(doc)
+
+    def _put_document(self, doc_type: str, doc_id: str, body: dict[str, Any]) -> tuple[int, Any]:
+        doc = self.documents.get(doc_type, {}).get(doc_id)
+        if doc is None:
+            return 404, _error(f"Объект {doc_type} {doc_id} не найден", 1021)
+        if isinstance(body.get("positions"), list):
+            self._update_positions(doc, body["positions"], replace=True)
+        else:
+            self._touch(doc)
+        return 200, self._document(doc_type, doc, set())
+
+    def _bulk_update(self, doc_type: str, body: list[dict[str, Any]]) -> tuple[int, Any]:
+        rows = []
+        for entity in body:
+            doc_id = ((entity.get("meta") or {}).get("href") or "").rsplit("/", 1)[-1]
+            status, row = self._put_document(doc_type, doc_id, entity)
+            rows.append(row)
+        return 200, rows
+
+    # ------------------------------------------------------------------
+    # routing
+    # ------------------------------------------------------------------
+
+    def handle(self, method: str, path: str, query: dict[str, str],
+               body: Any) -> tuple[str, int, Any]:
+        """``(route, status, JSON body)`` for one request, under the data lock."""
+        parts = path.removeprefix(API_PREFIX).strip("/").split("/")
+        if parts[0] != "entity" or len(parts) < 2:
+            return "other", 404, _error("Неизвестный ресурс", 1005)
+        entity, rest = parts[1], parts[2:]
+        expand = set(filter(None, query.get("expand", "").split(",")))
+        with self._lock:
+            if method == "GET" and rest[:1] == ["metadata"]:
+                return "GET /entity/{type}/metadata", 200, self._metadata(entity)
+            if entity in self.documents:
+                return self._handle_document(method, entity, rest, query, expand, body)
+            if method != "GET":
+                return "other", 405, _error("Метод не поддерживается", 1006)
+            return self._handle_catalog(entity, rest, query, expand)
+
+    def _handle_document(self, method: str, doc_type: str, rest: list[str], query: dict[str, str],
+                         expand: set[str], body: Any) -> tuple[str, int, Any]:
+        docs = self.documents[doc_type]
+        if not rest:
+            if method == "POST":
+                return "POST /entity/{type}", *self._bulk_update(doc_type, body or [])
+            ids, conditions = _filters(query.get("filter", ""))
+            rows = [doc for doc in docs.values()
+                    if (not ids or doc.id in ids)
+                    and _matches({"moment": doc.moment, "updated": doc.updated}, conditions)]
+            if query.get("order", "").startswith("moment"):
+                rows.sort(key=lambda doc: doc.moment, reverse=query["order"].endswith(",desc"))
+            page = _page(rows, query, MAX_EXPANDED_PAGE if expand else MAX_PAGE)
+            return "GET /entity/{type}", 200, page(lambda doc: self._document(doc_type, doc, expand))
+
+        doc = docs.get(rest[0])
+        if doc is None:
+            return "other", 404, _error(f"Объект {doc_type} {rest[0]} не найден", 1021)
+        if len(rest) == 1:
+            if method == "PUT":
+                return "PUT /entity/{type}/{id}", *self._put_document(doc_type, doc.id, body or {})
+            return "GET /entity/{type}/{id}", 200, self._document(doc_type, doc, expand)
+        if rest[1:] == ["positions"]:
+            if method == "POST":
+                self._update_positions(doc, body or [], replace=False)
+                changed = {change.get("id") or change["meta"]["href"].rsplit("/", 1)[-1] for change in body}
+                return "POST /entity/{type}/{id}/positions", 200, [
+                    self._position(doc_type, doc.id, pos, False)
+                    for pos in doc.positions if pos["id"] in changed
+                ]
+            page = _page(doc.positions, query, MAX_EXPANDED_PAGE if expand else MAX_PAGE)
+            return "GET /entity/{type}/{id}/positions", 200, page(
+                lambda pos: self._position(doc_type, doc.id, pos, "assortment" in expand),
+            )
+        return "other", 404, _error("Неизвестный ресурс", 1005)
+
+    def _handle_catalog(self, entity: str, rest: list[str], query: dict[str, str],
+                        expand: set[str]) -> tuple[str, int, Any]:
+        if entity == "counterparty" and len(rest) == 1 and rest[0] in self.counterparties:
+            return "GET /entity/counterparty/{id}", 200, self._counterparty(rest[0])
+        if entity == "productfolder" and not rest:
+            page = _page(list(self.folders), query, MAX_PAGE)
+            return "GET /entity/productfolder", 200, page(self._folder)
+        items = {
+            "product": [("product", item_id) for item_id in self.products],
+            "variant": [("variant", item_id) for item_id in self.variants],
+        }
+        items["assortment"] = items["product"] + items["variant"]
+        if entity not in items:
+            return "other", 404, _error("Неизвестный ресурс", 1005)
+        if rest:
+            known = {item_id: kind for kind, item_id in items[entity]}
+            if rest[0] not in known:
+                return "other", 404, _error(f"Объект {entity} {rest[0]} не найден", 1021)
+            return f"GET /entity/{entity}/{{id}}", 200, self._item(known[rest[0]], rest[0], expand)
+        ids, _ = _filters(query.get("filter", ""))
+        rows = [(kind, item_id) for kind, item_id in items[entity] if not ids or item_id in ids]
+        page = _page(rows, query, MAX_EXPANDED_PAGE if expand else MAX_PAGE)
+        return f"GET /entity/{entity}", 200, page(lambda row: self._item(*row, expand))
+
+    # ------------------------------------------------------------------
+    # limits
+    # ------------------------------------------------------------------
+
+    def admit(self) -> float | None:
+        """Take a slot for a request; ``None`` if admitted, else seconds until retry."""
+        cfg = self.config
+        with self._lock:
+            self._in_flight += 1
+            if cfg.max_parallel and self._in_flight > cfg.max_parallel:
+                self.throttled += 1
+                return max(cfg.latency_ms / 1000, 0.05)
+            if cfg.rate_limit > 0:
+                now = time.monotonic()
+                self._tokens = min(float(cfg.burst), self._tokens + (now - self._refilled) * cfg.rate_limit)
+                self._refilled = now
+                if self._tokens < 1:
+                    self.throttled += 1
+                    return (1 - self._tokens) / cfg.rate_limit
+                self._tokens -= 1
+            return None
+
+    def release(self, route: str) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self.calls[route] += 1
+
+    def remaining(self) -> int | None:
+        if self.config.rate_limit <= 0:
+            return None
+        return int(self._tokens)
+
+    def delay(self) -> float:
+        cfg = self.config
+        return max(0.0, cfg.latency_ms + random.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": sum(self.calls.values()),
+                "throttled": self.throttled,
+                "by_route": dict(self.calls.most_common()),
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.throttled = 0
+
+    # ------------------------------------------------------------------
+    # server
+    # ------------------------------------------------------------------
+
+    def start(self) -> FakeMoySklad:
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), _handler(self))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.base_url = f"http://127.0.0.1:{self.port}{API_PREFIX}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> FakeMoySklad:
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def _error(message: str, code: int) -> dict[str, Any]:
+    return {"errors": [{"error": message, "code": code}]}
+
+
+def _page(rows: list[Any], query: dict[str, str], cap: int):
+    """Slice *rows* by ``limit`` / ``offset``; the returned function renders the page."""
+    limit = min(int(query.get("limit", cap)), cap)
+    offset = int(query.get("offset", 0))
+
+    def render(view) -> dict[str, Any]:
+        return {
+            "meta": {"size": len(rows), "limit": limit, "offset": offset},
+            "rows": [view(row) for row in rows[offset:offset + limit]],
+        }
+    return render
+
+
+def _handler(fake: FakeMoySklad) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send(self, status: int, body: Any, headers: dict[str, str]) -> None:
+            raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json;charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _serve(self, method: str) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            url = urlparse(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+            retry_after = fake.admit()
+            route = "429"
+            try:
+                time.sleep(fake.delay())
+                if retry_after is not None:
+                    self._send(429, _error("Превышено ограничение на количество запросов", 1049),
+                               {"X-Lognex-Retry-After": str(max(1, round(retry_after * 1000)))})
+                    return
+                route, status, payload = fake.handle(method, url.path, query, body)
+                headers = {}
+                remaining = fake.remaining()
+                if remaining is not None:
+                    headers = {"X-RateLimit-Limit": str(fake.config.burst),
+                               "X-RateLimit-Remaining": str(remaining)}
+                self._send(status, payload, headers)
+            finally:
+                fake.release(f"{method} {route}" if route in {"other", "429"} else route)
+
+        def do_GET(self) -> None:
+            self._serve("GET")
+
+        def do_PUT(self) -> None:
+            self._serve("PUT")
+
+        def do_POST(self) -> None:
+            self._serve("POST")
+
+    return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run a local fake MoySklad API")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--docs", type=int, default=100, help="documents per type")
+    parser.add_argument("--positions", type=int, nargs=2, default=(5, 150), metavar=("MIN", "MAX"))
+    parser.add_argument("--latency", type=float, default=0, help="ms per request")
+    parser.add_argument("--jitter", type=float, default=0, help="± ms per request")
+    parser.add_argument("--rate-limit", type=float, default=0, help="requests per second; 0 = off")
+    parser.add_argument("--max-parallel", type=int, default=0, help="requests in flight; 0 = off")
+    args = parser.parse_args()
+
+    config = FakeConfig(seed=args.seed, documents=args.docs, positions=tuple(args.positions),
+                        latency_ms=args.latency, jitter_ms=args.jitter,
+                        rate_limit=args.rate_limit, max_parallel=args.max_parallel)
+    fake = FakeMoySklad(config, port=args.port).start()
+    print(f"Fake MoySklad at {fake.base_url}: {json.dumps(asdict(config), ensure_ascii=False)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
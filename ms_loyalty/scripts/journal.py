@@ -0,0 +1,101 @@
+"""Inspect the webhook event journal and requeue failed events.
+
+Usage:
+    python -m ms_loyalty.scripts.journal stats
+    python -m ms_loyalty.scripts.journal failed --limit 50
+    python -m ms_loyalty.scripts.journal requeue --all
+    python -m ms_loyalty.scripts.journal requeue 17 18 --run
+    python -m ms_loyalty.scripts.journal prune --days 30
+
+Requeued events go back to ``pending``; the service replays pending events
+on startup, or pass ``--run`` to process them from this script right away.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from ms_loyalty.app.config import Settings
+from ms_loyalty.app.journal import EventJournal
+from ms_loyalty.app.moysklad import MoySkladClient
+from ms_loyalty.app.processor import process_document
+
+
+def _run_pending(journal: EventJournal, settings: Settings, event_ids: set[int] | None) -> int:
+    client = MoySkladClient(settings)
+    journal.start()
+    failures = 0
+    try:
+        for event in journal.unfinished():
+            if event_ids is not None and event.id not in event_ids:
+                continue
+            try:
+                result = process_document(client, settings, event.doc_type, event.doc_id)
+            except Exception as exc:
+                logging.exception("Failed to process %s %s", event.doc_type, event.doc_id)
+                journal.mark_failed([event.id], str(exc))
+                failures += 1
+                continue
+            journal.mark_done([event.id])
+            print(f"#{event.id} {event.doc_type} {event.doc_id}: {result.reason}")
+    finally:
+        journal.close()
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Webhook event journal maintenance")
+    parser.add_argument("--journal", help="Journal file (default: JOURNAL_PATH from .env)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("stats", help="Event counts by status")
+
+    failed = sub.add_parser("failed", help="List failed events")
+    failed.add_argument("--limit", type=int, default=100)
+
+    requeue = sub.add_parser("requeue", help="Put failed events back to pending")
+    requeue.add_argument("ids", nargs="*", type=int, help="Event ids to requeue")
+    requeue.add_argument("--all", action="store_true", help="Requeue every failed event")
+    requeue.add_argument("--run", action="store_true", help="Process the requeued events now")
+
+    prune = sub.add_parser("prune", help="Delete finished events")
+    prune.add_argument("--days", type=float, required=True, help="Keep events newer than this")
+
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+    settings = Settings.from_env()
+    logging.basicConfig(level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+
+    path = args.journal or settings.journal_path
+    if not path:
+        parser.error("journal path not given and JOURNAL_PATH is not set")
+    journal = EventJournal(path)
+
+    if args.command == "stats":
+        print(journal.counts())
+    elif args.command == "failed":
+        for event in journal.failed(limit=args.limit):
+            received = datetime.fromtimestamp(event.received_at).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"#{event.id} {received} {event.action} {event.doc_type} {event.doc_id} "
+                  f"attempts={event.attempts} error={event.error}")
+    elif args.command == "requeue":
+        if not args.ids and not args.all:
+            parser.error("give event ids or --all")
+        count = journal.requeue(None if args.all else args.ids)
+        print(f"Requeued {count} events")
+        if args.run:
+            return 1 if _run_pending(journal, settings, None if args.all else set(args.ids)) else 0
+    elif args.command == "prune":
+        count = journal.prune(time.time() - args.days * 86400)
+        print(f"Deleted {count} finished events")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+"""Shared test helpers: settings and stand-ins for ``requests`` responses.
+
+``tests`` is not a package; pytest puts this directory on ``sys.path``,
+so test modules import it as ``from helpers import ...``.
+"""
+
+import json
+from typing import Any
+
+import requests
+
+from ms_loyalty.app.config import Settings
+
+BASE_URL = "https://api.moysklad.ru/api/remap/1.2"
+
+
+def make_settings(**overrides) -> Settings:
+    """Settings for tests: no rate limit, near-zero backoff."""
+    defaults = dict(
+        base_url=BASE_URL,
+        auth_mode="bearer",
+        token="test-token",
+        login="",
+        password="",
+        document_types=["customerorder", "demand"],
+        loyalty_enabled_attr="Программа лояльности",
+        loyalty_discount_attr="Скидка по ПЛ (%)",
+        wholesaler_tag="Оптовик",
+        promo_group_name="Акция",
+        dry_run=False,
+        log_level="DEBUG",
+        webhook_bearer_token="",
+        request_timeout=20,
+        rate_limit_per_second=0,
+        retry_backoff=0.001,
+    )
+    defaults.update(overrides)
+    return Settings(**defaults)
+
+
+class FakeResponse:
+    """A ``requests.Response`` as far as the client reads it.
+
+    *body* is sent as is when it is a string, as JSON otherwise.
+    """
+
+    def __init__(self, body: Any = None, status_code: int = 200, headers: dict[str, str] | None = None):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+
+class ScriptedSession:
+    """Answers with *responses* in order; an exception in the list is raised."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, *args, **kwargs):
+        self.calls += 1
+        item = self.responses.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
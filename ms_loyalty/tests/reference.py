@@ -0,0 +1,131 @@
+"""Reference discount calculation and synthetic documents.
+
+``reference_apply_discounts`` is the straightforward dict/Decimal version
+``apply_discounts`` replaced: the tests check both agree, and
+``scripts/bench_logic.py`` imports it from here to time them against each other.
+"""
+from __future__ import annotations
+
+import random
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any
+
+from ms_loyalty.app.config import Settings
+from ms_loyalty.app.logic import DiscountResult, _to_bool, _to_decimal
+
+FOLDERS = ["Основная", "Основная/Акция", "Основная/Электроника", "Акция/Зимняя", "Неакция", ""]
+
+
+def make_document(positions: int, seed: int = 1, percent: Any = 7.5) -> dict[str, Any]:
+    """A customerorder with *positions* rows over a few hundred distinct products."""
+    rnd = random.Random(seed)
+    rows = []
+    for n in range(positions):
+        product = rnd.randrange(300)
+        row: dict[str, Any] = {
+            "id": f"pos{n}",
+            "meta": {"href": f"https://x/customerorder/o1/positions/pos{n}"},
+            "quantity": rnd.choice([1, 2, 3, 0.5, 1.25, 10]),
+            "price": rnd.randrange(1, 500_000),
+            "discount": rnd.choice([0, 0, percent, 5, 12.5]),
+            "assortment": {
+                "meta": {"href": f"https://x/product/p{product}", "type": "product"},
+                "pathName": FOLDERS[product % len(FOLDERS)],
+            },
+        }
+        if n % 3 == 0:
+            row["vat"] = 20
+            row["vatEnabled"] = True
+        rows.append(row)
+    return {
+        "id": "o1",
+        "agent": {
+            "meta": {"href": "https://x/counterparty/c1"},
+            "tags": ["оптовик"],
+            "attributes": [
+                {"name": "Программа лояльности", "value": True},
+                {"name": "Скидка по ПЛ (%)", "value": percent},
+            ],
+        },
+        "positions": rows,
+    }
+
+
+# ------------------------------------------------------------------
+# the dict/Decimal implementation, kept as the reference
+# ------------------------------------------------------------------
+
+def _attr_value(entity: dict[str, Any], name: str) -> Any:
+    for attr in entity.get("attributes", []) or []:
+        if attr.get("name") == name:
+            return attr.get("value")
+    return None
+
+
+def _percent(counterparty: dict[str, Any], settings: Settings) -> Decimal:
+    if _to_bool(_attr_value(counterparty, settings.loyalty_enabled_attr)) is not True:
+        return Decimal("0")
+    target = settings.wholesaler_tag.lower()
+    if not any(t.lower() == target for t in counterparty.get("tags", []) or []):
+        return Decimal("0")
+    discount = _to_decimal(_attr_value(counterparty, settings.loyalty_discount_attr)) or Decimal("0")
+    if discount <= 0:
+        return Decimal("0")
+    return min(discount, Decimal("100"))
+
+
+def _is_promo(assortment: dict[str, Any], settings: Settings) -> bool:
+    if not assortment or not settings.promo_group_name:
+        return False
+    path_name = assortment.get("pathName", "")
+    if not path_name:
+        return False
+    segments = [s.strip() for s in path_name.split("/") if s.strip()]
+    return settings.promo_group_name in segments
+
+
+def reference_amount(price: Any, quantity: Any, percent: Decimal) -> int:
+    price_d = _to_decimal(price) or Decimal("0")
+    qty_d = _to_decimal(quantity) or Decimal("0")
+    amount = price_d * qty_d * percent / Decimal("100")
+    return int(amount.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def reference_apply_discounts(document: dict[str, Any], settings: Settings) -> DiscountResult:
+    percent = _percent(document.get("agent") or {}, settings)
+    all_positions: list[dict[str, Any]] = []
+    changed: list[dict[str, Any]] = []
+    discount_sum = 0
+    for pos in document.get("positions") or []:
+        assortment = pos.get("assortment") or {}
+        target = Decimal("0") if percent <= 0 or _is_promo(assortment, settings) else percent
+        if target > 0:
+            discount_sum += reference_amount(pos.get("price"), pos.get("quantity"), target)
+
+        payload: dict[str, Any] = {
+            "id": pos.get("id"),
+            "quantity": pos.get("quantity"),
+            "price": pos.get("price"),
+            "discount": float(target),
+        }
+        if assortment.get("meta"):
+            payload["assortment"] = {"meta": assortment["meta"]}
+        for field in ("vat", "vatEnabled", "pack", "reserve"):
+            if pos.get(field) is not None:
+                payload[field] = pos[field]
+        all_positions.append(payload)
+
+        if (_to_decimal(pos.get("discount")) or Decimal("0")) != target:
+            change: dict[str, Any] = {"discount": float(target)}
+            if pos.get("meta"):
+                change["meta"] = pos["meta"]
+            else:
+                change["id"] = pos.get("id")
+            changed.append(change)
+
+    return DiscountResult(
+        all_positions=all_positions,
+        changed_count=len(changed),
+        loyalty_discount_sum=discount_sum,
+        changed_positions=changed,
+    )
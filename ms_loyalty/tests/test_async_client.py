@@ -0,0 +1,180 @@
+"""Tests for the async MoySklad client and processor over a mocked transport.
+
+All tests run offline — no API calls.
+"""
+import asyncio
+import json
+
+import httpx
+
+from ms_loyalty.app.moysklad_async import AsyncMoySkladClient
+from ms_loyalty.app.processor import process_document_async, process_documents_async
+
+from helpers import BASE_URL, make_settings
+
+
+class FakeApi:
+    """A customerorder with *count* positions; product ``p0`` sits in «Акция»."""
+
+    def __init__(self, count):
+        self.requests = []
+        self.put_body = None
+        self.fail_next = 0
+        self.agent_discount = 5
+        self.positions = [
+            {
+                "id": f"pos{n}",
+                "quantity": 1,
+                "price": 10000,
+                "discount": 0,
+                "assortment": {"meta": {"href": f"{BASE_URL}/entity/product/p{n}", "type": "product"}},
+            }
+            for n in range(count)
+        ]
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.fail_next:
+            self.fail_next -= 1
+            return httpx.Response(429, headers={"X-Lognex-Retry-After": "1"})
+
+        path = request.url.path.split("/remap/1.2", 1)[1]
+        if path == "/entity/customerorder/o1" and request.method == "GET":
+            document = {
+                "id": "o1",
+                "updated": "2025-01-01 00:00:00.000",
+                "agent": {
+                    "meta": {"href": f"{BASE_URL}/entity/counterparty/c1"},
+                    "tags": ["оптовик"],
+                    "attributes": [
+                        {"name": "Программа лояльности", "value": True},
+                        {"name": "Скидка по ПЛ (%)", "value": self.agent_discount},
+                    ],
+                },
+            }
+            if "positions" in request.url.params.get("expand", ""):
+                # nested expand: the first 100 positions come inline
+                document["positions"] = {
+                    "meta": {"size": len(self.positions), "limit": 100},
+                    "rows": self.positions[:100],
+                }
+            return httpx.Response(200, json=document)
+        if path == "/entity/customerorder/o1" and request.method == "PUT":
+            self.put_body = json.loads(request.content)
+            return httpx.Response(200, json={"id": "o1", "updated": "2025-01-01 00:00:01.000"})
+        if path == "/entity/customerorder/o1/positions":
+            offset = int(request.url.params["offset"])
+            limit = int(request.url.params["limit"])
+            return httpx.Response(200, json={
+                "meta": {"size": len(self.positions)},
+                "rows": self.positions[offset:offset + limit],
+            })
+        if path == "/entity/productfolder":
+            return httpx.Response(200, json={"meta": {"size": 1}, "rows": [
+                {"meta": {"href": f"{BASE_URL}/entity/productfolder/f1"}, "name": "Основная"},
+            ]})
+        if path == "/entity/product":
+            ids = [item.split("=", 1)[1] for item in request.url.params["filter"].split(";")]
+            return httpx.Response(200, json={"rows": [
+                {
+                    "id": product_id,
+                    "meta": {"href": f"{BASE_URL}/entity/product/{product_id}", "type": "product"},
+                    "pathName": "Акция" if product_id == "p0" else "Основная",
+                }
+                for product_id in ids
+            ]})
+        return httpx.Response(404)
+
+    def count(self, fragment):
+        return sum(1 for r in self.requests if r.url.path.endswith(fragment))
+
+
+def _run(api, settings):
+    async def main():
+        async with AsyncMoySkladClient(settings, transport=httpx.MockTransport(api)) as client:
+            return await process_document_async(client, settings, "customerorder", "o1")
+    return asyncio.run(main())
+
+
+def test_async_process_document_updates_positions():
+    api = FakeApi(count=3)
+    result = _run(api, make_settings())
+
+    assert result.updated is True
+    assert result.updated_positions == 2
+    assert result.loyalty_discount_sum == 1000
+    assert [p["discount"] for p in api.put_body["positions"]] == [0.0, 5.0, 5.0]
+
+
+def test_async_client_pages_positions():
+    api = FakeApi(count=250)
+    result = _run(api, make_settings(dry_run=True))
+    assert result.reason == "dry_run"
+    # the first 100 rows came with the document
+    assert api.count("/positions") == 2
+    # 250 distinct products resolved through 3 batched list requests
+    assert api.count("/entity/product") == 3
+
+
+def test_async_retail_document_streams_positions_without_enrichment():
+    api = FakeApi(count=250)
+    api.agent_discount = 0
+
+    result = _run(api, make_settings())
+
+    assert result.reason == "not_eligible"
+    # the rest after the inline 100 in one 1000-row page, no assortment
+    assert api.count("/positions") == 1
+    assert api.count("/entity/product") == 0
+
+
+def test_async_retail_document_clears_leftover_discount():
+    api = FakeApi(count=250)
+    api.agent_discount = 0
+    api.positions[150]["discount"] = 7
+
+    result = _run(api, make_settings(partial_update_min_positions=0))
+
+    assert result.updated_positions == 1
+    assert [p["discount"] for p in api.put_body["positions"]] == [0.0] * 250
+
+
+def test_small_document_in_one_round_trip():
+    api = FakeApi(count=3)
+    _run(api, make_settings())
+    assert api.count("/positions") == 0
+    assert api.count("/entity/customerorder/o1") == 2   # GET + PUT
+    assert api.requests[0].url.params["expand"] == "positions.assortment"
+
+
+def test_async_batch_processes_each_document_once():
+    api = FakeApi(count=3)
+    s = make_settings()
+
+    async def main():
+        async with AsyncMoySkladClient(s, transport=httpx.MockTransport(api)) as client:
+            return await process_documents_async(client, s, [
+                ("customerorder", "o1"), ("customerorder", "missing"), ("customerorder", "o1"),
+            ])
+
+    batch = asyncio.run(main())
+    assert [item.doc_id for item in batch.items] == ["o1", "missing"]
+    assert batch.items[0].result.updated is True
+    assert batch.items[1].result is None
+    assert api.count("/entity/customerorder/o1") == 2   # GET + PUT, once
+
+
+def test_async_client_retries_429():
+    api = FakeApi(count=1)
+    api.fail_next = 2
+    result = _run(api, make_settings())
+    assert result.reason == "no_changes"  # p0 is promo, discount already 0
+    assert api.count("/entity/customerorder/o1") >= 3
+
+
+def test_async_client_sends_auth_and_gzip():
+    api = FakeApi(count=1)
+    _run(api, make_settings())
+    first = api.requests[0]
+    assert first.headers["Authorization"] == "Bearer test-token"
+    assert "gzip" in first.headers["Accept-Encoding"]
@@ -0,0 +1,71 @@
+"""Tests for the vectorized discount-drift audit.
+
+All tests run offline — no API calls.
+"""
+import pytest
+
+from ms_loyalty.app.logic import apply_discounts, compile_rules, get_loyalty_discount_percent
+from ms_loyalty.app.money import line_total
+from ms_loyalty.scripts.audit_drift import drifted_rows, expected_discounts, position_frame
+
+from helpers import make_settings
+from reference import make_document
+
+
+def _frame(settings, documents):
+    entries = []
+    for doc_id, doc in documents:
+        percent = get_loyalty_discount_percent(doc["agent"], settings)
+        order_sum = sum(line_total(p.get("price"), p.get("quantity")) for p in doc["positions"])
+        entries.append((doc_id, float(percent), order_sum if percent > 0 else 0, doc["positions"]))
+    return position_frame("customerorder", entries)
+
+
+@pytest.mark.parametrize("percent", [0, 5, 7.5, "12.25"])
+def test_vectorized_expectation_matches_apply_discounts(percent):
+    s = make_settings(
+        discount_tiers=(("500000", "9"), ("2000000", "11")),
+        folder_discounts=(("f15", "15"),),
+        excluded_folders=("f0",),
+    )
+    documents = []
+    for seed in range(4):
+        doc = make_document(60, seed=seed, percent=percent)
+        for n, pos in enumerate(doc["positions"]):
+            if n % 7 == 0:
+                pos["assortment"]["productFolder"] = {"meta": {"href": "https://x/productfolder/f15"}}
+            elif n % 11 == 0:
+                pos["assortment"]["productFolder"] = {"meta": {"href": "https://x/productfolder/f0"}}
+        documents.append((f"o{seed}", doc))
+
+    frame = _frame(s, documents)
+    expected = expected_discounts(frame, compile_rules(s))
+
+    reference = [
+        pos["discount"]
+        for _, doc in documents
+        for pos in apply_discounts(doc, s).all_positions
+    ]
+    assert expected.tolist() == pytest.approx(reference)
+
+
+def test_only_drifted_positions_are_reported():
+    s = make_settings()
+    doc = make_document(5, seed=3, percent=10)
+    for pos, discount in zip(doc["positions"], [10, 10, 0, 10, 10]):
+        pos["discount"] = discount
+        pos["assortment"]["pathName"] = "Основная"
+    doc["positions"][4]["assortment"]["pathName"] = "Основная/Акция"
+
+    frame = _frame(s, [("o1", doc)])
+    rows = drifted_rows(frame, expected_discounts(frame, compile_rules(s)))
+
+    assert rows["positionId"].tolist() == ["pos2", "pos4"]
+    assert rows["delta"].tolist() == [10.0, -10.0]
+    assert set(rows["documentId"]) == {"o1"}
+
+
+def test_empty_page():
+    s = make_settings()
+    frame = position_frame("demand", [])
+    assert drifted_rows(frame, expected_discounts(frame, compile_rules(s))).empty
@@ -0,0 +1,44 @@
+"""Unit-tests for the LRU + TTL cache."""
+from ms_loyalty.app import cache as cache_module
+from ms_loyalty.app.cache import TTLCache
+
+
+def test_lru_eviction():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1      # "a" is now most recent
+    c.set("c", 3)               # evicts "b"
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    now[0] += 4
+    assert c.get("a") == 1
+    now[0] += 2
+    assert c.get("a") is None
+    assert c.stats()["hits"] == 1
+    assert c.stats()["misses"] == 1
+
+
+def test_invalidate_where():
+    c = TTLCache(maxsize=10, ttl=60)
+    for n in range(5):
+        c.set(n, n % 2)
+    assert c.invalidate_where(lambda key, value: value == 1) == 2
+    assert len(c) == 3
+    assert c.invalidate(0) is True
+    assert c.invalidate(0) is False
+
+
+def test_disabled_cache_stores_nothing():
+    c = TTLCache(maxsize=10, ttl=0)
+    c.set("a", 1)
+    assert c.get("a") is None
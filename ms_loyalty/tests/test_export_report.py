@@ -0,0 +1,283 @@
+"""Tests for the streaming loyalty report against an in-memory fake client.
+
+All tests run offline — no API calls.
+"""
+import csv
+import threading
+from datetime import datetime
+
+import pytest
+from openpyxl import load_workbook
+
+from ms_loyalty.app.cache import TTLCache
+from ms_loyalty.app.folders import PromoFolderIndex
+from ms_loyalty.app.reportstore import ReportStore
+from ms_loyalty.scripts.export_report import (
+    COLUMNS, Aggregates, iter_report_pages, open_report, sheet_path, sync_store,
+)
+
+from helpers import make_settings
+
+
+def _agent(agent_id, percent):
+    return {
+        "meta": {"href": f"https://x/counterparty/{agent_id}"},
+        "name": f"ООО {agent_id}",
+        "tags": ["оптовик"],
+        "attributes": [
+            {"name": "Программа лояльности", "value": True},
+            {"name": "Скидка по ПЛ (%)", "value": percent},
+        ],
+    }
+
+
+class FakeClient:
+    """Documents ``{type}-{n}``; odd ones belong to a retail customer.
+
+    Every document has a regular position and one without ``pathName``
+    whose product sits in «Акция» — found only through enrichment.
+    """
+
+    def __init__(self, settings, count):
+        self.settings = settings
+        self.count = count
+        self.lock = threading.Lock()
+        self.position_fetches = []
+        self.assortment_cache = TTLCache(100, 60)
+        self.counterparty_cache = TTLCache(100, 60)
+        self.promo_folders = PromoFolderIndex(settings.promo_group_name, 0)
+
+        self.documents = {}
+        self.listings = []
+
+    def docs(self, doc_type):
+        if doc_type not in self.documents:
+            self.documents[doc_type] = [
+                {
+                    "id": f"{doc_type}-{n}",
+                    "moment": f"2025-01-{n + 1:02d} 10:00:00.000",
+                    "updated": f"2025-02-01 09:00:{n:02d}.000",
+                    "sum": 30000,
+                    "agent": _agent("retail", 0) if n % 2 else _agent("c1", 10),
+                }
+                for n in range(self.count)
+            ]
+        return self.documents[doc_type]
+
+    def iter_documents(self, doc_type, filter="", expand=None):
+        self.listings.append((doc_type, filter))
+        docs = self.docs(doc_type)
+        for condition in filter.split(";") if filter else []:
+            field, op, value = condition.partition(">=") if ">=" in condition else condition.partition("<=")
+            if op == ">=":
+                docs = [doc for doc in docs if doc[field][:19] >= value]
+            else:
+                docs = [doc for doc in docs if doc[field][:19] <= value]
+        for start in range(0, len(docs), 3):
+            yield docs[start:start + 3]
+
+    def get_all_positions(self, doc_type, doc_id, expand="assortment", first_page=None):
+        with self.lock:
+            self.position_fetches.append(doc_id)
+        return [
+            {"id": "a", "price": 10000, "quantity": 1, "discount": 0,
+             "assortment": {"meta": {"href": "https://x/product/regular"}, "pathName": "Основная"}},
+            {"id": "b", "price": 20000, "quantity": 1, "discount": 0,
+             "assortment": {"meta": {"href": "https://x/product/promo"}}},
+        ]
+
+    def request(self, method, path, params=None, json=None):
+        ids = [item.split("=", 1)[1] for item in params["filter"].split(";")]
+        return {"rows": [
+            {"id": item_id, "meta": {"href": f"https://x/product/{item_id}"},
+             "pathName": "Акция" if item_id == "promo" else "Основная"}
+            for item_id in ids
+        ]}
+
+
+def test_rows_in_order_with_enriched_promo():
+    s = make_settings()
+    client = FakeClient(s, count=5)
+    pages = list(iter_report_pages(client, s, ["customerorder"], "", workers=3))
+
+    assert [len(page.rows) for page in pages] == [3, 2]
+    rows = [row for page in pages for row in page.rows]
+    assert [row["documentId"] for row in rows] == [f"customerorder-{n}" for n in range(5)]
+    # 10 % of the regular position only; the promo one was enriched to «Акция»
+    assert [row["loyaltyDiscountSum"] for row in rows] == [1000, 0, 1000, 0, 1000]
+    assert rows[0]["counterparty"] == "ООО c1"
+    # retail customers' positions are never fetched
+    assert sorted(client.position_fetches) == ["customerorder-0", "customerorder-2", "customerorder-4"]
+    splits = pages[0].splits
+    assert list(splits["documentId"]) == ["customerorder-0"] * 2 + ["customerorder-2"] * 2
+    first = splits[splits["documentId"] == "customerorder-0"].set_index("promo")
+    assert first.loc[False, ["positions", "lineSum", "discountSum"]].tolist() == [1, 10000, 1000]
+    assert first.loc[True, ["positions", "lineSum", "discountSum"]].tolist() == [1, 20000, 0]
+
+
+def test_aggregate_sheets():
+    s = make_settings()
+    client = FakeClient(s, count=5)
+    aggregates = Aggregates()
+    for page in iter_report_pages(client, s, ["customerorder", "demand"], "", workers=2):
+        aggregates.add_page(page)
+    sheets = aggregates.sheets()
+
+    by_type = sheets["by_type"].set_index("documentType")
+    assert by_type.loc["demand", ["documents", "sum", "loyaltyDiscountSum"]].tolist() == [5, 150000, 3000]
+
+    by_counterparty = sheets["by_counterparty"]
+    assert by_counterparty["counterparty"].tolist() == ["ООО c1", "ООО retail"]
+    assert by_counterparty["documents"].tolist() == [6, 4]
+
+    by_day = sheets["by_day"].set_index("day")
+    assert by_day.loc["2025-01-01", "loyaltyDiscountSum"] == 2000
+    assert by_day.loc["2025-01-02", "loyaltyDiscountSum"] == 0
+
+    split = sheets["promo_split"].set_index("documentType")
+    assert split.loc["customerorder", ["positions_promo", "positions_regular"]].tolist() == [3, 3]
+    assert split.loc["total", ["lineSum_promo", "lineSum_regular", "discountSum_regular"]].tolist() == [
+        120000, 60000, 6000,
+    ]
+
+
+def _rows():
+    return [{"documentType": "demand", "documentId": f"d{n}", "moment": "2025-01-02 10:00:00.000",
+             "counterparty": "ООО Ромашка", "sum": 100.0, "loyaltyDiscountSum": n} for n in range(3)]
+
+
+def test_xlsx_and_csv_writers(tmp_path):
+    for name in ("report.xlsx", "report.csv"):
+        report = open_report(str(tmp_path / name))
+        report.write(_rows()[:2])
+        report.write(_rows()[2:])
+        report.close()
+
+    sheet = load_workbook(tmp_path / "report.xlsx").active
+    values = list(sheet.values)
+    assert list(values[0]) == COLUMNS
+    assert [row[5] for row in values[1:]] == [0, 1, 2]
+
+    with open(tmp_path / "report.csv", encoding="utf-8-sig", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert [row["documentId"] for row in rows] == ["d0", "d1", "d2"]
+    assert rows[0]["counterparty"] == "ООО Ромашка"
+
+
+def test_aggregates_go_to_sheets_or_sibling_files(tmp_path):
+    aggregates = Aggregates()
+    aggregates.add_documents(_rows())
+    for name in ("report.xlsx", "report.csv"):
+        report = open_report(str(tmp_path / name))
+        report.write(_rows())
+        for sheet, frame in aggregates.sheets().items():
+            report.add_sheet(sheet, frame)
+        report.close()
+
+    workbook = load_workbook(tmp_path / "report.xlsx")
+    assert workbook.sheetnames == ["report", "by_counterparty", "by_day", "by_type"]
+    assert list(workbook["by_day"].values) == [("day", "documents", "sum", "loyaltyDiscountSum"),
+                                               ("2025-01-02", 3, 300.0, 3)]
+
+    assert sheet_path(str(tmp_path / "report.csv"), "by_type") == tmp_path / "report.by_type.csv"
+    with open(tmp_path / "report.by_type.csv", encoding="utf-8-sig", newline="") as fh:
+        assert list(csv.DictReader(fh)) == [
+            {"documentType": "demand", "documents": "3", "sum": "300.0", "loyaltyDiscountSum": "3"},
+        ]
+
+
+def test_parquet_writer(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    report = open_report(str(tmp_path / "report.parquet"))
+    report.write(_rows())
+    report.close()
+    assert pq.read_table(tmp_path / "report.parquet").column("loyaltyDiscountSum").to_pylist() == [0, 1, 2]
+
+
+# ------------------------------------------------------------------
+# incremental mode
+# ------------------------------------------------------------------
+
+def _sync(client, store, day_from, day_to, now=datetime(2025, 2, 1, 10, 0)):
+    return sync_store(client, client.settings, store, ["demand"],
+                      datetime(2025, 1, day_from), datetime(2025, 1, day_to, 23, 59, 59), workers=2,
+                      now=lambda: now)
+
+
+def _stored(store, day_from, day_to):
+    pages = store.iter_rows(["demand"], f"2025-01-{day_from:02d} 00:00:00", f"2025-01-{day_to:02d} 23:59:59")
+    return [row for page in pages for row in page]
+
+
+def test_rerun_fetches_only_changed_documents(tmp_path):
+    client = FakeClient(make_settings(), count=6)
+    store = ReportStore(str(tmp_path / "report.db"))
+
+    assert _sync(client, store, 1, 6) == {"demand": 6}
+    assert len(client.position_fetches) == 3          # members only
+    assert len(_stored(store, 1, 6)) == 6
+
+    # nothing changed: one listing from the previous start, minus the margin
+    client.listings.clear()
+    assert _sync(client, store, 1, 6) == {"demand": 0}
+    assert client.listings == [("demand", "updated>=2025-02-01 09:55:00")]
+
+    # a later edit is picked up
+    client.docs("demand")[0].update(updated="2025-02-03 12:00:00.000", sum=99)
+    assert _sync(client, store, 1, 6, now=datetime(2025, 2, 4)) == {"demand": 1}
+    assert _stored(store, 1, 1)[0]["sum"] == 99
+    assert store.coverage("demand").last_updated == "2025-02-03 23:55:00"
+
+
+class EditedDuringScan(FakeClient):
+    """Two edits while the first sync reads pages: one already read, one ahead."""
+
+    def iter_documents(self, doc_type, filter="", expand=None):
+        for n, page in enumerate(super().iter_documents(doc_type, filter, expand)):
+            yield page
+            if n == 0 and not self.listings[1:]:
+                docs = self.docs(doc_type)
+                docs[0].update(updated="2025-02-01 10:01:00.000", sum=7)   # page already read
+                docs[5].update(updated="2025-02-01 10:02:00.000")          # page still to come
+
+
+def test_edit_during_the_scan_is_not_lost(tmp_path):
+    client = EditedDuringScan(make_settings(), count=6)
+    store = ReportStore(str(tmp_path / "report.db"))
+    _sync(client, store, 1, 6, now=datetime(2025, 2, 1, 10, 0))
+    assert _stored(store, 1, 1)[0]["sum"] == 30000     # stale: read before the edit
+
+    _sync(client, store, 1, 6, now=datetime(2025, 2, 1, 10, 5))
+
+    assert _stored(store, 1, 1)[0]["sum"] == 7
+
+
+def test_store_keeps_splits_for_aggregates(tmp_path):
+    client = FakeClient(make_settings(), count=4)
+    store = ReportStore(str(tmp_path / "report.db"))
+    _sync(client, store, 1, 4)
+    _sync(client, store, 1, 4)   # re-upserting replaces, never duplicates
+
+    splits = [row for chunk in store.iter_splits(["demand"], "2025-01-01 00:00:00", "2025-01-01 23:59:59")
+              for row in chunk]
+    assert sorted((row["promo"], row["lineSum"], row["discountSum"]) for row in splits) == [
+        (False, 10000, 1000), (True, 20000, 0),
+    ]
+    assert {row["counterparty"] for row in splits} == {"ООО c1"}
+    assert splits[0]["moment"].startswith("2025-01-01")
+
+
+def test_extending_the_period_loads_only_the_new_part(tmp_path):
+    client = FakeClient(make_settings(), count=6)
+    store = ReportStore(str(tmp_path / "report.db"))
+    _sync(client, store, 1, 3)
+    client.listings.clear()
+
+    _sync(client, store, 1, 6)
+
+    assert client.listings == [
+        ("demand", "updated>=2025-02-01 09:55:00"),
+        ("demand", "moment>=2025-01-03 23:59:59;moment<=2025-01-06 23:59:59"),
+    ]
+    assert [row["documentId"] for row in _stored(store, 1, 6)] == [f"demand-{n}" for n in range(6)]
+    assert store.coverage("demand").moment_from == "2025-01-01 00:00:00"
@@ -0,0 +1,133 @@
+"""Tests for the fake MoySklad server and the benchmark helpers on top of it.
+
+The clients talk to the fake over HTTP on 127.0.0.1 — no external calls.
+"""
+
+import pytest
+import requests
+
+from ms_loyalty.app.moysklad import MoySkladClient, moment_filter
+from ms_loyalty.app.processor import process_document
+from ms_loyalty.scripts.bench_suite import compare, percentile
+from ms_loyalty.scripts.fake_moysklad import PROMO_FOLDER, FakeConfig, FakeMoySklad
+
+from helpers import make_settings
+
+
+@pytest.fixture
+def fake():
+    config = FakeConfig(documents=6, positions=(120, 220), products=60, counterparties=4, member_share=1.0)
+    with FakeMoySklad(config) as server:
+        yield server
+
+
+def _is_promo(fake, pos) -> bool:
+    product = fake.variants[pos["item"]]["product"] if pos["kind"] == "variant" else pos["item"]
+    folder = fake.products[product]["folder"]
+    while folder is not None:
+        if fake.folders[folder]["name"] == PROMO_FOLDER:
+            return True
+        folder = fake.folders[folder]["parent"]
+    return False
+
+
+def test_process_document_writes_discounts(fake):
+    s = make_settings(base_url=fake.base_url)
+    client = MoySkladClient(s)
+    doc_id = fake.document_ids("customerorder")[0]
+    doc = fake.documents["customerorder"][doc_id]
+    percent = fake.counterparties[doc.agent]["percent"]
+
+    result = process_document(client, s, "customerorder", doc_id)
+
+    assert result.reason == "updated"
+    # every position, promo ones found through variant -> product -> folder
+    assert [pos["discount"] for pos in doc.positions] == [
+        0 if _is_promo(fake, pos) else percent for pos in doc.positions
+    ]
+    assert any(pos["kind"] == "variant" for pos in doc.positions)
+    calls = fake.stats()["by_route"]
+    assert calls["GET /entity/{type}/{id}/positions"] >= 1   # beyond the inline first page
+    assert calls["GET /entity/variant"] >= 1
+
+    # the UPDATE webhook our write triggers is an echo
+    assert process_document(client, s, "customerorder", doc_id).reason == "echo"
+
+
+def test_rate_limit_answers_429_with_retry_after():
+    with FakeMoySklad(FakeConfig(documents=2, positions=(1, 1), rate_limit=2, burst=1)) as fake:
+        url = f"{fake.base_url}/entity/customerorder"
+        assert requests.get(url).status_code == 200
+        throttled = requests.get(url)
+        assert throttled.status_code == 429
+        assert 0 < int(throttled.headers["X-Lognex-Retry-After"]) <= 500
+
+        client = MoySkladClient(make_settings(base_url=fake.base_url))
+        assert client.get_document("customerorder", "customerorder-00001")["id"] == "customerorder-00001"
+        assert client.retries >= 1
+        assert fake.stats()["throttled"] >= 2
+
+
+def test_listing_filters_and_pages(fake):
+    client = MoySkladClient(make_settings(base_url=fake.base_url))
+    docs = fake.documents["demand"]
+    moments = sorted(doc.moment for doc in docs.values())
+    lower = moments[2][:19]
+
+    pages = list(client.iter_documents("demand", f"moment>={lower}", expand="agent"))
+
+    rows = [row for page in pages for row in page]
+    assert [row["moment"] for row in rows] == moments[2:]
+    assert rows[0]["agent"]["name"].startswith("ООО")
+    assert moment_filter(None, None) == ""
+
+
+def test_bulk_update_reports_unknown_documents(fake):
+    client = MoySkladClient(make_settings(base_url=fake.base_url))
+    doc_id = fake.document_ids("demand")[1]
+    first = fake.documents["demand"][doc_id].positions[0]
+
+    outcome = client.bulk_update_documents("demand", {
+        doc_id: {"positions": [{"id": first["id"], "discount": 3}]},
+        "missing": {"positions": []},
+    }, attempts=1)
+
+    assert set(outcome.updated) == {doc_id}
+    assert "не найден" in outcome.failed["missing"]
+    # a full positions list: the ones left out are gone, as in MoySklad
+    assert [pos["discount"] for pos in fake.documents["demand"][doc_id].positions] == [3]
+
+
+def test_reseed_drops_writes(fake):
+    doc = fake.documents["demand"][fake.document_ids("demand")[0]]
+    before = [dict(pos) for pos in doc.positions]
+    MoySkladClient(make_settings(base_url=fake.base_url)).update_document(
+        "demand", doc.id, {"positions": [{"id": before[0]["id"], "discount": 50}]},
+    )
+    fake.reseed()
+    assert fake.documents["demand"][doc.id].positions == before
+
+
+# ------------------------------------------------------------------
+# benchmark results
+# ------------------------------------------------------------------
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
+
+
+def test_compare_with_baseline():
+    before = {"scenarios": {"webhook": {"documents_per_second": 10.0, "p99_ms": 200.0,
+                                        "api_calls_per_document": 3.0}}}
+    now = {"scenarios": {"webhook": {"documents_per_second": 12.0, "p99_ms": 150.0,
+                                     "api_calls_per_document": 3.0},
+                         "export": {"documents_per_second": 50.0}}}
+
+    lines = compare(before, now)
+
+    assert len(lines) == 3
+    assert "+20.0%" in lines[0] and "-25.0%" in lines[1] and "+0.0%" in lines[2]
@@ -0,0 +1,107 @@
+"""Unit-tests for the promo product-folder index.
+
+All tests run offline — no API calls.
+"""
+import asyncio
+from decimal import Decimal
+
+from ms_loyalty.app import folders as folders_module
+from ms_loyalty.app.folders import PromoFolderIndex, inherited_rates, promo_folder_keys
+
+BASE = "https://x/productfolder"
+
+
+def _folder(folder_id, name, parent=None, path_name=""):
+    folder = {"meta": {"href": f"{BASE}/{folder_id}"}, "name": name, "pathName": path_name}
+    if parent:
+        folder["productFolder"] = {"meta": {"href": f"{BASE}/{parent}"}}
+    return folder
+
+
+TREE = [
+    _folder("root", "Основная"),
+    _folder("promo", "Акция", "root", "Основная"),
+    _folder("winter", "Зимняя", "promo", "Основная/Акция"),
+    _folder("deep", "Лыжи", "winter", "Основная/Акция/Зимняя"),
+    _folder("other", "Электроника", "root", "Основная"),
+    _folder("fake", "Неакция", "root", "Основная"),
+]
+
+
+def test_promo_folder_and_descendants():
+    keys = promo_folder_keys(TREE, "Акция")
+    assert keys == {f"{BASE}/promo", f"{BASE}/winter", f"{BASE}/deep"}
+
+
+def test_orphan_folder_falls_back_to_path_name():
+    orphan = _folder("orphan", "Лето", "missing", "Основная/Акция")
+    assert f"{BASE}/orphan" in promo_folder_keys([orphan], "Акция")
+    assert promo_folder_keys([orphan], "Распродажа") == frozenset()
+
+
+def test_rates_inherited_from_nearest_configured_folder():
+    rates = inherited_rates(TREE, {"root": Decimal("5"), "winter": Decimal("0")})
+    assert rates[f"{BASE}/other"] == Decimal("5")
+    assert rates[f"{BASE}/promo"] == Decimal("5")
+    assert rates[f"{BASE}/deep"] == Decimal("0")
+    assert inherited_rates(TREE, {}) == {}
+
+
+def test_index_lookup_ignores_query_string():
+    index = PromoFolderIndex("Акция", refresh_seconds=60)
+    assert index.ready is False
+    index.load(TREE)
+    assert index.ready is True
+    assert index.is_promo(f"{BASE}/winter?expand=x") is True
+    assert index.is_promo(f"{BASE}/other") is False
+
+
+def test_index_goes_stale(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(folders_module.time, "monotonic", lambda: now[0])
+    index = PromoFolderIndex("Акция", refresh_seconds=60)
+    index.load(TREE)
+    assert index.stale is False
+    now[0] += 61
+    assert index.stale is True
+
+    index.load(TREE)
+    index.invalidate()
+    assert index.stale is True
+    assert index.ready is True   # a stale index is still used until reloaded
+
+
+def test_disabled_index():
+    index = PromoFolderIndex("Акция", refresh_seconds=0)
+    assert index.stale is False
+    index.load(TREE)
+    assert index.ready is False
+
+
+class SlowFolderApi:
+    """``/entity/productfolder`` for the async client, answering after a pause."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def request(self, method, path, params=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"meta": {"size": len(TREE)}, "rows": TREE}
+
+
+def test_concurrent_async_refreshes_load_once():
+    index = PromoFolderIndex("Акция", refresh_seconds=60)
+    api = SlowFolderApi()
+
+    async def main():
+        await asyncio.gather(*(index.refresh_async(api) for _ in range(10)))
+
+    asyncio.run(main())
+    assert api.calls == 1
+    assert index.ready and index.refreshes == 1
+
+    # stale but loaded: one task reloads, the others keep the old tree
+    index.invalidate()
+    asyncio.run(main())
+    assert api.calls == 2
@@ -0,0 +1,125 @@
+"""Unit-tests for the SQLite webhook event journal."""
+import sqlite3
+import threading
+
+import pytest
+
+from ms_loyalty.app.journal import EventJournal, idempotency_key
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = EventJournal(str(tmp_path / "journal.db"))
+    j.start()
+    yield j
+    j.close()
+
+
+AUDIT = {"meta": {"href": "https://x/audit/a1"}, "uid": "admin@x", "moment": "2025-01-01 10:00:00"}
+
+
+def test_append_and_replay_unfinished(journal):
+    ids = journal.append([
+        (idempotency_key(AUDIT, "customerorder", "o1", "UPDATE"), "customerorder", "o1", "UPDATE"),
+        (idempotency_key(AUDIT, "demand", "d1", "CREATE"), "demand", "d1", "CREATE"),
+    ])
+    assert all(ids)
+
+    journal.mark_done([ids[0]])
+    journal.flush()
+
+    pending = journal.unfinished()
+    assert [(e.doc_type, e.doc_id) for e in pending] == [("demand", "d1")]
+
+
+def test_duplicate_delivery_is_ignored_once_handled(journal):
+    key = idempotency_key(AUDIT, "customerorder", "o1", "UPDATE")
+    [first] = journal.append([(key, "customerorder", "o1", "UPDATE")])
+
+    # redelivered before we got to it — still handed out for processing
+    assert journal.append([(key, "customerorder", "o1", "UPDATE")]) == [first]
+
+    journal.mark_done([first])
+    journal.flush()
+    assert journal.append([(key, "customerorder", "o1", "UPDATE")]) == [None]
+    assert journal.counts() == {"done": 1}
+
+
+def test_events_without_audit_context_never_dedupe():
+    assert idempotency_key(None, "demand", "d1", "UPDATE") != idempotency_key(None, "demand", "d1", "UPDATE")
+    assert idempotency_key(AUDIT, "demand", "d1", "UPDATE") == idempotency_key(dict(AUDIT), "demand", "d1", "UPDATE")
+
+
+def test_failed_events_can_be_requeued(journal):
+    ids = journal.append([
+        (f"k{n}", "customerorder", f"o{n}", "UPDATE") for n in range(3)
+    ])
+    journal.mark_failed(ids, "HTTP 500")
+    journal.flush()
+
+    failed = journal.failed()
+    assert len(failed) == 3
+    assert failed[0].error == "HTTP 500"
+    assert failed[0].attempts == 1
+
+    assert journal.requeue([ids[1]]) == 1
+    assert [e.id for e in journal.unfinished()] == [ids[1]]
+    assert journal.requeue() == 2
+    assert len(journal.unfinished()) == 3
+
+
+def test_concurrent_appends_are_group_committed(journal):
+    def producer(n):
+        for i in range(50):
+            journal.append([(f"{n}-{i}", "customerorder", f"o{n}-{i}", "UPDATE")])
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert journal.appended == 400
+    assert len(journal.unfinished()) == 400
+    assert journal.commits <= 400
+
+
+class LockedOnce:
+    """A connection whose first ``BEGIN IMMEDIATE`` fails, as after the busy timeout."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.failures = 1
+
+    def execute(self, sql, *args):
+        if sql == "BEGIN IMMEDIATE" and self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_failed_begin_raises_in_append_and_keeps_the_writer(tmp_path):
+    j = EventJournal(str(tmp_path / "journal.db"))
+    connect = j._connect
+    j._connect = lambda: LockedOnce(connect())
+    j.start()
+    outcome = []
+
+    def append():
+        try:
+            outcome.append(j.append([("k1", "customerorder", "o1", "UPDATE")]))
+        except sqlite3.OperationalError as exc:
+            outcome.append(exc)
+
+    worker = threading.Thread(target=append, daemon=True)
+    worker.start()
+    worker.join(5)
+
+    assert not worker.is_alive(), "append() blocked"
+    assert isinstance(outcome[0], sqlite3.OperationalError)
+    # the writer survived: the redelivery goes through
+    assert j.append([("k1", "customerorder", "o1", "UPDATE")]) == [1]
+    j.close()
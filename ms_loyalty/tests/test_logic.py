@@ -4,14 +4,20 @@ All tests run offline — no API calls.
 """
 from decimal import Decimal
 
+import pytest
+
 from ms_loyalty.app.config import Settings
+from ms_loyalty.app.folders import PromoFolderIndex
 from ms_loyalty.app.logic import (
     apply_discounts,
+    compile_rules,
     get_loyalty_discount_percent,
     is_promo_product,
     is_wholesaler,
 )
 
+from reference import make_document, reference_apply_discounts
+
 
 # ------------------------------------------------------------------
 # helper to build a Settings instance with overrides
@@ -179,6 +185,18 @@ def test_promo_partial_name_no_match():
     assert is_promo_product({"pathName": "Неакция"}, s) is False
 
 
+def test_promo_by_folder_index_wins_over_path_name():
+    s = _settings()
+    index = PromoFolderIndex("Акция", refresh_seconds=60)
+    index.load([{"meta": {"href": "https://x/productfolder/f1"}, "name": "Акция"}])
+    in_promo = {"pathName": "Основная", "productFolder": {"meta": {"href": "https://x/productfolder/f1"}}}
+    elsewhere = {"pathName": "Акция", "productFolder": {"meta": {"href": "https://x/productfolder/f2"}}}
+    assert is_promo_product(in_promo, s, index) is True
+    assert is_promo_product(elsewhere, s, index) is False
+    # no folder on the assortment — fall back to pathName
+    assert is_promo_product({"pathName": "Акция"}, s, index) is True
+
+
 # ------------------------------------------------------------------
 # apply_discounts — full document
 # ------------------------------------------------------------------
@@ -301,6 +319,8 @@ def test_all_positions_returned():
     result = apply_discounts(doc, s)
     assert len(result.all_positions) == 2
     assert result.changed_count == 1
+    # only p2 (no ``meta`` on the fixture, so matched by id) goes to the bulk update
+    assert result.changed_positions == [{"discount": 10.0, "id": "p2"}]
 
 
 def test_assortment_meta_wrapped():
@@ -314,3 +334,127 @@ def test_assortment_meta_wrapped():
     pos = result.all_positions[0]
     assert "meta" in pos["assortment"]
     assert pos["assortment"]["meta"]["href"] == "https://x/p1"
+
+
+# ------------------------------------------------------------------
+# rule table — order-sum tiers, per-folder rates
+# ------------------------------------------------------------------
+
+def _in_folder(pos_id, price, quantity, folder_id, discount=0):
+    pos = _make_position(pos_id, price, quantity, discount)
+    pos["assortment"]["productFolder"] = {"meta": {"href": f"https://x/productfolder/{folder_id}"}}
+    return pos
+
+
+def test_tier_by_order_sum_before_discount():
+    s = _settings(discount_tiers=(("1000", "10"), ("500", "8")))
+    rules = compile_rules(s)
+    assert rules.document_percent(Decimal("5"), 49_999) == Decimal("5")
+    assert rules.document_percent(Decimal("5"), 50_000) == Decimal("8")
+    assert rules.document_percent(Decimal("5"), 100_000) == Decimal("10")
+    # a tier never lowers the agent's own percent
+    assert rules.document_percent(Decimal("12"), 100_000) == Decimal("12")
+
+    doc = _make_document(
+        agent=_make_agent(enabled=True, discount=5),
+        positions=[_make_position("p1", 60000, 1, discount=5)],
+    )
+    result = apply_discounts(doc, s)
+    assert result.all_positions[0]["discount"] == 8.0
+    assert result.loyalty_discount_sum == 4800
+
+
+def test_tiers_only_for_loyalty_members():
+    s = _settings(discount_tiers=(("0", "10"),))
+    doc = _make_document(
+        agent=_make_agent(enabled=False),
+        positions=[_make_position("p1", 60000, 1)],
+    )
+    result = apply_discounts(doc, s)
+    assert result.changed_count == 0
+    assert result.loyalty_discount_sum == 0
+
+
+def test_folder_rate_and_exclusion():
+    s = _settings(folder_discounts=(("f15", "15"),), excluded_folders=("f0",))
+    doc = _make_document(
+        agent=_make_agent(enabled=True, discount=5),
+        positions=[
+            _in_folder("p1", 10000, 1, "f15"),
+            _in_folder("p2", 10000, 1, "f0", discount=5),
+            _in_folder("p3", 10000, 1, "other"),
+        ],
+    )
+    result = apply_discounts(doc, s)
+    assert [p["discount"] for p in result.all_positions] == [15.0, 0.0, 5.0]
+    assert result.loyalty_discount_sum == 1500 + 500
+
+
+def test_folder_rate_inherited_through_index_but_promo_wins():
+    s = _settings(folder_discounts=(("root", "15"),))
+    index = PromoFolderIndex("Акция", refresh_seconds=60, folder_rates=compile_rules(s).folder_rates)
+    index.load([
+        {"meta": {"href": "https://x/productfolder/root"}, "name": "Основная"},
+        {"meta": {"href": "https://x/productfolder/sub"}, "name": "Инструмент",
+         "productFolder": {"meta": {"href": "https://x/productfolder/root"}}},
+        {"meta": {"href": "https://x/productfolder/promo"}, "name": "Акция",
+         "productFolder": {"meta": {"href": "https://x/productfolder/root"}}},
+    ])
+    doc = _make_document(
+        agent=_make_agent(enabled=True, discount=5),
+        positions=[_in_folder("p1", 10000, 1, "sub"), _in_folder("p2", 10000, 1, "promo")],
+    )
+    result = apply_discounts(doc, s, index)
+    assert [p["discount"] for p in result.all_positions] == [15.0, 0.0]
+
+
+def test_invalid_rule_percent_rejected():
+    with pytest.raises(ValueError):
+        compile_rules(_settings(folder_discounts=(("f1", "120"),)))
+
+
+@pytest.mark.parametrize("threshold", ["-500", "abc", "", "NaN"])
+def test_invalid_tier_threshold_rejected(threshold):
+    with pytest.raises(ValueError, match="DISCOUNT_TIERS"):
+        compile_rules(_settings(discount_tiers=((threshold, "10"),)))
+
+
+def test_folder_rules_need_the_folder_index():
+    with pytest.raises(ValueError, match="PROMO_FOLDER_REFRESH"):
+        compile_rules(_settings(excluded_folders=("f0",), promo_folder_refresh=0))
+
+
+def test_folder_rate_fails_while_the_index_is_not_loaded():
+    s = _settings(folder_discounts=(("root", "15"),))
+    rules = compile_rules(s)
+    index = PromoFolderIndex("Акция", refresh_seconds=60, folder_rates=rules.folder_rates)
+    with pytest.raises(RuntimeError):
+        rules.folder_rate("https://x/productfolder/sub", index)
+    assert rules.folder_rate("https://x/productfolder/root") == Decimal("15")
+
+
+# ------------------------------------------------------------------
+# compiled rules / position records
+# ------------------------------------------------------------------
+
+def test_rules_compiled_once_per_settings():
+    s = _settings()
+    assert compile_rules(s) is compile_rules(s)
+    assert compile_rules(s).wholesaler_tag == "оптовик"
+
+
+def test_rules_cached_by_rule_fields_not_by_object():
+    rules = compile_rules(_settings(discount_tiers=(("1000", "10"),)))
+    # equal rules from another Settings (or a reused id()) share the instance
+    assert compile_rules(_settings(discount_tiers=(("1000", "10"),), dry_run=True)) is rules
+    changed = compile_rules(_settings(discount_tiers=(("1000", "12"),)))
+    assert changed is not rules
+    assert changed.tier_rates == [Decimal("12")]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("percent", [0, 5, 7.5, "12.25", 150])
+def test_matches_reference_implementation(seed, percent):
+    s = _settings()
+    doc = make_document(300, seed=seed, percent=percent)
+    assert apply_discounts(doc, s) == reference_apply_discounts(doc, s)
@@ -0,0 +1,235 @@
+"""Tests for the webhook service endpoints, through FastAPI's TestClient.
+
+``app.main`` reads its settings and builds its clients on import, so it
+is imported once with test settings; each test swaps in its own
+settings, worker pool and journal.  The pool is never started — queue
+mode only schedules jobs — so no API calls are made.
+"""
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ms_loyalty.app.assortment import AssortmentInfo
+from ms_loyalty.app.counterparty import NO_LOYALTY
+from ms_loyalty.app.journal import EventJournal
+from ms_loyalty.app.moysklad_async import AsyncMoySkladClient
+from ms_loyalty.app.worker import WorkerPool
+
+from helpers import BASE_URL, make_settings
+
+SERVICE_ENV = {
+    "MS_BASE_URL": BASE_URL,
+    "MS_AUTH_MODE": "bearer",
+    "MS_TOKEN": "test-token",
+    "WEBHOOK_MODE": "inline",
+    "JOURNAL_PATH": "",
+    "WEBHOOK_BEARER_TOKEN": "",
+    "PROMO_GROUP_NAME": "Акция",
+    "PROMO_FOLDER_REFRESH": "300",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+@pytest.fixture(scope="module")
+def main():
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in SERVICE_ENV.items():
+            mp.setenv(name, value)
+        return importlib.import_module("ms_loyalty.app.main")
+
+
+@pytest.fixture
+def queue(main, monkeypatch, tmp_path):
+    """Queue mode with a journal; room for two documents."""
+    journal = EventJournal(str(tmp_path / "journal.db"))
+    journal.start()
+    pool = WorkerPool(lambda doc_type, doc_id: None, workers=1, max_queue=2, on_finish=main._settle)
+    monkeypatch.setattr(main, "settings", make_settings(webhook_mode="queue"))
+    monkeypatch.setattr(main, "journal", journal)
+    monkeypatch.setattr(main, "pool", pool)
+    yield pool, journal
+    journal.close()
+
+
+@pytest.fixture
+def http(main):
+    # no ``with``: the lifespan would start the pool and close the shared clients
+    return TestClient(main.app)
+
+
+def _event(entity_type, entity_id, action="UPDATE"):
+    return {"meta": {"href": f"{BASE_URL}/entity/{entity_type}/{entity_id}", "type": entity_type},
+            "action": action}
+
+
+def _payload(*events, audit=None):
+    payload = {"events": list(events)}
+    if audit is not None:
+        payload["auditContext"] = audit
+    return payload
+
+
+# ------------------------------------------------------------------
+# queue mode
+# ------------------------------------------------------------------
+
+def test_queue_mode_accepts_with_202(queue, http):
+    pool, journal = queue
+    response = http.post("/webhook", json=_payload(_event("customerorder", "o1"), _event("demand", "d1")))
+
+    assert response.status_code == 202
+    assert response.json() == {"accepted": [
+        {"doc_type": "customerorder", "doc_id": "o1", "action": "UPDATE"},
+        {"doc_type": "demand", "doc_id": "d1", "action": "UPDATE"},
+    ]}
+    assert pool.stats()["queue_depth"] == 2
+    assert [(e.doc_type, e.doc_id) for e in journal.unfinished()] == [("customerorder", "o1"), ("demand", "d1")]
+
+
+def test_full_queue_answers_503(queue, http):
+    pool, _ = queue
+    for doc_id in ("o1", "o2"):
+        assert http.post("/webhook", json=_payload(_event("customerorder", doc_id))).status_code == 202
+
+    response = http.post("/webhook", json=_payload(_event("customerorder", "o3")))
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Queue is full"}
+    assert pool.stats()["rejected"] == 1
+    # another event for a queued document still merges into its job
+    assert http.post("/webhook", json=_payload(_event("customerorder", "o1"))).status_code == 202
+
+
+def test_payload_that_does_not_fit_is_rejected_whole(queue, http):
+    pool, journal = queue
+    assert http.post("/webhook", json=_payload(_event("customerorder", "o1"))).status_code == 202
+
+    response = http.post("/webhook", json=_payload(_event("customerorder", "o2"), _event("customerorder", "o3")))
+
+    # o2 alone would fit, but the payload is turned away whole
+    assert response.status_code == 503
+    assert pool.stats()["queue_depth"] == 1
+    # the journal keeps the rejected events for the redelivery
+    assert [e.doc_id for e in journal.unfinished()] == ["o1", "o2", "o3"]
+    assert http.post("/webhook", json=_payload(_event("customerorder", "o2"))).status_code == 202
+    assert pool.stats()["queue_depth"] == 2
+
+
+def test_redelivery_is_deduplicated_by_the_journal(queue, http):
+    pool, journal = queue
+    audit = {"meta": {"href": f"{BASE_URL}/audit/a1"}, "uid": "admin@shop", "moment": "2025-01-01 10:00:00"}
+    payload = _payload(_event("customerorder", "o1"), audit=audit)
+    accepted = [{"doc_type": "customerorder", "doc_id": "o1", "action": "UPDATE"}]
+
+    assert http.post("/webhook", json=payload).json() == {"accepted": accepted}
+    # still pending (e.g. redelivered after a 503): merged into the queued job
+    assert http.post("/webhook", json=payload).json() == {"accepted": accepted}
+    assert pool.stats()["coalesced"] == 1
+    [event] = journal.unfinished()
+
+    journal.mark_done([event.id])
+    journal.flush()
+    again = http.post("/webhook", json=payload)
+
+    assert again.status_code == 202
+    assert again.json() == {"accepted": []}
+    assert journal.unfinished() == []
+
+
+def test_webhook_token_is_checked(queue, http, main, monkeypatch):
+    monkeypatch.setattr(main, "settings", make_settings(webhook_mode="queue", webhook_bearer_token="s3cret"))
+    payload = _payload(_event("customerorder", "o1"))
+    assert http.post("/webhook", json=payload).status_code == 401
+    assert http.post("/webhook", json=payload, headers={"Authorization": "Bearer s3cret"}).status_code == 202
+
+
+# ------------------------------------------------------------------
+# catalog, counterparty and folder events — caches, not documents
+# ------------------------------------------------------------------
+
+def test_product_and_variant_events_drop_cached_catalog(queue, http, main):
+    cache = main.client.assortment_cache
+    product, variant, other = (f"{BASE_URL}/entity/product/p1", f"{BASE_URL}/entity/variant/v1",
+                               f"{BASE_URL}/entity/variant/v2")
+    cache.set(product, AssortmentInfo("Основная", None))
+    cache.set(variant, AssortmentInfo("", None, parent_href=product))
+    cache.set(other, AssortmentInfo("", None, parent_href=f"{BASE_URL}/entity/product/p2"))
+
+    # CREATE: nothing can be cached yet, nothing is dropped
+    http.post("/webhook", json=_payload(_event("variant", "v2", "CREATE")))
+    assert cache.get(other) is not None
+
+    response = http.post("/webhook", json=_payload(_event("product", "p1")))
+
+    assert response.json() == {"accepted": []}
+    assert cache.get(product) is None and cache.get(variant) is None   # with its variants
+    http.post("/webhook", json=_payload(_event("variant", "v2", "DELETE")))
+    assert cache.get(other) is None
+
+
+def test_counterparty_event_drops_cached_profile(queue, http, main):
+    cache = main.client.counterparty_cache
+    cache.set("c1", NO_LOYALTY)
+    cache.set("c2", NO_LOYALTY)
+
+    http.post("/webhook", json=_payload(_event("counterparty", "c1"), _event("counterparty", "c2", "CREATE")))
+
+    assert cache.get("c1") is None
+    assert cache.get("c2") is NO_LOYALTY
+
+
+def test_productfolder_event_marks_the_folder_index_stale(queue, http, main):
+    index = main.client.promo_folders
+    index.load([])
+    assert not index.stale
+
+    response = http.post("/webhook", json=_payload(_event("productfolder", "f1")))
+
+    assert response.json() == {"accepted": []}
+    assert index.stale
+
+
+def test_unknown_document_types_are_skipped(queue, http):
+    pool, _ = queue
+    response = http.post("/webhook", json=_payload(_event("supply", "s1"), {"action": "UPDATE"}))
+    assert response.json() == {"accepted": []}
+    assert pool.stats()["queue_depth"] == 0
+
+
+# ------------------------------------------------------------------
+# start-up replay
+# ------------------------------------------------------------------
+
+def test_replay_stops_when_the_queue_is_full(queue, main, monkeypatch):
+    pool, journal = queue
+    journal.append([(f"k{n}", "customerorder", f"o{n}", "UPDATE") for n in range(3)])
+    monkeypatch.setattr(main, "replay_deferred", 0)
+    # the lifespan closes the async client on the way out; keep the shared one open
+    monkeypatch.setattr(main, "async_client", AsyncMoySkladClient(main.settings))
+
+    with TestClient(main.app) as http:
+        assert http.get("/stats").json()["journal"]["replay_deferred"] == 1
+
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["processed"] == 2
+    # the one left over is still pending, for the next start
+    assert [event.doc_id for event in journal.unfinished()] == ["o2"]
+
+
+# ------------------------------------------------------------------
+# stats
+# ------------------------------------------------------------------
+
+def test_stats_payload(queue, http):
+    http.post("/webhook", json=_payload(_event("customerorder", "o1")))
+
+    stats = http.get("/stats").json()
+
+    assert stats["webhook_mode"] == "queue"
+    assert set(stats) == {"webhook_mode", "queue", "pipeline", "echo", "rate_limit", "assortment_cache",
+                          "promo_folders", "counterparty_cache", "journal"}
+    assert stats["queue"]["queue_depth"] == 1
+    assert "retries" in stats["rate_limit"]
+    assert stats["journal"] is not None
+    assert stats["promo_folders"]["enabled"] is True
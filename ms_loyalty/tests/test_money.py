@@ -0,0 +1,69 @@
+"""Property tests: the integer money core against the Decimal implementation.
+
+All tests run offline — no API calls.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from hypothesis import given
+from hypothesis import strategies as st
+
+from ms_loyalty.app.logic import _to_decimal
+from ms_loyalty.app.money import Rate, discount_amount, percent_rate, round_half_up, units
+
+
+def _decimal_amount(price, quantity, percent) -> int:
+    """The pre-integer implementation of the discount amount."""
+    price_d = _to_decimal(price) or Decimal("0")
+    qty_d = _to_decimal(quantity) or Decimal("0")
+    amount = price_d * qty_d * Decimal(str(percent)) / Decimal("100")
+    return int(amount.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+# realistic magnitudes: the Decimal version itself is exact (28 digits) here
+prices = st.one_of(
+    st.integers(min_value=0, max_value=10**11),
+    st.integers(min_value=0, max_value=10**11).map(float),
+    st.decimals(min_value=0, max_value=10**9, places=2).map(float),
+)
+quantities = st.one_of(
+    st.integers(min_value=0, max_value=10**5),
+    st.decimals(min_value=0, max_value=10**5, places=3).map(float),
+    st.decimals(min_value=0, max_value=10**5, places=3).map(str),
+)
+percents = st.one_of(
+    st.decimals(min_value=0, max_value=100, places=2),
+    st.decimals(min_value=0, max_value=100, places=4),
+)
+
+
+@given(prices, quantities, percents)
+def test_matches_decimal_implementation(price, quantity, percent):
+    assert discount_amount(price, quantity, percent_rate(percent)) == _decimal_amount(price, quantity, percent)
+
+
+@given(st.integers(min_value=-10**12, max_value=10**12), st.integers(min_value=1, max_value=10**6))
+def test_round_half_up_matches_decimal(numerator, denominator):
+    expected = int((Decimal(numerator) / Decimal(denominator)).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    assert round_half_up(numerator, denominator) == expected
+
+
+def test_halves_round_away_from_zero():
+    assert round_half_up(5, 10) == 1
+    assert round_half_up(15, 10) == 2
+    assert round_half_up(-5, 10) == -1
+    assert round_half_up(4, 10) == 0
+
+
+def test_percent_as_basis_points():
+    assert percent_rate(Decimal("7.5")) == Rate(750, 10_000)
+    assert percent_rate(10) == Rate(1000, 10_000)
+    assert percent_rate(Decimal("12.345")) == Rate(12345, 100_000)
+    assert percent_rate(0) == Rate(0, 1)
+
+
+def test_units_of_api_values():
+    assert units(0.1) == (1, 10)          # the decimal repr, not the binary float
+    assert units("1.250") == (1250, 1000)
+    assert units(3.0) == (3, 1)
+    assert units(None) == (0, 1)
+    assert units("abc") == (0, 1)
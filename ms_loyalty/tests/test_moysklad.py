@@ -0,0 +1,194 @@
+"""Tests for the sync MoySklad client against a fake ``requests`` session.
+
+All tests run offline — no API calls.
+"""
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+from ms_loyalty.app.moysklad import (
+    MoySkladClient,
+    bulk_outcome,
+    moment_filter,
+    page_size,
+    remaining_offsets,
+)
+
+from helpers import FakeResponse, make_settings
+
+
+class FakeSession:
+    """Serves ``/positions`` pages of *count* rows, answering in random order."""
+
+    def __init__(self, count):
+        self.rows = [{"id": f"pos{n}"} for n in range(count)]
+        self.calls = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        with self.lock:
+            self.calls.append((method, urlparse(url).path, dict(params or {})))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(random.uniform(0, 0.01))
+        with self.lock:
+            self.active -= 1
+        offset, limit = params["offset"], params["limit"]
+        return FakeResponse({"meta": {"size": len(self.rows)}, "rows": self.rows[offset:offset + limit]})
+
+
+# ------------------------------------------------------------------
+# positions paging
+# ------------------------------------------------------------------
+
+def test_page_offsets():
+    assert remaining_offsets(total=1500, fetched=100, limit=100) == list(range(100, 1500, 100))
+    assert remaining_offsets(total=80, fetched=80, limit=100) == []
+    assert remaining_offsets(total=10, fetched=0, limit=100) == []
+
+
+def test_page_size_is_capped_by_api_limits():
+    assert page_size(make_settings(positions_page_size=5000), expand=None) == 1000
+    assert page_size(make_settings(positions_page_size=1000), expand="assortment") == 100
+    assert page_size(make_settings(positions_page_size=50), expand="assortment") == 50
+
+
+def test_pages_fetched_concurrently_and_kept_in_order():
+    client = MoySkladClient(make_settings(positions_concurrency=4))
+    client.session = FakeSession(1500)
+
+    rows = client.get_all_positions("demand", "d1")
+
+    assert [r["id"] for r in rows] == [f"pos{n}" for n in range(1500)]
+    assert len(client.session.calls) == 15
+    assert 1 < client.session.peak <= 4
+
+
+def test_single_page_document_makes_one_call():
+    client = MoySkladClient(make_settings())
+    client.session = FakeSession(30)
+    assert len(client.get_all_positions("demand", "d1")) == 30
+    assert len(client.session.calls) == 1
+
+
+def test_large_page_size_without_expand():
+    # the default: 1000-row pages unless expand caps them at 100
+    client = MoySkladClient(make_settings())
+    client.session = FakeSession(1500)
+    rows = client.get_all_positions("demand", "d1", expand=None)
+    assert len(rows) == 1500
+    assert [c[2]["limit"] for c in client.session.calls] == [1000, 1000]
+
+
+def test_inline_first_page_is_not_fetched_again():
+    client = MoySkladClient(make_settings())
+    client.session = FakeSession(250)
+    inline = {"meta": {"size": 250}, "rows": client.session.rows[:100]}
+
+    rows = client.get_all_positions("demand", "d1", first_page=inline)
+
+    assert [r["id"] for r in rows] == [f"pos{n}" for n in range(250)]
+    assert sorted(c[2]["offset"] for c in client.session.calls) == [100, 200]
+
+
+def test_inline_page_covers_small_document():
+    client = MoySkladClient(make_settings())
+    client.session = FakeSession(0)
+    inline = {"meta": {"size": 2}, "rows": [{"id": "a"}, {"id": "b"}]}
+    assert len(client.get_all_positions("demand", "d1", first_page=inline)) == 2
+    assert client.session.calls == []
+
+
+def test_positions_iterated_page_by_page():
+    client = MoySkladClient(make_settings(positions_concurrency=1))
+    client.session = FakeSession(750)
+    inline = {"meta": {"size": 750}, "rows": client.session.rows[:100]}
+
+    pages = client.iter_positions("demand", "d1", first_page=inline)
+
+    assert [r["id"] for r in next(pages)] == [f"pos{n}" for n in range(100)]
+    assert [r["id"] for r in next(pages)] == [f"pos{n}" for n in range(100, 200)]
+    pages.close()
+    # the pages not started yet are dropped with the iterator
+    assert len(client.session.calls) < 6
+
+
+# ------------------------------------------------------------------
+# document lists
+# ------------------------------------------------------------------
+
+def test_document_pages_are_streamed():
+    client = MoySkladClient(make_settings())
+    client.session = FakeSession(2500)
+
+    pages = client.iter_documents("customerorder", "moment>=2025-01-01 00:00:00")
+    first = next(pages)
+    assert len(first) == 1000
+    assert len(client.session.calls) == 1   # the next page only on demand
+    assert sum(len(page) for page in pages) == 1500
+    params = client.session.calls[-1][2]
+    assert params["filter"] == "moment>=2025-01-01 00:00:00"
+    assert params["order"] == "moment,asc"
+
+
+def test_moment_filter_with_open_ends():
+    start, end = datetime(2025, 1, 1), datetime(2025, 1, 31, 23, 59, 59)
+    assert moment_filter(start, end) == "moment>=2025-01-01 00:00:00;moment<=2025-01-31 23:59:59"
+    assert moment_filter(None, end) == "moment<=2025-01-31 23:59:59"
+    assert moment_filter(None, None) == ""
+
+
+# ------------------------------------------------------------------
+# mass update
+# ------------------------------------------------------------------
+
+class BulkSession:
+    """Accepts array POSTs; documents listed in *reject* fail once."""
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.bodies = []
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        self.bodies.append(json)
+        rows = []
+        for item in json:
+            doc_id = item["meta"]["href"].rsplit("/", 1)[1]
+            if doc_id in self.reject:
+                self.reject.discard(doc_id)
+                rows.append({"errors": [{"error": "Конфликт версий", "code": 3006}]})
+            else:
+                rows.append({"id": doc_id, "updated": "2025-01-01 00:00:01.000"})
+        return FakeResponse(rows)
+
+
+def test_bulk_outcome_matches_rows_in_order():
+    outcome = bulk_outcome(["a", "b", "c"], [{"id": "a"}, {"errors": [{"error": "bad"}]}])
+    assert outcome == {"a": {"id": "a"}, "b": "bad", "c": "no result in the response"}
+
+
+def test_bulk_update_chunks_and_retries_only_failed(monkeypatch):
+    monkeypatch.setattr("ms_loyalty.app.moysklad.BULK_BATCH", 2)
+    client = MoySkladClient(make_settings())
+    client.session = BulkSession(reject={"d3"})
+    payloads = {f"d{n}": {"positions": []} for n in range(5)}
+
+    result = client.bulk_update_documents("demand", payloads)
+
+    assert sorted(result.updated) == sorted(payloads)
+    assert result.failed == {}
+    # 3 chunks, then d3 alone
+    assert sorted(len(body) for body in client.session.bodies) == [1, 1, 2, 2]
+    assert client.session.bodies[-1][0]["meta"]["href"].endswith("/entity/demand/d3")
+
+
+def test_bulk_update_reports_persistent_failures():
+    client = MoySkladClient(make_settings())
+    client.session = BulkSession(reject={"d1"})
+    result = client.bulk_update_documents("demand", {"d0": {}, "d1": {}}, attempts=1)
+    assert list(result.updated) == ["d0"]
+    assert result.failed == {"d1": "Конфликт версий"}
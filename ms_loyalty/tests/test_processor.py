@@ -0,0 +1,716 @@
+"""Tests for the document processor against an in-memory fake client.
+
+All tests run offline — no API calls.
+"""
+import pytest
+
+from ms_loyalty.app.assortment import AssortmentInfo, invalidate, resolve_assortments
+from ms_loyalty.app.cache import TTLCache
+from ms_loyalty.app.counterparty import invalidate as invalidate_counterparty
+from ms_loyalty.app.echo import EchoGuard
+from ms_loyalty.app.folders import PromoFolderIndex
+from ms_loyalty.app.moysklad import BulkResult
+from ms_loyalty.app.processor import _enrich_assortments, process_document, process_documents, stages
+from ms_loyalty.scripts.apply_discounts import Checkpoint, backfill, parse_refs
+
+from helpers import make_settings
+
+
+def _make_agent(enabled=True, discount=10):
+    return {
+        "meta": {"href": "https://x/counterparty/c1", "type": "counterparty"},
+        "tags": ["Оптовик"],
+        "attributes": [
+            {"name": "Программа лояльности", "value": enabled},
+            {"name": "Скидка по ПЛ (%)", "value": discount},
+        ],
+    }
+
+
+def _make_position(pos_id, price, quantity, discount=0, path_name="Основная"):
+    return {
+        "id": pos_id,
+        "price": price,
+        "quantity": quantity,
+        "discount": discount,
+        "assortment": {
+            "meta": {"href": f"https://x/product/{pos_id}", "type": "product"},
+            "pathName": path_name,
+        },
+    }
+
+
+class FakeClient:
+    """Just enough of ``MoySkladClient`` for ``process_document``."""
+
+    def __init__(self, settings, document, positions):
+        self.settings = settings
+        self.document = document
+        self.positions = positions
+        self.calls = []
+        self.echo_guard = EchoGuard(settings.echo_ttl_seconds)
+        self.assortment_cache = TTLCache(settings.assortment_cache_size, settings.assortment_cache_ttl)
+        self.counterparty_cache = TTLCache(settings.counterparty_cache_size, settings.counterparty_cache_ttl)
+        self.agent = _make_agent()
+        self.promo_folders = PromoFolderIndex(settings.promo_group_name, settings.promo_folder_refresh)
+        self.folders = []
+        self.fail_positions_update = False
+        self.updated_seq = 0
+        self.page_size = 1000
+
+    def get_document(self, doc_type, doc_id, expand=None):
+        self.calls.append(("get_document", doc_type, doc_id))
+        return dict(self.document)
+
+    def get_all_positions(self, doc_type, doc_id, expand="assortment", first_page=None):
+        self.calls.append(("get_all_positions", doc_type, doc_id, expand))
+        return [dict(p) for p in self.positions]
+
+    def iter_positions(self, doc_type, doc_id, expand="assortment", first_page=None):
+        self.calls.append(("iter_positions", doc_type, doc_id, expand))
+        for offset in range(0, max(len(self.positions), 1), self.page_size):
+            self.calls.append(("positions_page", offset))
+            yield [dict(p) for p in self.positions[offset:offset + self.page_size]]
+
+    def get_by_href(self, href, expand=None):
+        self.calls.append(("get_by_href", href))
+        if "/counterparty/" in href:
+            return dict(self.agent)
+        return {"meta": {"href": href, "type": "product"}, "pathName": "Основная"}
+
+    def request(self, method, path, params=None, json=None):
+        """List endpoints with ``id=`` filter chains, as used for enrichment."""
+        if path == "/entity/productfolder":
+            self.calls.append(("list_folders", dict(params)))
+            return {"meta": {"size": len(self.folders)}, "rows": self.folders}
+        self.calls.append(("request", method, path, dict(params or {})))
+        ids = [item.split("=", 1)[1] for item in params["filter"].split(";")]
+        kind = path.rsplit("/", 1)[1]
+        rows = []
+        for item_id in ids:
+            row = {"id": item_id, "meta": {"href": f"https://x/{kind}/{item_id}", "type": kind}}
+            if kind == "variant":
+                parent = {"meta": {"href": f"https://x/product/parent-{item_id}", "type": "product"}}
+                if params.get("expand") == "product":
+                    parent["pathName"] = "Акция" if item_id.endswith("0") else "Основная"
+                row["product"] = parent
+            else:
+                row["pathName"] = "Акция" if item_id.endswith("0") else "Основная"
+            rows.append(row)
+        return {"rows": rows}
+
+    def update_document(self, doc_type, doc_id, payload):
+        self.calls.append(("update_document", doc_type, doc_id))
+        # MoySklad applies the write and bumps ``updated``
+        by_id = {p["id"]: p for p in payload["positions"]}
+        self.positions = [dict(p, discount=by_id[p["id"]]["discount"]) for p in self.positions]
+        self.updated_seq += 1
+        self.document = dict(self.document, updated=f"2025-01-01 00:00:0{self.updated_seq}.000")
+        return dict(self.document)
+
+    def update_positions(self, doc_type, doc_id, changes):
+        self.calls.append(("update_positions", doc_type, doc_id, changes))
+        if self.fail_positions_update:
+            raise RuntimeError("MS error 412")
+        by_id = {c["meta"]["href"].rsplit("/", 1)[1]: c["discount"] for c in changes}
+        self.positions = [dict(p, discount=by_id.get(p["id"], p["discount"])) for p in self.positions]
+        self.updated_seq += 1
+        self.document = dict(self.document, updated=f"2025-01-01 00:00:0{self.updated_seq}.000")
+
+    def count(self, name):
+        return sum(1 for call in self.calls if call[0] == name)
+
+
+def _document(**extra):
+    doc = {"id": "o1", "updated": "2025-01-01 00:00:00.000", "agent": _make_agent()}
+    doc.update(extra)
+    return doc
+
+
+# ------------------------------------------------------------------
+# echo suppression
+# ------------------------------------------------------------------
+
+def test_update_then_echo_is_dropped_before_position_fetch():
+    s = make_settings()
+    client = FakeClient(s, _document(), [_make_position("p1", 10000, 2)])
+
+    first = process_document(client, s, "customerorder", "o1")
+    assert first.updated is True
+    assert client.count("get_all_positions") == 1
+
+    # the UPDATE webhook our own PUT triggers
+    echo = process_document(client, s, "customerorder", "o1")
+    assert echo.reason == "echo"
+    assert echo.loyalty_discount_sum == first.loyalty_discount_sum
+    assert client.count("get_all_positions") == 1
+    assert client.echo_guard.stats()["suppressed"] == 1
+
+
+def test_echo_matched_by_positions_when_updated_moved():
+    s = make_settings()
+    client = FakeClient(s, _document(), [_make_position("p1", 10000, 2)])
+    process_document(client, s, "customerorder", "o1")
+
+    # someone touched a non-position field right after our write
+    client.document = dict(client.document, updated="2025-01-01 00:00:09.000")
+    result = process_document(client, s, "customerorder", "o1")
+    assert result.reason == "echo"
+    assert client.count("update_document") == 1
+
+
+def test_real_change_after_write_is_processed():
+    s = make_settings()
+    client = FakeClient(s, _document(), [_make_position("p1", 10000, 2)])
+    process_document(client, s, "customerorder", "o1")
+
+    # manager overrides the discount by hand
+    client.positions = [dict(client.positions[0], discount=25)]
+    client.document = dict(client.document, updated="2025-01-01 00:00:09.000")
+    result = process_document(client, s, "customerorder", "o1")
+    assert result.reason == "updated"
+    assert client.count("update_document") == 2
+
+
+def test_echo_guard_disabled_with_zero_ttl():
+    s = make_settings(echo_ttl_seconds=0)
+    client = FakeClient(s, _document(), [_make_position("p1", 10000, 2)])
+    process_document(client, s, "customerorder", "o1")
+    result = process_document(client, s, "customerorder", "o1")
+    assert result.reason == "no_changes"
+
+
+# ------------------------------------------------------------------
+# batched assortment enrichment
+# ------------------------------------------------------------------
+
+def _bare_position(n, kind):
+    return {
+        "id": f"pos{n}",
+        "price": 1000,
+        "quantity": 1,
+        "discount": 0,
+        "assortment": {"meta": {"href": f"https://x/{kind}/{kind[0]}{n}", "type": kind}},
+    }
+
+
+@pytest.mark.parametrize("count, expected_calls", [(1, 1), (100, 1), (1000, 10)])
+def test_enrichment_call_count(count, expected_calls):
+    s = make_settings()
+    client = FakeClient(s, _document(), [])
+    positions = [_bare_position(n, "product") for n in range(count)]
+
+    _enrich_assortments(client, positions)
+
+    assert client.count("request") == expected_calls
+    assert client.count("get_by_href") == 0
+    assert all(p["assortment"]["pathName"] for p in positions)
+
+
+def test_enrichment_mixed_types_and_repeated_items():
+    s = make_settings()
+    client = FakeClient(s, _document(), [])
+    positions = (
+        [_bare_position(n, "product") for n in range(150)]
+        + [_bare_position(n, "variant") for n in range(100)]
+        + [_bare_position(n, "service") for n in range(5)]
+        + [_bare_position(n, "product") for n in range(50)]  # same products again
+    )
+
+    _enrich_assortments(client, positions)
+
+    paths = sorted(call[2] for call in client.calls if call[0] == "request")
+    assert paths == ["/entity/assortment", "/entity/product", "/entity/product", "/entity/variant"]
+    variant = next(p for p in positions if p["assortment"]["meta"]["type"] == "variant")
+    assert variant["assortment"]["pathName"] == "Акция"  # from expanded parent
+
+
+def test_variant_parent_fetched_in_batch_when_not_expanded():
+    s = make_settings()
+    client = FakeClient(s, _document(), [])
+    original = client.request
+
+    def no_expand(method, path, params=None, json=None):
+        params = {k: v for k, v in params.items() if k != "expand"}
+        return original(method, path, params=params)
+
+    client.request = no_expand
+    missing = {f"https://x/variant/v{n}": {"type": "variant"} for n in range(3)}
+
+    resolved = resolve_assortments(client, missing)
+
+    assert client.count("request") == 2  # variants, then their parents in one call
+    assert all(full["pathName"] for full in resolved.values())
+
+
+# ------------------------------------------------------------------
+# process-wide assortment cache
+# ------------------------------------------------------------------
+
+def test_second_document_served_from_cache():
+    s = make_settings()
+    client = FakeClient(s, _document(), [])
+    _enrich_assortments(client, [_bare_position(n, "product") for n in range(20)])
+    assert client.count("request") == 1
+
+    # another order with the same items plus one new product
+    positions = [_bare_position(n, "product") for n in range(21)]
+    _enrich_assortments(client, positions)
+
+    assert client.count("request") == 2
+    assert client.calls[-1][3]["filter"] == "id=p20"
+    assert positions[0]["assortment"]["pathName"] == "Акция"
+    assert client.assortment_cache.stats()["hits"] == 20
+
+
+def test_product_invalidation_drops_its_variants():
+    s = make_settings()
+    client = FakeClient(s, _document(), [])
+    _enrich_assortments(client, [_bare_position(n, "variant") for n in range(3)]
+                        + [_bare_position(7, "product")])
+    assert len(client.assortment_cache) == 4
+
+    assert invalidate(client.assortment_cache, "https://x/product/parent-v1") == 1
+    assert invalidate(client.assortment_cache, "https://x/product/p7?expand=x") == 1
+    assert len(client.assortment_cache) == 2
+
+
+# ------------------------------------------------------------------
+# promo-folder index
+# ------------------------------------------------------------------
+
+def _folder(folder_id, name, parent=None):
+    folder = {"meta": {"href": f"https://x/productfolder/{folder_id}"}, "name": name}
+    if parent:
+        folder["productFolder"] = {"meta": {"href": f"https://x/productfolder/{parent}"}}
+    return folder
+
+
+def _in_folder(pos_id, folder_id):
+    return {
+        "id": pos_id,
+        "price": 10000,
+        "quantity": 1,
+        "discount": 0,
+        "assortment": {
+            "meta": {"href": f"https://x/product/{pos_id}", "type": "product"},
+            "productFolder": {"meta": {"href": f"https://x/productfolder/{folder_id}"}},
+        },
+    }
+
+
+def test_promo_detected_by_folder_without_fetching_assortments():
+    s = make_settings()
+    client = FakeClient(s, _document(), [_in_folder("p1", "winter"), _in_folder("p2", "main")])
+    client.folders = [_folder("main", "Основная"), _folder("promo", "Акция", "main"),
+                      _folder("winter", "Зимняя", "promo")]
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.updated_positions == 1
+    assert result.loyalty_discount_sum == 1000   # only p2, 10% of 100.00
+    assert client.count("request") == 0
+    assert client.count("list_folders") == 1
+
+    # the tree is loaded once, not per document
+    process_document(client, s, "customerorder", "o1")
+    assert client.count("list_folders") == 1
+
+
+def test_folder_index_invalidation_reloads_tree():
+    s = make_settings(dry_run=True)
+    client = FakeClient(s, _document(), [_in_folder("p1", "sale")])
+    client.folders = [_folder("sale", "Распродажа")]
+    assert process_document(client, s, "customerorder", "o1").updated_positions == 1
+
+    # the folder was renamed to «Акция»; a productfolder webhook invalidates the index
+    client.folders = [_folder("sale", "Акция")]
+    client.promo_folders.invalidate()
+    assert process_document(client, s, "customerorder", "o1").reason == "no_changes"
+    assert client.count("list_folders") == 2
+
+
+def test_variant_uses_parent_folder():
+    s = make_settings(dry_run=True)
+    client = FakeClient(s, _document(), [])
+    client.folders = [_folder("promo", "Акция")]
+    client.promo_folders.load(client.folders)
+    client.assortment_cache.set(
+        "https://x/variant/v1",
+        AssortmentInfo(path_name="", folder_href="https://x/productfolder/promo",
+                       parent_href="https://x/product/pp"),
+    )
+    client.positions = [{
+        "id": "pos1", "price": 100, "quantity": 1, "discount": 10,
+        "assortment": {"meta": {"href": "https://x/variant/v1", "type": "variant"}},
+    }]
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.reason == "dry_run"   # promo: 10% is reset to 0
+    assert client.count("request") == 0
+
+
+# ------------------------------------------------------------------
+# counterparty profile cache
+# ------------------------------------------------------------------
+
+def _agent_ref():
+    return {"meta": {"href": "https://x/counterparty/c1", "type": "counterparty"}}
+
+
+def test_counterparty_fetched_once_across_documents():
+    s = make_settings(dry_run=True)
+    client = FakeClient(s, _document(agent=_agent_ref()), [_make_position("p1", 10000, 1)])
+
+    first = process_document(client, s, "customerorder", "o1")
+    second = process_document(client, s, "customerorder", "o1")
+
+    assert first.loyalty_discount_sum == second.loyalty_discount_sum == 1000
+    assert client.count("get_by_href") == 1
+    assert client.counterparty_cache.stats()["hits"] == 1
+
+
+def test_counterparty_webhook_invalidates_profile():
+    s = make_settings(dry_run=True)
+    client = FakeClient(s, _document(agent=_agent_ref()), [_make_position("p1", 10000, 1)])
+    assert process_document(client, s, "customerorder", "o1").loyalty_discount_sum == 1000
+
+    # the manager unticks «Программа лояльности»; MoySklad sends counterparty UPDATE
+    client.agent = _make_agent(enabled=False)
+    assert invalidate_counterparty(client.counterparty_cache, "c1") is True
+
+    result = process_document(client, s, "customerorder", "o1")
+    assert result.loyalty_discount_sum == 0
+    assert client.count("get_by_href") == 2
+
+
+def test_expanded_agent_needs_no_fetch():
+    s = make_settings(dry_run=True)
+    client = FakeClient(s, _document(), [_make_position("p1", 10000, 1)])
+    process_document(client, s, "customerorder", "o1")
+    assert client.count("get_by_href") == 0
+    assert len(client.counterparty_cache) == 1
+
+
+# ------------------------------------------------------------------
+# eligibility first
+# ------------------------------------------------------------------
+
+def _bare(pos_id, discount=0):
+    return {
+        "id": pos_id, "price": 10000, "quantity": 1, "discount": discount,
+        "assortment": {"meta": {"href": f"https://x/variant/{pos_id}", "type": "variant"}},
+    }
+
+
+def test_retail_customer_short_circuits_before_enrichment():
+    s = make_settings()
+    stages.reset()
+    client = FakeClient(s, _document(agent=_make_agent(enabled=False)), [_bare("v1"), _bare("v2")])
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.reason == "not_eligible"
+    assert client.calls[1] == ("iter_positions", "customerorder", "o1", None)
+    assert client.count("request") == 0
+    assert client.count("list_folders") == 0
+    assert stages.snapshot() == {"documents": 1, "not_eligible": 1, "not_eligible_clean": 1}
+
+
+def test_leftover_discount_is_cleared_without_enrichment():
+    s = make_settings()
+    stages.reset()
+    client = FakeClient(s, _document(agent=_make_agent(discount=0)), [_bare("v1", discount=7), _bare("v2")])
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.reason == "updated"
+    assert result.updated_positions == 1
+    assert [p["discount"] for p in client.positions] == [0.0, 0]
+    assert client.count("request") == 0
+    assert stages.snapshot()["not_eligible"] == 1
+    assert "enriched" not in stages.snapshot()
+
+
+def test_retail_customer_positions_are_streamed_page_by_page():
+    s = make_settings()
+    stages.reset()
+    client = FakeClient(s, _document(agent=_make_agent(enabled=False)),
+                        [_bare(f"v{n}") for n in range(5)])
+    client.page_size = 2
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    # every page had to be read to know there is nothing to clear
+    assert result.reason == "not_eligible"
+    assert [call[1] for call in client.calls if call[0] == "positions_page"] == [0, 2, 4]
+    assert stages.snapshot()["not_eligible_clean"] == 1
+
+
+def test_discount_found_on_a_page_goes_to_clearing():
+    s = make_settings()
+    stages.reset()
+    client = FakeClient(s, _document(agent=_make_agent(enabled=False)),
+                        [_bare("v0"), _bare("v1"), _bare("v2", discount=5), _bare("v3"), _bare("v4")])
+    client.page_size = 2
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.reason == "updated"
+    assert result.updated_positions == 1
+    # the rest is still read: the write covers every position
+    assert [p["discount"] for p in client.positions] == [0, 0, 0.0, 0, 0]
+    assert client.count("positions_page") == 3
+    assert "not_eligible_clean" not in stages.snapshot()
+
+
+# ------------------------------------------------------------------
+# changed-only position updates
+# ------------------------------------------------------------------
+
+def _row(pos_id, discount):
+    pos = _make_position(pos_id, 10000, 1, discount=discount)
+    pos["meta"] = {"href": f"https://x/customerorder/o1/positions/{pos_id}", "type": "customerorderposition"}
+    return pos
+
+
+def test_big_document_sends_only_changed_positions():
+    s = make_settings(partial_update_min_positions=3)
+    client = FakeClient(s, _document(), [_row("p1", 10), _row("p2", 0), _row("p3", 10)])
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.updated_positions == 1
+    assert client.count("update_document") == 0
+    (_, _, _, changes), = [c for c in client.calls if c[0] == "update_positions"]
+    assert changes == [{"discount": 10.0, "meta": client.positions[1]["meta"]}]
+
+    # the echo has a new ``updated`` but exactly the positions we wrote
+    assert process_document(client, s, "customerorder", "o1").reason == "echo"
+
+
+def test_agent_change_after_partial_write_is_not_an_echo():
+    s = make_settings(partial_update_min_positions=2)
+    client = FakeClient(s, _document(), [_row("p1", 0), _row("p2", 0)])
+    assert process_document(client, s, "customerorder", "o1").updated_positions == 2
+
+    # same positions, another counterparty — without loyalty
+    retail = dict(_make_agent(enabled=False), meta={"href": "https://x/counterparty/c2", "type": "counterparty"})
+    client.agent = retail
+    client.document = dict(client.document, agent=retail)
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.reason == "updated"
+    assert [p["discount"] for p in client.positions] == [0, 0]
+
+
+def test_small_document_uses_put():
+    s = make_settings(partial_update_min_positions=3)
+    client = FakeClient(s, _document(), [_row("p1", 0), _row("p2", 0)])
+    process_document(client, s, "customerorder", "o1")
+    assert client.count("update_positions") == 0
+    assert client.count("update_document") == 1
+
+
+def test_failed_bulk_update_falls_back_to_put():
+    s = make_settings(partial_update_min_positions=1)
+    client = FakeClient(s, _document(), [_row("p1", 0)])
+    client.fail_positions_update = True
+
+    result = process_document(client, s, "customerorder", "o1")
+
+    assert result.updated is True
+    assert client.count("update_positions") == 1
+    assert client.count("update_document") == 1
+    assert client.positions[0]["discount"] == 10.0
+
+
+# ------------------------------------------------------------------
+# batches
+# ------------------------------------------------------------------
+
+class FlakyClient(FakeClient):
+    def get_document(self, doc_type, doc_id, expand=None):
+        if doc_id == "bad":
+            raise RuntimeError("MS error 404")
+        return super().get_document(doc_type, doc_id, expand)
+
+
+def test_batch_dedupes_and_keeps_order():
+    s = make_settings(dry_run=True)
+    client = FakeClient(s, _document(agent={"meta": _make_agent()["meta"]}),
+                        [_make_position("p1", 10000, 1)])
+    refs = [("customerorder", "o1"), ("demand", "d1"), ("customerorder", "o1"), ("customerorder", "o2")]
+    batch = process_documents(client, s, refs, concurrency=1)
+
+    assert [(i.doc_type, i.doc_id) for i in batch.items] == [
+        ("customerorder", "o1"), ("demand", "d1"), ("customerorder", "o2"),
+    ]
+    assert client.count("get_document") == 3
+    # one counterparty lookup for the whole batch
+    assert client.count("get_by_href") == 1
+    assert batch.summary()["reasons"] == {"dry_run": 3}
+
+
+def test_batch_records_failures_and_goes_on():
+    s = make_settings()
+    client = FlakyClient(s, _document(), [_make_position("p1", 10000, 1)])
+    batch = process_documents(client, s, [("customerorder", "bad"), ("customerorder", "o1")],
+                              concurrency=4)
+
+    bad, good = batch.items
+    assert bad.result is None and "404" in bad.error
+    assert bad.as_dict()["reason"] == "error"
+    assert good.result.updated is True
+    assert batch.summary()["documents"] == 2
+
+
+class BulkClient(FakeClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reject = set()
+
+    def bulk_update_documents(self, doc_type, payloads):
+        self.calls.append(("bulk_update_documents", doc_type, sorted(payloads)))
+        result = BulkResult()
+        for doc_id in payloads:
+            if doc_id in self.reject:
+                result.failed[doc_id] = "Конфликт версий"
+            else:
+                result.updated[doc_id] = {"id": doc_id, "updated": "2025-01-01 00:00:01.000"}
+        return result
+
+
+def test_batch_bulk_write_one_request_per_type():
+    s = make_settings()
+    client = BulkClient(s, _document(), [_make_position("p1", 10000, 1)])
+    client.reject = {"o3"}
+    refs = [("customerorder", "o1"), ("customerorder", "o2"), ("demand", "d1"), ("customerorder", "o3")]
+    batch = process_documents(client, s, refs, concurrency=2, bulk_write=True)
+
+    assert client.count("update_document") == 0
+    assert client.count("bulk_update_documents") == 2
+    assert [i.result.reason if i.result else i.error for i in batch.items] == [
+        "updated", "updated", "updated", "Конфликт версий",
+    ]
+
+
+def test_batch_bulk_write_flushes_in_chunks():
+    s = make_settings()
+    client = BulkClient(s, _document(), [_make_position("p1", 10000, 1)])
+    refs = [("customerorder", f"o{n}") for n in range(5)]
+    batch = process_documents(client, s, refs, concurrency=1, bulk_write=True, flush_documents=2)
+
+    assert [c[2] for c in client.calls if c[0] == "bulk_update_documents"] == [
+        ["o0", "o1"], ["o2", "o3"], ["o4"],
+    ]
+    assert [i.doc_id for i in batch.items] == [ref[1] for ref in refs]
+    assert all(i.result.reason == "updated" for i in batch.items)
+
+
+def test_batch_bulk_write_flushes_by_age():
+    s = make_settings()
+    client = BulkClient(s, _document(), [_make_position("p1", 10000, 1)])
+    refs = [("customerorder", "o1"), ("customerorder", "o2")]
+    process_documents(client, s, refs, concurrency=1, bulk_write=True, flush_seconds=0)
+    assert client.count("bulk_update_documents") == 2
+
+
+class BrokenBulkClient(BulkClient):
+    def bulk_update_documents(self, doc_type, payloads):
+        raise RuntimeError("502 Bad Gateway")
+
+
+def test_batch_bulk_write_failure_marks_its_chunk():
+    s = make_settings()
+    client = BrokenBulkClient(s, _document(), [_make_position("p1", 10000, 1)])
+    refs = [("customerorder", "o1"), ("customerorder", "o2"), ("customerorder", "o3")]
+    batch = process_documents(client, s, refs, concurrency=2, bulk_write=True, flush_documents=2)
+    assert [i.error for i in batch.items] == ["502 Bad Gateway"] * 3
+
+
+def test_batch_bulk_write_keeps_partial_update_for_big_documents():
+    s = make_settings(partial_update_min_positions=2)
+    client = BulkClient(s, _document(), [_row("p1", 0), _row("p2", 10)])
+    batch = process_documents(client, s, [("customerorder", "o1")], bulk_write=True)
+    assert batch.items[0].result.updated is True
+    assert client.count("update_positions") == 1
+    assert client.count("update_document") == 0
+    assert client.count("bulk_update_documents") == 0
+
+
+def test_ids_file_lines():
+    lines = ["# reprocess", "o1", "demand d1", "", "customerorder,o2  # again"]
+    assert list(parse_refs(lines, "customerorder")) == [
+        ("customerorder", "o1"), ("demand", "d1"), ("customerorder", "o2"),
+    ]
+    with pytest.raises(ValueError):
+        list(parse_refs(["o1"], None))
+
+
+class ListingClient(BulkClient):
+    """Lists documents ``o0``..``o{n-1}`` in pages of two."""
+
+    def __init__(self, settings, count):
+        super().__init__(settings, _document(), [_make_position("p1", 10000, 1)])
+        self.ids = [f"o{n}" for n in range(count)]
+
+    def iter_documents(self, doc_type, filter="", expand=None):
+        self.calls.append(("iter_documents", doc_type, filter))
+        for start in range(0, len(self.ids), 2):
+            yield [{"id": doc_id} for doc_id in self.ids[start:start + 2]]
+
+
+def test_backfill_dry_run_summary(tmp_path):
+    s = make_settings(dry_run=True)
+    client = ListingClient(s, count=5)
+    out = tmp_path / "progress.txt"
+    with open(out, "w", encoding="utf-8") as fh:
+        progress = backfill(client, s, ["customerorder"], "moment>=2025-01-01 00:00:00",
+                            Checkpoint(None), concurrency=2, out=fh)
+
+    summary = progress.summary()
+    assert summary["documents"] == 5
+    assert summary["changed_documents"] == 5
+    assert summary["changed_positions"] == 5
+    assert client.count("update_document") == 0
+    assert len(out.read_text(encoding="utf-8").splitlines()) == 3   # one line per page
+
+
+def test_backfill_resumes_from_checkpoint(tmp_path):
+    s = make_settings()
+    path = tmp_path / "done.txt"
+    path.write_text("customerorder o0\ncustomerorder o1\n", encoding="utf-8")
+    client = ListingClient(s, count=4)
+
+    with open(tmp_path / "progress.txt", "w", encoding="utf-8") as fh:
+        progress = backfill(client, s, ["customerorder"], "", Checkpoint(str(path)),
+                            concurrency=2, out=fh)
+
+    assert progress.skipped == 2
+    assert progress.documents == 2
+    assert client.count("get_document") == 2
+    assert set(parse_refs(path.read_text(encoding="utf-8").splitlines(), None)) == {
+        ("customerorder", f"o{n}") for n in range(4)
+    }
+
+
+def test_dry_run_does_not_mark_documents_done(tmp_path):
+    path = tmp_path / "done.txt"
+    dry = make_settings(dry_run=True)
+    with open(tmp_path / "progress.txt", "w", encoding="utf-8") as fh:
+        backfill(ListingClient(dry, count=3), dry, ["customerorder"], "", Checkpoint(str(path)),
+                 concurrency=2, out=fh)
+    assert not path.exists()
+
+    s = make_settings()
+    client = ListingClient(s, count=3)
+    with open(tmp_path / "progress.txt", "w", encoding="utf-8") as fh:
+        progress = backfill(client, s, ["customerorder"], "", Checkpoint(str(path)),
+                            concurrency=2, out=fh)
+
+    assert progress.skipped == 0
+    assert progress.reasons["updated"] == 3
+    assert client.count("bulk_update_documents") == 2   # one per page
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
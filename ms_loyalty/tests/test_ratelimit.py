@@ -0,0 +1,112 @@
+"""Tests for the client-side MoySklad rate limiter and retry handling.
+
+All tests run offline — no API calls.
+"""
+import threading
+import time
+
+import pytest
+import requests
+
+from ms_loyalty.app import moysklad
+from ms_loyalty.app.moysklad import MoySkladClient
+from ms_loyalty.app.ratelimit import RateLimiter, retry_delay
+
+from helpers import FakeResponse, ScriptedSession, make_settings
+
+
+# ------------------------------------------------------------------
+# limiter
+# ------------------------------------------------------------------
+
+def test_burst_is_free_then_requests_are_spaced():
+    limiter = RateLimiter(rate=10, burst=3, max_parallel=5)
+    waits = [limiter.reserve() for _ in range(5)]
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == pytest.approx(0.1, abs=0.01)
+    assert waits[4] == pytest.approx(0.2, abs=0.01)
+    assert limiter.stats()["throttled"] == 2
+
+
+def test_retry_after_header_pauses_everyone():
+    limiter = RateLimiter(rate=0, burst=1, max_parallel=5)
+    limiter.note_headers({"X-Lognex-Retry-After": "1500"})
+    assert limiter.reserve() == pytest.approx(1.5, abs=0.05)
+
+
+def test_exhausted_remaining_waits_for_reset():
+    limiter = RateLimiter(rate=0, burst=1, max_parallel=5)
+    limiter.note_headers({"X-RateLimit-Remaining": "20", "X-Lognex-Reset": "2000"})
+    assert limiter.reserve() == 0
+    limiter.note_headers({"X-RateLimit-Remaining": "0", "X-Lognex-Reset": "2000"})
+    assert limiter.reserve() == pytest.approx(2.0, abs=0.05)
+
+
+def test_parallel_slots_are_capped():
+    limiter = RateLimiter(rate=0, burst=1, max_parallel=2)
+    lock = threading.Lock()
+    active = peak = 0
+
+    def work():
+        nonlocal active, peak
+        with limiter.slot():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak == 2
+
+
+def test_retry_delay_uses_retry_after_for_429():
+    delay = retry_delay(429, {"X-Lognex-Retry-After": "3000"}, attempt=0, base=0.5)
+    assert 3.0 <= delay <= 3.5
+    assert 0 <= retry_delay(503, {}, attempt=3, base=0.5) <= 4.0
+
+
+# ------------------------------------------------------------------
+# client retries
+# ------------------------------------------------------------------
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(moysklad.time, "sleep", slept.append)
+    return slept
+
+
+def test_client_retries_429_and_5xx(no_sleep):
+    client = MoySkladClient(make_settings())
+    client.session = ScriptedSession([
+        FakeResponse("", 429, {"X-Lognex-Retry-After": "1000"}),
+        FakeResponse("", 502),
+        requests.ConnectionError("reset"),
+        FakeResponse({"id": "o1"}),
+    ])
+    assert client.request("GET", "/entity/customerorder/o1") == {"id": "o1"}
+    assert client.session.calls == 4
+    assert client.retries == 3
+    assert no_sleep[0] >= 1.0
+
+
+def test_client_gives_up_after_max_retries(no_sleep):
+    client = MoySkladClient(make_settings(max_retries=2))
+    client.session = ScriptedSession([FakeResponse("err", 500)] * 3)
+    with pytest.raises(requests.HTTPError):
+        client.request("GET", "/entity/customerorder/o1")
+    assert client.session.calls == 3
+
+
+def test_client_does_not_retry_client_errors(no_sleep):
+    client = MoySkladClient(make_settings())
+    client.session = ScriptedSession([FakeResponse("nope", 404)])
+    with pytest.raises(requests.HTTPError):
+        client.request("GET", "/entity/customerorder/o1")
+    assert client.session.calls == 1
@@ -0,0 +1,120 @@
+"""Unit-tests for the background webhook worker pool."""
+import threading
+
+from ms_loyalty.app.worker import LatencyStats, WorkerPool
+
+
+def test_pool_runs_every_job():
+    seen = []
+    lock = threading.Lock()
+
+    def handler(doc_type, doc_id):
+        with lock:
+            seen.append((doc_type, doc_id))
+
+    pool = WorkerPool(handler, workers=3)
+    pool.start()
+    for n in range(20):
+        assert pool.submit("customerorder", f"id-{n}", "UPDATE")
+    pool.join()
+    pool.stop()
+
+    assert sorted(seen) == sorted(("customerorder", f"id-{n}") for n in range(20))
+    stats = pool.stats()
+    assert stats["processed"] == 20
+    assert stats["failed"] == 0
+    assert stats["run"]["count"] == 20
+
+
+def test_pool_counts_failures_and_keeps_running():
+    def handler(doc_type, doc_id):
+        if doc_id == "bad":
+            raise RuntimeError("boom")
+
+    pool = WorkerPool(handler, workers=1)
+    pool.start()
+    pool.submit("demand", "bad", "UPDATE")
+    pool.submit("demand", "good", "UPDATE")
+    pool.join()
+    pool.stop()
+
+    stats = pool.stats()
+    assert stats["failed"] == 1
+    assert stats["processed"] == 1
+
+
+def test_submit_rejects_when_queue_full():
+    pool = WorkerPool(lambda *_: None, workers=1, max_queue=1)
+    # not started — nothing drains the queue
+    assert pool.submit("demand", "a", "CREATE") is True
+    assert pool.submit("demand", "b", "CREATE") is False
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["queue_depth"] == 1
+
+
+def test_submit_all_queues_a_delivery_all_or_none():
+    pool = WorkerPool(lambda *_: None, workers=1, max_queue=3)
+    assert pool.submit("demand", "a", "CREATE") is True
+
+    # a merges into its queued job, b and c need two new slots: fits
+    assert pool.submit_all([("demand", "a", "UPDATE", None), ("demand", "b", "CREATE", None),
+                            ("demand", "b", "UPDATE", None), ("demand", "c", "CREATE", None)]) is True
+    assert pool.stats()["queue_depth"] == 3
+
+    assert pool.submit_all([("demand", "c", "UPDATE", None), ("demand", "d", "CREATE", None)]) is False
+    # c is not merged either: nothing of a rejected delivery is queued
+    assert pool.stats()["coalesced"] == 2
+    assert pool.stats()["rejected"] == 2
+
+
+def test_latency_percentiles():
+    stats = LatencyStats()
+    for ms in range(1, 101):
+        stats.add(ms / 1000)
+    snap = stats.snapshot()
+    assert snap["count"] == 100
+    assert snap["max_ms"] == 100.0
+    assert 49 <= snap["p50_ms"] <= 51
+    assert 94 <= snap["p95_ms"] <= 96
+
+
+def test_burst_for_one_document_is_coalesced():
+    calls = []
+    pool = WorkerPool(lambda t, i: calls.append(i), workers=2, debounce=0.2)
+    pool.start()
+    for _ in range(5):
+        pool.submit("customerorder", "same", "UPDATE")
+    pool.submit("customerorder", "other", "UPDATE")
+    assert pool.join(timeout=5)
+    pool.stop()
+
+    assert sorted(calls) == ["other", "same"]
+    assert pool.stats()["coalesced"] == 4
+
+
+def test_event_during_processing_schedules_one_followup():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def handler(doc_type, doc_id):
+        calls.append(doc_id)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+
+    pool = WorkerPool(handler, workers=3)
+    pool.start()
+    pool.submit("demand", "d1", "UPDATE")
+    assert started.wait(5)
+    # three more events while the first run is in progress
+    for _ in range(3):
+        pool.submit("demand", "d1", "UPDATE")
+    release.set()
+    assert pool.join(timeout=5)
+    pool.stop()
+
+    assert calls == ["d1", "d1"]
+    stats = pool.stats()
+    assert stats["followups"] == 1
+    assert stats["coalesced"] == 2